@@ -0,0 +1,114 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure cold tests collection time
+
+Each run is a fresh `py.test --collect-only` process, so all imports are
+done from scratch. Script prints min and median time and fails if
+collection fails or median is greater than baseline more than allowed.
+Baseline is stored in `benchmarks/baselines/collection.json` and should be
+recorded on reference runner. If baseline file is missing, result is saved
+to it and nothing is compared:
+
+    python benchmarks/collection_time.py --runs 5 --save BASELINE
+    python benchmarks/collection_time.py --baseline BASELINE
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CollectionError(Exception):
+    pass
+
+
+def collect_once(paths):
+    cmd = [sys.executable, '-m', 'pytest', '--collect-only', '-q',
+           '-p', 'no:cacheprovider'] + paths
+    started_at = time.time()
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT)
+    output = proc.communicate()[0]
+    duration = time.time() - started_at
+    # Failed collection is usually fast, so it can't be measured
+    if proc.returncode != 0:
+        raise CollectionError(
+            'Collection is failed with code {0}:\n{1}'.format(
+                proc.returncode, output.decode('utf-8', 'replace')[-3000:]))
+    return duration
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='*', default=['mos_tests'])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='Compare result with baseline from FILE')
+    parser.add_argument('--save', metavar='FILE',
+                        help='Save result as baseline to FILE')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed median slowdown relative to baseline '
+                             '(0.2 means 20%%)')
+    args = parser.parse_args(argv)
+
+    if args.baseline and not os.path.exists(args.baseline):
+        print('Baseline {0} is not found, result will be saved to it'.format(
+            args.baseline))
+        args.save, args.baseline = args.baseline, None
+    try:
+        timings = [collect_once(args.paths) for _ in range(args.runs)]
+    except CollectionError as e:
+        print(e)
+        return 1
+    result = {'paths': args.paths,
+              'runs': args.runs,
+              'min': min(timings),
+              'median': median(timings)}
+    print('Collection of {paths}: min {min:.2f}s, '
+          'median {median:.2f}s ({runs} runs)'.format(**result))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        limit = baseline['median'] * (1 + args.max_regression)
+        print('Baseline median {0:.2f}s, limit {1:.2f}s'.format(
+            baseline['median'], limit))
+        if result['median'] > limit:
+            print('Collection time regression detected')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import pytest
+
+from fakes.sshd import FakeSSHServer
+from mos_tests.environment.ssh import SSHClient
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "latency: benchmark of latency bound operation, which timings are "
+        "too noisy to compare with baseline")
+
+
+def cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+
+@pytest.fixture
+def benchmark_cpu(benchmark):
+    """Benchmark function and save CPU seconds per call to extra info
+
+    CPU time includes local fake servers threads, as they work in the same
+    process.
+    """
+    def run(func, *args, **kwargs):
+        stats = {'calls': 0, 'cpu': 0}
+
+        def wrapper():
+            started_at = cpu_time()
+            result = func(*args, **kwargs)
+            stats['cpu'] += cpu_time() - started_at
+            stats['calls'] += 1
+            return result
+
+        result = benchmark(wrapper)
+        benchmark.extra_info['cpu_per_call'] = stats['cpu'] / stats['calls']
+        return result
+
+    return run
+
+
+def make_output_handler(outputs):
+    """Return fake ssh server handler, which replies outputs by command"""
+    def handler(command):
+        return 0, outputs.get(command, b''), b''
+    return handler
+
+
+@pytest.yield_fixture(scope='session')
+def ssh_server():
+    outputs = {
+        'small': b'ok\n',
+        # 10000 lines, 1 MB
+        'large': (b'x' * 99 + b'\n') * 10000,
+    }
+    with FakeSSHServer(handler=make_output_handler(outputs)) as server:
+        yield server
+
+
+@pytest.yield_fixture(scope='session')
+def remote(ssh_server):
+    with SSHClient(ssh_server.host, ssh_server.port, username='root',
+                   password='secret') as remote:
+        yield remote
@@ -0,0 +1,226 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Local paramiko based SSH server for SSHClient
+
+Server accepts any password or key of configured user and passes each exec
+request to handler, which returns exit code, stdout and stderr:
+
+    def handler(command):
+        return 0, b'node-1\\n', b''
+
+    with FakeSSHServer(handler=handler) as server:
+        with SSHClient(server.host, server.port, 'root', 'r00tme') as remote:
+            remote.execute('hostname')
+
+By default server listens on loopback and replies command itself as
+stdout. `run_shell` handler executes commands by local shell, it gives
+shell to anyone who can reach the port, so it must be passed explicitly.
+SFTP is not supported.
+"""
+
+import logging
+import socket
+import subprocess
+import threading
+import time
+
+import paramiko
+import six
+
+logger = logging.getLogger(__name__)
+
+# Host key generation is slow, so it is shared between servers
+_host_key = None
+_host_key_lock = threading.Lock()
+
+
+def get_host_key():
+    global _host_key
+    with _host_key_lock:
+        if _host_key is None:
+            _host_key = paramiko.RSAKey.generate(2048)
+    return _host_key
+
+
+def echo_command(command):
+    """Reply command as stdout"""
+    return 0, command.encode('utf-8') + b'\n', b''
+
+
+def run_shell(command):
+    """Execute command by local shell"""
+    proc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    stdout, stderr = proc.communicate()
+    return proc.returncode, stdout, stderr
+
+
+def static_output(stdout, stderr=b'', exit_code=0):
+    """Return handler, which replies same output to any command"""
+    def handler(command):
+        return exit_code, stdout, stderr
+    return handler
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self, server):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return 'password,publickey'
+
+    def check_auth_password(self, username, password):
+        if username == self.server.username:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_auth_publickey(self, username, key):
+        if username == self.server.username:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        self.server.get_commands_queue(channel).put(command)
+        return True
+
+
+class FakeSSHServer(object):
+    """SSH server on local port, which runs commands with handler
+
+    :param handler: callable with command argument, which returns tuple
+        (exit code, stdout bytes, stderr bytes)
+    :param latency: seconds to sleep before command execution
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, username='root',
+                 handler=echo_command, latency=0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.handler = handler
+        self.latency = latency
+        self.commands_count = 0
+        self._sock = None
+        self._thread = None
+        self._transports = []
+        self._commands = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen(100)
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept_loop)
+        self._thread.daemon = True
+        self._thread.start()
+        logger.debug('Fake ssh server is started on {0}:{1}'.format(
+            self.host, self.port))
+        return self
+
+    def stop(self):
+        if self._sock is None:
+            return
+        self._sock.close()
+        self._sock = None
+        with self._lock:
+            transports, self._transports = self._transports, []
+        for transport in transports:
+            transport.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *err):
+        self.stop()
+
+    def _accept_loop(self):
+        while self._sock is not None:
+            try:
+                client, _ = self._sock.accept()
+            except (socket.error, AttributeError):
+                break
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            transport = paramiko.Transport(client)
+            transport.add_server_key(get_host_key())
+            try:
+                transport.start_server(server=_ServerInterface(self))
+            except paramiko.SSHException:
+                logger.exception('SSH negotiation failed')
+                continue
+            with self._lock:
+                self._transports.append(transport)
+            thread = threading.Thread(target=self._accept_channels,
+                                      args=(transport,))
+            thread.daemon = True
+            thread.start()
+
+    def _accept_channels(self, transport):
+        while transport.is_active():
+            channel = transport.accept(timeout=1)
+            if channel is None:
+                continue
+            # Channel is closed on garbage collection, so thread keeps it
+            thread = threading.Thread(target=self._serve_channel,
+                                      args=(channel,))
+            thread.daemon = True
+            thread.start()
+
+    def get_commands_queue(self, channel):
+        with self._lock:
+            return self._commands.setdefault(channel,
+                                             six.moves.queue.Queue())
+
+    def _serve_channel(self, channel):
+        queue = self.get_commands_queue(channel)
+        try:
+            command = queue.get(timeout=60)
+        except six.moves.queue.Empty:
+            channel.close()
+            return
+        finally:
+            with self._lock:
+                self._commands.pop(channel, None)
+        self.run_command(channel, command)
+        # Wait client to close channel
+        while not channel.closed and channel.transport.is_active():
+            channel.status_event.wait(1)
+
+    def run_command(self, channel, command):
+        with self._lock:
+            self.commands_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if isinstance(command, bytes):
+            command = command.decode('utf-8')
+        try:
+            exit_code, stdout, stderr = self.handler(command.rstrip('\n'))
+            if stdout:
+                channel.sendall(stdout)
+            if stderr:
+                channel.sendall_stderr(stderr)
+        except Exception:
+            logger.exception('Handler failed on {!r}'.format(command))
+            exit_code = 255
+        channel.send_exit_status(exit_code)
+        # Exec request reply can be still not sent at this moment, so channel
+        # is closed by client
+        channel.shutdown_write()
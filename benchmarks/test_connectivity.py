@@ -0,0 +1,54 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import stat
+
+import pytest
+
+from mos_tests.functions.connectivity import ConnectivityMonitor
+
+# Replies forever, like ping, until it's interrupted
+FAKE_PING = b'''#!/bin/sh
+seq=1
+while true; do
+    echo "64 bytes from 127.0.0.1: icmp_seq=$seq ttl=64 time=0.05 ms"
+    seq=$((seq + 1))
+    sleep 0.01
+done
+'''
+
+
+@pytest.fixture
+def fake_ping(tmpdir, monkeypatch):
+    path = tmpdir.join('ping')
+    path.write(FAKE_PING, mode='wb')
+    path.chmod(stat.S_IRWXU)
+    monkeypatch.setenv('PATH', '{0}{1}{2}'.format(tmpdir, os.pathsep,
+                                                  os.environ['PATH']))
+    return str(path)
+
+
+def test_local_monitor_start_stop(benchmark, fake_ping):
+
+    def run():
+        monitor = ConnectivityMonitor('127.0.0.1', interval=0.01,
+                                      timestamps=False)
+        with monitor:
+            monitor.wait_stable(5, timeout=10)
+        return monitor
+
+    monitor = benchmark.pedantic(run, rounds=5)
+    assert not monitor._thread.is_alive()
+    assert monitor.stats()['received'] >= 5
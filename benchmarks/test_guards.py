@@ -0,0 +1,63 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import itertools
+
+import pytest
+
+pytest.importorskip('fuelclient')
+
+from mos_tests import conftest  # noqa
+
+EXPRESSION = ('(is_ha and has_2_or_more_computes) and '
+              '(not has_ironic_conductor or has_3_or_more_computes)')
+
+
+class FakeEnv(object):
+    is_ha = True
+    _ids = itertools.count()
+
+    def __init__(self):
+        self.id = next(self._ids)
+
+    def get_nodes_by_role(self, role):
+        return {'controller': [1, 2, 3], 'compute': [4, 5]}.get(role, [])
+
+
+def evaluate(expression, env):
+    code = conftest.compile_guard_expression(expression)
+    guards = conftest.get_env_guards(env)
+    return eval(code, {'__builtins__': {}},
+                conftest._LazyGuards(guards, env))
+
+
+def test_compile_guard_expression(benchmark):
+
+    def run():
+        conftest._guard_expressions.clear()
+        return conftest.compile_guard_expression(EXPRESSION)
+
+    benchmark(run)
+
+
+def test_evaluate_guards_cold(benchmark):
+    # New env each time, so all guards are computed
+    result = benchmark(lambda: evaluate(EXPRESSION, FakeEnv()))
+    assert result is True
+
+
+def test_evaluate_guards_cached(benchmark):
+    env = FakeEnv()
+    result = benchmark(evaluate, EXPRESSION, env)
+    assert result is True
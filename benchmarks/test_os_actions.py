@@ -0,0 +1,82 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import itertools
+
+import pytest
+
+from fakes.cloud import FakeCloud
+from mos_tests.environment.os_actions import OpenStackActions
+from mos_tests.functions.common import wait
+
+for name in ('cinderclient', 'glanceclient', 'heatclient', 'keystoneclient',
+             'neutronclient', 'novaclient'):
+    pytest.importorskip(name)
+
+# Objects count of loaded cloud after a few hundreds of tests
+SCALE = {
+    'servers': 1000,
+    'networks': 100,
+    'routers': 50,
+    'floatingips': 200,
+    'keypairs': 50,
+    'security_groups': 50,
+}
+
+
+@pytest.yield_fixture(scope='session')
+def cloud():
+    with FakeCloud(**SCALE) as cloud:
+        yield cloud
+
+
+@pytest.fixture(scope='session')
+def os_conn(cloud):
+    return OpenStackActions(cloud.host)
+
+
+@pytest.fixture
+def loaded_cloud(cloud):
+    cloud.reset(**SCALE)
+    return cloud
+
+
+def test_cleanup_network(benchmark, cloud, os_conn):
+    benchmark.pedantic(os_conn.cleanup_network,
+                       kwargs={'networks_to_skip': ['admin_floating_net']},
+                       setup=lambda: cloud.reset(**SCALE), rounds=3)
+    assert len(cloud.store['servers']) == 0
+    assert len(cloud.store['networks']) == 1
+
+
+def test_create_server(benchmark, loaded_cloud, os_conn):
+    names = ('server-new-{}'.format(i) for i in itertools.count())
+
+    def run():
+        return os_conn.create_server(next(names), wait_for_avaliable=False)
+
+    server = benchmark(run)
+    assert server.status == 'ACTIVE'
+
+
+def test_wait_servers_active(benchmark, loaded_cloud, os_conn):
+    servers = os_conn.nova.servers.list()[:100]
+
+    def run():
+        return wait(lambda: all(os_conn.is_server_active(x)
+                                for x in servers),
+                    timeout_seconds=60, sleep_seconds=0,
+                    waiting_for='servers to become active')
+
+    assert benchmark(run) is True
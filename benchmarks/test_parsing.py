@@ -0,0 +1,205 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import socket
+import struct
+import uuid
+
+import pytest
+
+from mos_tests.environment.ssh import CommandResult
+from mos_tests.functions.connectivity import ConnectivityMonitor
+from mos_tests.functions.conntrack import ConntrackTable
+from mos_tests.functions import iperf
+from mos_tests.functions import os_cli
+from mos_tests.functions import ovs
+from mos_tests.functions.pcap import PcapIndex
+
+
+def make_rows(rows_count):
+    return [(str(uuid.uuid4()), 'server-{}'.format(i), 'ACTIVE')
+            for i in range(rows_count)]
+
+
+def make_table(rows_count):
+    """Return CLI table output with id, name and status columns"""
+    rows = make_rows(rows_count)
+    widths = [max(len(x[i]) for x in rows + [('ID', 'Name', 'Status')])
+              for i in range(3)]
+    border = '+' + '+'.join('-' * (x + 2) for x in widths) + '+'
+
+    def line(values):
+        return '| ' + ' | '.join(
+            v.ljust(w) for v, w in zip(values, widths)) + ' |'
+
+    lines = [border, line(('ID', 'Name', 'Status')), border]
+    lines.extend(line(x) for x in rows)
+    lines.append(border)
+    return '\n'.join(lines) + '\n'
+
+
+def make_ping_output(count, lost_every=100):
+    lines = ['PING 10.0.0.2 (10.0.0.2) 56(84) bytes of data.\n']
+    for seq in range(1, count + 1):
+        if seq % lost_every == 0:
+            continue
+        lines.append('64 bytes from 10.0.0.2: icmp_seq={0} ttl=64 '
+                     'time=0.{0} ms\n'.format(seq))
+    return lines
+
+
+def make_iperf3_output(count):
+    intervals = [{'streams': [], 'sum': {'start': i, 'end': i + 1,
+                                         'bits_per_second': 3e6,
+                                         'omitted': False}}
+                 for i in range(count)]
+    text = json.dumps({'start': {}, 'intervals': intervals, 'end': {}},
+                      indent=4)
+    return [x + '\n' for x in text.splitlines()]
+
+
+def make_conntrack_output(count):
+    line = ('icmp     1 29 src=10.0.{0}.4 dst=10.0.0.5 type=8 code=0 id={1} '
+            '{2}src=10.0.0.5 dst=10.0.{0}.4 type=0 code=0 id={1} mark=0 '
+            'zone={3} use=1\n')
+    return [line.format(i % 256, i % 65536, '[UNREPLIED] ' if i % 2 else '',
+                        i % 4096)
+            for i in range(count)]
+
+
+def make_flows_output(count):
+    line = (' cookie=0x9d5bbc5e1d0ff1a4, duration=1234.567s, table={0}, '
+            'n_packets={1}, n_bytes={2}, idle_age=12, priority={3},arp,'
+            'in_port={4},arp_spa=10.0.{5}.3 actions=NORMAL\n')
+    return ['NXST_FLOW reply (xid=0x4):\n'] + [
+        line.format(i % 30, i, i * 64, i % 10, i % 100, i % 256)
+        for i in range(count)]
+
+
+def make_vxlan_pcap(count):
+    """Return `tcpdump -i any` capture of VXLAN encapsulated ICMP"""
+    def ip(src, dst, proto, payload):
+        return struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(payload), 0,
+                           0, 64, proto, 0, socket.inet_aton(src),
+                           socket.inet_aton(dst)) + payload
+
+    icmp = ip('10.0.0.3', '10.0.0.4', 1, b'\x08' + b'\0' * 63)
+    inner = b'\x02' * 12 + b'\x08\x00' + icmp
+    vxlan = struct.pack('!HHHHII', 5555, 4789, 16 + len(inner), 0,
+                        0x08000000, 100 << 8) + inner
+    frame = (struct.pack('!HHH8sH', 0, 1, 6, b'', 0x800) +
+             ip('192.168.1.4', '192.168.1.5', 17, vxlan))
+    records = [struct.pack('<IIII', i, 0, len(frame), len(frame)) + frame
+               for i in range(count)]
+    header = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 113)
+    return header + b''.join(records)
+
+
+@pytest.mark.parametrize('lines_count', [1000, 100000])
+def test_command_result_stdout_string(benchmark, lines_count):
+    result = CommandResult({'stdout': [b'x' * 99 + b'\n'] * lines_count,
+                            'stderr': [], 'exit_code': 0})
+    output = benchmark(lambda: result.stdout_string)
+    assert len(output) == lines_count * 100 - 1
+
+
+@pytest.mark.parametrize('rows_count', [100, 1000, 10000])
+def test_cli_result_listing(benchmark, rows_count):
+    result = os_cli.Result(make_table(rows_count))
+    rows = benchmark(result.listing)
+    assert len(rows) == rows_count
+
+
+@pytest.mark.parametrize('rows_count', [10000])
+def test_cli_lines_listing(benchmark, rows_count):
+    lines = make_table(rows_count).splitlines(True)
+    rows = benchmark(os_cli.listing, lines)
+    assert len(rows) == rows_count
+
+
+@pytest.mark.parametrize('rows_count', [10000])
+def test_tempest_listing(benchmark, rows_count):
+    parser = pytest.importorskip('tempest.lib.cli.output_parser')
+    output = make_table(rows_count)
+    rows = benchmark(parser.listing, output)
+    assert len(rows) == rows_count
+
+
+@pytest.mark.parametrize('rows_count', [10000])
+def test_cli_result_json(benchmark, rows_count):
+    rows = [dict(zip(('ID', 'Name', 'Status'), x))
+            for x in make_rows(rows_count)]
+    result = os_cli.Result(json.dumps(rows))
+    rows = benchmark(result.json)
+    assert len(rows) == rows_count
+
+
+def test_ping_monitor_parsing(benchmark):
+    # Busybox ping format, without -D timestamps
+    output = [x.replace('icmp_seq', 'seq') for x in make_ping_output(10000)]
+
+    def parse():
+        monitor = ConnectivityMonitor('10.0.0.2', timestamps=False)
+        for line in output:
+            monitor.add_ping_line(line)
+        return monitor.stats()
+
+    stats = benchmark(parse)
+    assert stats['sent'] - stats['received'] == 99
+
+
+@pytest.mark.parametrize('packets_count', [100000])
+def test_pcap_index(benchmark, packets_count):
+    data = make_vxlan_pcap(packets_count)
+    index = benchmark(PcapIndex.from_bytes, data)
+    assert index.count(protocol='icmp', src='10.0.0.3', vni=100) == (
+        packets_count)
+
+
+def test_pcap_query(benchmark):
+    index = PcapIndex.from_bytes(make_vxlan_pcap(100000))
+    mask = benchmark(index.match, protocol='icmp', src='10.0.0.3',
+                     dst='10.0.0.4')
+    assert mask.all()
+
+
+def test_iperf3_result(benchmark):
+    output = make_iperf3_output(3600)
+
+    def parse():
+        starts, bps = iperf.parse_iperf3_json(output)
+        return iperf.IperfResult('vm', starts, bps).stats(warmup=5)
+
+    stats = benchmark(parse)
+    assert stats['intervals'] == 3595
+
+
+@pytest.mark.parametrize('entries_count', [20000])
+def test_conntrack_table(benchmark, entries_count):
+    output = make_conntrack_output(entries_count)
+    table = benchmark(ConntrackTable.from_lines, output)
+    assert table.count(protocol='icmp', unreplied=True) == entries_count // 2
+
+
+def test_ovs_flows(benchmark):
+    output = make_flows_output(10000)
+
+    def parse():
+        flows = ovs.FlowTable()
+        flows.add_lines(output, 'br-int')
+        return flows
+
+    flows = benchmark(parse)
+    assert len(flows.by_table[(0, 0)]) == 334
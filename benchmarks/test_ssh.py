@@ -0,0 +1,42 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import pytest
+
+from mos_tests.environment.ssh import SSHClient
+
+
+# Round trip time is bimodal (threads switching and delayed ACK)
+@pytest.mark.latency
+def test_execute_small_output(benchmark_cpu, remote):
+    result = benchmark_cpu(remote.execute, 'small', verbose=False)
+    assert result.is_ok
+
+
+def test_execute_large_output(benchmark_cpu, remote):
+    result = benchmark_cpu(remote.execute, 'large', verbose=False)
+    assert len(result['stdout']) == 10000
+
+
+@pytest.mark.parametrize('count', [1, 10, 50])
+def test_execute_together(benchmark_cpu, ssh_server, count):
+    remotes = [SSHClient(ssh_server.host, ssh_server.port, username='root',
+                         password='secret') for _ in range(count)]
+    for remote in remotes:
+        remote.reconnect()
+    try:
+        benchmark_cpu(SSHClient.execute_together, remotes, 'small')
+    finally:
+        for remote in remotes:
+            remote.clear()
@@ -0,0 +1,33 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import itertools
+
+from mos_tests.functions.common import wait
+
+
+def test_wait_passed_immediately(benchmark):
+    result = benchmark(wait, lambda: True, timeout_seconds=1,
+                       waiting_for='true')
+    assert result is True
+
+
+def test_wait_100_polls(benchmark):
+
+    def run():
+        counter = itertools.count()
+        return wait(lambda: next(counter) >= 100, timeout_seconds=10,
+                    sleep_seconds=0, waiting_for='counter')
+
+    assert benchmark(run) is True
@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import ast
 from collections import namedtuple
 from distutils.spawn import find_executable
 import logging
@@ -22,11 +23,13 @@ import pytest
 from six.moves import configparser
 
 from mos_tests.environment.devops_client import DevopsClient
+from mos_tests.environment.epoch import cluster_epoch
 from mos_tests.environment.fuel_client import FuelClient
 from mos_tests.functions.common import gen_temp_file
 from mos_tests.functions.common import get_os_conn
 from mos_tests.functions.common import wait
 from mos_tests.functions import os_cli
+from mos_tests.plugins.phase_profiler import timed_phase
 from mos_tests.settings import KEYSTONE_PASS
 from mos_tests.settings import KEYSTONE_USER
 from mos_tests.settings import SERVER_ADDRESS
@@ -37,6 +40,10 @@ logger = logging.getLogger(__name__)
 
 # Define pytest plugins to use
 pytest_plugins = ("mos_tests.plugins.incremental",
+                  "mos_tests.plugins.env_lease",
+                  "mos_tests.plugins.history",
+                  "mos_tests.plugins.phase_profiler",
+                  "mos_tests.plugins.revert_scheduler",
                   "mos_tests.plugins.testrail_id")
 
 
@@ -49,6 +56,10 @@ def pytest_addoption(parser):
                      help="Fuel devops snapshot name")
     parser.addoption("--cluster", '-C', action="append",
                      help="Fuel cluster name to test on it")
+    parser.addoption("--readiness-check", action="store",
+                     choices=('probes', 'ostf'), default='probes',
+                     help="How to check cluster after snapshot revert: "
+                          "fast concurrent probes (default) or full OSTF")
 
 
 def pytest_configure(config):
@@ -79,8 +90,41 @@ def pytest_runtest_makereport(item, call):
     setattr(item, "rep_" + rep.when, rep)
 
 
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_setup(item):
+    """Refresh clients fixtures before test setup if cluster epoch is changed
+
+    Epoch is changed by nodes destroy/start after clients were initialized.
+    """
+    session = item.session
+    if not cluster_epoch.is_current(getattr(session, 'fixtures_epoch', None)):
+        reinit_fixtures(item)
+    yield
+
+
+@pytest.hookimpl(hookwrapper=True)
 def pytest_runtest_teardown(item, nextitem):
-    setattr(item.session, "nextitem", nextitem)
+    """Revert snapshot after destructive test, if there is next test
+
+    Clients fixtures, and so all fixtures which depend on them (class and
+    module fixtures shared with next test too), are finished before revert,
+    so next test sets them up again on clean cluster.
+    """
+    session = item.session
+    setattr(session, "nextitem", nextitem)
+    yield
+    revert_to = getattr(session, 'need_revert', None)
+    if not revert_to or nextitem is None:
+        return
+    try:
+        reinit_fixtures(item)
+    finally:
+        with timed_phase(item, 'revert'):
+            revert_snapshot(*revert_to)
+    session.need_revert = None
+    session.reverts_count = getattr(session, 'reverts_count', 0) + 1
+    setattr(session, 'reverted', True)
+    setattr(session, 'fixtures_epoch', cluster_epoch.value)
 
 
 @pytest.fixture
@@ -89,8 +133,8 @@ def suffix():
 
 
 @pytest.fixture(scope="session")
-def env_name(request):
-    return request.config.getoption("--env")
+def env_name(request, leased_env_name):
+    return leased_env_name or request.config.getoption("--env")
 
 
 @pytest.fixture(scope='session')
@@ -104,9 +148,12 @@ def snapshot_name(request):
 
 
 @pytest.fixture(scope="session")
-def fuel_master_ip(request, env_name, snapshot_name):
+def fuel_master_ip(request, env_name, snapshot_name, leased_env_name):
     """Get fuel master ip"""
     fuel_ip = request.config.getoption("--fuel-ip")
+    if leased_env_name is not None:
+        # Each leased env has own fuel master
+        fuel_ip = None
     if not fuel_ip:
         fuel_ip = DevopsClient.get_admin_node_ip(env_name=env_name)
     if not fuel_ip:
@@ -122,29 +169,38 @@ def revert_snapshot(env_name, snapshot_name):
 @pytest.fixture(scope="session", autouse=True)
 def setup_session(request, env_name, snapshot_name):
     """Revert Fuel devops snapshot before test session"""
-    if not all([env_name, snapshot_name]):
+    if all([env_name, snapshot_name]):
+        revert_snapshot(env_name, snapshot_name)
+    else:
         setattr(request.session, 'reverted', False)
-        return
-    revert_snapshot(env_name, snapshot_name)
+    setattr(request.session, 'fixtures_epoch', cluster_epoch.value)
 
 
-def reinit_fixtures(request):
-    """Refresh some session fixtures (after revert, for example)"""
+def reinit_fixtures(item):
+    """Finish clients fixtures (after revert, for example)
+
+    Fixtures, which depend on clients fixtures, are finished before them,
+    and all of them are set up again when next test requests them.
+    """
     logger.info('refresh clients fixtures')
+    session = item.session
     for fixture in ('fuel', 'env', 'os_conn'):
-        try:
-            fixturedef = request._get_active_fixturedef(fixture)
-        except Exception:
-            continue
-        fixturedef.cached_result = None
+        fixturedefs = session._fixturemanager.getfixturedefs(
+            fixture, item.nodeid) or ()
+        for fixturedef in fixturedefs:
+            fixturedef.finish(item._request)
+    setattr(session, 'fixtures_epoch', cluster_epoch.value)
 
 
 @pytest.yield_fixture(autouse=True)
 def cleanup(request, env_name, snapshot_name):
+    """Mark session to revert snapshot after destructive test
+
+    Revert itself is done in `pytest_runtest_teardown`.
+    """
+    session = request.session
     yield
     item = request.node
-    if hasattr(item.session, 'nextitem') and item.session.nextitem is None:
-        return
     test_results = [getattr(item, 'rep_{}'.format(name), None)
                     for name in ("setup", "call", "teardown")]
     failed = any(x for x in test_results if x is not None and x.failed)
@@ -152,15 +208,10 @@ def cleanup(request, env_name, snapshot_name):
         return
     skipped = any(x for x in test_results if x is not None and x.skipped)
     destructive = 'undestructive' not in item.keywords
-    reverted = False
     if destructive and not skipped:
         if all([env_name, snapshot_name]):
-            revert_snapshot(env_name, snapshot_name)
-            reverted = True
-    setattr(request.session, 'reverted', reverted)
-
-    # reinitialize fixtures
-    reinit_fixtures(request)
+            session.need_revert = (env_name, snapshot_name)
+    setattr(session, 'reverted', False)
 
 
 def get_fuel_client(fuel_ip):
@@ -206,7 +257,7 @@ def fuel(fuel_master_ip):
 
 
 @pytest.fixture(scope='session')
-def env(request, fuel):
+def env(request, fuel, env_name, snapshot_name):
     """Environment instance"""
     names = request.config.getoption('--cluster')
     if not names:
@@ -218,11 +269,15 @@ def env(request, fuel):
                 "Can't find fuel cluster with name in {}".format(names))
         env = envs[0]
     if getattr(request.session, 'reverted', True):
-        env.wait_for_ostf_pass()
-        wait(env.os_conn.is_nova_ready,
-             timeout_seconds=60 * 5,
-             expected_exceptions=Exception,
-             waiting_for="OpenStack nova computes is ready")
+        if request.config.getoption('--readiness-check') == 'ostf':
+            env.wait_for_ostf_pass(devops_env_name=env_name,
+                                   snapshot_name=snapshot_name)
+            wait(env.os_conn.is_nova_ready,
+                 timeout_seconds=60 * 5,
+                 expected_exceptions=Exception,
+                 waiting_for="OpenStack nova computes is ready")
+        else:
+            env.wait_for_readiness()
     return env
 
 
@@ -265,6 +320,109 @@ def clean_os(os_conn):
     os_conn.cleanup_network()
 
 
+class EnvGuards(object):
+    """Memoized guards results for one fuel environment
+
+    Fuel settings are fetched once and shared by all settings-based guards.
+    Guards results are dropped when cluster epoch changes. Guards, marked
+    with `volatile_guard`, are evaluated on every use.
+    """
+
+    def __init__(self):
+        self._settings = None
+        self._results = {}
+        self._epoch = cluster_epoch.value
+
+    def get_settings(self, env):
+        if self._settings is None:
+            self._settings = env.get_settings_data()['editable']
+        return self._settings
+
+    def evaluate(self, name, env):
+        if not cluster_epoch.is_current(self._epoch):
+            self._results = {}
+            self._epoch = cluster_epoch.value
+        guard = globals()[name]
+        if name not in self._results or getattr(guard, 'volatile', False):
+            self._results[name] = bool(guard(env))
+        return self._results[name]
+
+    @property
+    def results(self):
+        return dict(self._results)
+
+
+# Guards results for each fuel environment id. Environment config doesn't
+# change between snapshot reverts, so results are kept for whole session.
+_env_guards = {}
+
+# Compiled guards expressions cache
+_guard_expressions = {}
+
+
+def get_env_guards(env):
+    if env.id not in _env_guards:
+        _env_guards[env.id] = EnvGuards()
+    return _env_guards[env.id]
+
+
+def get_env_settings(env):
+    """Return memoized editable fuel settings of env"""
+    return get_env_guards(env).get_settings(env)
+
+
+def volatile_guard(func):
+    """Mark guard, which depends on current cloud state, as not cacheable"""
+    func.volatile = True
+    return func
+
+
+class _LazyGuards(object):
+    """Mapping to evaluate guards only on expression lookup"""
+
+    def __init__(self, guards, env):
+        self._guards = guards
+        self._env = env
+
+    def __getitem__(self, name):
+        return self._guards.evaluate(name, self._env)
+
+
+def compile_guard_expression(expression):
+    """Parse guards expression to code object with validation
+
+    Only guard names, `and`, `or`, `not` and parentheses are allowed.
+    """
+    if expression in _guard_expressions:
+        return _guard_expressions[expression]
+    allowed_nodes = (ast.Expression, ast.BoolOp, ast.And, ast.Or,
+                     ast.UnaryOp, ast.Not, ast.Load)
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError:
+        logger.critical('Invalid guards expression {}'.format(expression))
+        raise ValueError('Parse error')
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            func = node.id
+            if globals().get(func) is None:
+                logger.critical('Guard with name {} not found'.format(func))
+                raise ValueError('Parse error')
+            if not (func.startswith('is_') or func.startswith('has_')):
+                logger.critical(
+                    'Guard must start with "is_" or "has_", '
+                    'got {} instead'.format(func))
+                raise ValueError('Parse error')
+        elif not isinstance(node, allowed_nodes):
+            logger.critical('Unsupported construction {0} in guards '
+                            'expression {1}'.format(type(node).__name__,
+                                                    expression))
+            raise ValueError('Parse error')
+    code = compile(tree, '<guards>', 'eval')
+    _guard_expressions[expression] = code
+    return code
+
+
 def is_ha(env):
     """Env deployed with HA (3 controllers)"""
     return env.is_ha and len(env.get_nodes_by_role('controller')) >= 3
@@ -295,7 +453,9 @@ def has_2_or_more_ironic_conductors(env):
     return len(env.get_nodes_by_role('ironic')) >= 2
 
 
+@volatile_guard
 def is_any_compute_suitable_for_max_flavor(env):
+    """Some hypervisor has enough free resources for max flavor now"""
     attrs_to_check = {
         "vcpus": 8,
         "free_disk_gb": 160,
@@ -340,34 +500,34 @@ def get_config_option(fp, key, res_type):
 
 def is_l2pop(env):
     """Env deployed with vxlan segmentation and l2 population"""
-    data = env.get_settings_data()['editable']
+    data = get_env_settings(env)
     return data['neutron_advanced_configuration']['neutron_l2_pop']['value']
 
 
 def is_dvr(env):
     """Env deployed with enabled distributed routers support"""
-    data = env.get_settings_data()['editable']
+    data = get_env_settings(env)
     return data['neutron_advanced_configuration']['neutron_dvr']['value']
 
 
 def is_l3_ha(env):
     """Env deployed with enabled distributed routers support"""
-    data = env.get_settings_data()['editable']
+    data = get_env_settings(env)
     return data['neutron_advanced_configuration']['neutron_l3_ha']['value']
 
 
 def is_ironic_enabled(env):
-    data = env.get_settings_data()['editable']['additional_components']
+    data = get_env_settings(env)['additional_components']
     return data['ironic']['value']
 
 
 def is_ceph_enabled(env):
-    data = env.get_settings_data()['editable']['storage']
+    data = get_env_settings(env)['storage']
     return data['volumes_ceph']['value']
 
 
 def is_qos_enabled(env):
-    data = env.get_settings_data()['editable']
+    data = get_env_settings(env)
     return data['neutron_advanced_configuration']['neutron_qos']['value']
 
 
@@ -383,37 +543,17 @@ def executable_requirements(request, env_name):
 
 @pytest.fixture(autouse=True)
 def env_requirements(request, env):
-    reserved = {'or', 'and', 'not', '(', ')'}
     marker = request.node.get_marker('check_env_')
     if not marker:
         return
-    marker_str = ' and '.join(marker.args)
-    marker_str = marker_str.replace(
-        '(', ' ( '
-    ).replace(
-        ')', ' ) '
-    ).replace(
-        '  ', ' ')
-    functions = marker_str.split()
-    marker_str_evalued = marker_str
-    for func in functions:
-        if func in reserved:
-            continue
-        function = globals().get(func)
-        if function is None:
-            logger.critical('Guard with name {} not found'.format(func))
-            raise ValueError('Parse error')
-        if not (func.startswith('is_') or func.startswith('has_')):
-            logger.critical(
-                'Guard must start with "is_" or "has_", got {} instead'.format(
-                    func))
-            raise ValueError('Parse error')
-        marker_str_evalued = marker_str_evalued.replace(
-            func, str(function(env)))
-
-    if not eval(marker_str_evalued):
+    marker_str = ' and '.join('({})'.format(x) for x in marker.args)
+    code = compile_guard_expression(marker_str)
+    guards = get_env_guards(env)
+    if not eval(code, {'__builtins__': {}}, _LazyGuards(guards, env)):
+        computed = ', '.join('{0}={1}'.format(*x)
+                             for x in sorted(guards.results.items()))
         pytest.skip('Requires criteria: {}, computed instead: {}'.format(
-            marker_str, marker_str_evalued))
+            marker_str, computed))
 
 
 @pytest.fixture(autouse=True)
@@ -14,8 +14,12 @@
 
 import logging
 
-from devops.models import Environment
-from devops.models import Interface
+from mos_tests.environment.epoch import cluster_epoch
+from mos_tests.functions.common import lazy_import
+from mos_tests.settings import TIME_SYNC_MAX_SKEW
+
+# Devops models requires Django setup, so they are imported on first use
+devops_models = lazy_import('devops.models')
 
 logger = logging.getLogger(__name__)
 
@@ -113,7 +117,7 @@ class EnvProxy(object):
                            if x['name'] == node_devices[0]]
         assert len(node_interfaces) == 1
         interface_mac = node_interfaces[0]['mac']
-        return Interface.objects.get(mac_address=interface_mac)
+        return devops_models.Interface.objects.get(mac_address=interface_mac)
 
     def get_net_mac_addresses(self, net_name):
         net = self.get_network(name="private")
@@ -131,20 +135,61 @@ class EnvProxy(object):
             logger.info("Reverting snapshot {0}".format(snapshot_name))
             self.revert(snapshot_name, flag=False)
             self.resume(verbose=False)
+            cluster_epoch.bump('snapshot {} reverted'.format(snapshot_name))
             self.sync_time()
         except Exception as e:
             logger.error('Can\'t revert snapshot due to error: {}'.format(e))
             raise
 
-    def sync_time(self):
+    def sync_time(self, max_skew=TIME_SYNC_MAX_SKEW):
+        """Sync time on master and all slaves concurrently
+
+        After sync clock offset of each slave relative to master is
+        measured and nodes with skew greater than `max_skew` seconds
+        are reported.
+
+        :return: dict with slave name as key and clock offset as value
+        """
         with self.get_admin_remote() as remote:
             slaves_count = len(self.nodes().all) - 1
-            logger.info("sync time on master")
-            remote.execute('hwclock --hctosys')
-            logger.info("sync time on {} slaves".format(slaves_count))
-            remote.execute('for i in {{1..{0}}}; '
-                           'do (ssh node-$i "hwclock --hctosys") done'.format(
-                               slaves_count))
+            slaves = '{{1..{0}}}'.format(slaves_count)
+            logger.info("sync time on master and {} slaves".format(
+                slaves_count))
+            remote.execute(
+                'hwclock --hctosys & '
+                'for i in {0}; '
+                'do (ssh node-$i "hwclock --hctosys") & done; '
+                'wait'.format(slaves))
+            result = remote.execute(
+                'for i in {0}; do ('
+                'before=$(date +%s.%N); '
+                'remote=$(ssh node-$i "date +%s.%N"); '
+                'after=$(date +%s.%N); '
+                'echo "node-$i $before $remote $after") & done; '
+                'wait'.format(slaves), verbose=False)
+        offsets = self._parse_clock_offsets(result['stdout'])
+        for name, offset in sorted(offsets.items()):
+            if offset is None:
+                logger.warning("can't get time on {}".format(name))
+            elif abs(offset) > max_skew:
+                logger.warning('time on {0} differs from master by '
+                               '{1:.3f}s'.format(name, offset))
+        return offsets
+
+    @staticmethod
+    def _parse_clock_offsets(lines):
+        offsets = {}
+        for line in lines:
+            parts = line.split()
+            if len(parts) == 0:
+                continue
+            try:
+                before, remote, after = [float(x) for x in parts[1:]]
+            except ValueError:
+                offsets[parts[0]] = None
+                continue
+            offsets[parts[0]] = remote - (before + after) / 2
+        return offsets
 
 
 class DevopsClient(object):
@@ -154,7 +199,7 @@ class DevopsClient(object):
     def get_env(cls, env_name):
         """Find and return env by name."""
         try:
-            return EnvProxy(Environment.get(name=env_name))
+            return EnvProxy(devops_models.Environment.get(name=env_name))
         except Exception as e:
             logger.error(
                 'failed to find the last created environment{}'.format(e))
@@ -0,0 +1,48 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ClusterEpoch(object):
+    """Counter of cluster state changes
+
+    Counter is incremented on snapshot revert and destructive nodes
+    operations (destroy, start). Caches remember epoch value they were
+    filled on and compare it with current one on access to refresh lazily.
+    """
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        return self._value
+
+    def bump(self, reason):
+        with self._lock:
+            self._value += 1
+        logger.debug('Cluster epoch is {0} now ({1})'.format(self._value,
+                                                             reason))
+        return self._value
+
+    def is_current(self, value):
+        return value == self._value
+
+
+cluster_epoch = ClusterEpoch()
@@ -13,21 +13,32 @@
 #    under the License.
 
 from itertools import groupby
+import json
 import logging
 import os
+import threading
+import time
 
 from fuelclient import client
 from fuelclient import fuelclient_settings
 from fuelclient.objects import environment
 from fuelclient.objects.node import Node as FuelNode
 from fuelclient.objects import task as fuel_task
-from paramiko import RSAKey
-from paramiko import ssh_exception
 
+from mos_tests.environment.epoch import cluster_epoch
 from mos_tests.environment.os_actions import OpenStackActions
+from mos_tests.environment import readiness
 from mos_tests.environment.ssh import SSHClient
 from mos_tests.functions.common import gen_temp_file
+from mos_tests.functions.common import lazy_import
+from mos_tests.functions.common import parallel_map
 from mos_tests.functions.common import wait
+from mos_tests.settings import CLUSTER_ROLES_TTL
+from mos_tests.settings import NODES_INVENTORY_TTL
+from mos_tests.settings import OSTF_CACHE_FILE
+from mos_tests.settings import OSTF_CACHE_TTL
+
+paramiko = lazy_import('paramiko')
 
 
 logger = logging.getLogger(__name__)
@@ -71,8 +82,8 @@ class NodeProxy(object):
         try:
             with self.ssh() as remote:
                 remote.check_call('uname')
-        except (ssh_exception.SSHException,
-                ssh_exception.NoValidConnectionsError):
+        except (paramiko.ssh_exception.SSHException,
+                paramiko.ssh_exception.NoValidConnectionsError):
             return False
         else:
             return True
@@ -83,6 +94,231 @@ class NodeProxy(object):
                 for x in interfaces}
 
 
+class NodeInventory(object):
+    """Cached list of environment nodes with fqdn/ip/mac/role indexes
+
+    Nodes are fetched from Fuel API on first access, on `refresh` call,
+    when cache age exceeds `ttl` seconds or cluster epoch is changed.
+    Lookups for unknown keys make one forced refresh to find nodes, which
+    were added after last fetch.
+    """
+
+    def __init__(self, env, ttl=NODES_INVENTORY_TTL):
+        self._env = env
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._nodes = None
+        self._updated_at = None
+        self._epoch = None
+        self._by_fqdn = {}
+        self._by_ip = {}
+        self._by_mac = {}
+        self._by_role = {}
+
+    @property
+    def age(self):
+        """Seconds since last refresh or None if never fetched"""
+        if self._updated_at is None:
+            return None
+        return time.time() - self._updated_at
+
+    @property
+    def is_expired(self):
+        return (self._nodes is None or self.age > self.ttl or
+                not cluster_epoch.is_current(self._epoch))
+
+    def invalidate(self):
+        """Drop cached nodes; next access will fetch them from Fuel API"""
+        with self._lock:
+            self._nodes = None
+            self._updated_at = None
+
+    def refresh(self):
+        """Fetch nodes from Fuel API and rebuild indexes"""
+        with self._lock:
+            nodes = self._env.get_all_nodes()
+            by_fqdn, by_ip, by_mac, by_role = {}, {}, {}, {}
+            for node in nodes:
+                data = node.data
+                by_fqdn[data['fqdn']] = node
+                by_ip[data['ip']] = node
+                for ip in node.ip_list:
+                    by_ip.setdefault(ip, node)
+                by_mac[data['mac'].lower()] = node
+                for interface in data['meta'].get('interfaces', []):
+                    by_mac.setdefault(interface['mac'].lower(), node)
+                for role in data['roles']:
+                    by_role.setdefault(role, []).append(node)
+            self._by_fqdn = by_fqdn
+            self._by_ip = by_ip
+            self._by_mac = by_mac
+            self._by_role = by_role
+            self._nodes = nodes
+            self._updated_at = time.time()
+            self._epoch = cluster_epoch.value
+            logger.debug('Node inventory refreshed: {0} nodes'.format(
+                len(nodes)))
+            return list(nodes)
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if self.is_expired:
+                self.refresh()
+
+    def _lookup(self, index_name, key):
+        self._ensure_fresh()
+        node = getattr(self, index_name).get(key)
+        if node is None:
+            self.refresh()
+            node = getattr(self, index_name).get(key)
+        return node
+
+    @property
+    def nodes(self):
+        self._ensure_fresh()
+        return list(self._nodes)
+
+    def get_by_fqdn(self, fqdn):
+        return self._lookup('_by_fqdn', fqdn)
+
+    def get_by_ip(self, ip):
+        return self._lookup('_by_ip', ip)
+
+    def get_by_mac(self, mac):
+        return self._lookup('_by_mac', mac.lower())
+
+    def get_by_role(self, role):
+        self._ensure_fresh()
+        return list(self._by_role.get(role, []))
+
+
+class ClusterRoles(object):
+    """HA roles of controllers, discovered in one concurrent pass
+
+    :ivar primary: controller with `primary-controller` hiera role
+    :ivar leader: pacemaker designated controller (DC)
+    :ivar rabbit_master: controller with RabbitMQ master resource
+    :ivar galera_states: dict with controller fqdn as key and galera
+        `wsrep_local_state_comment` as value
+    :ivar controllers: all controllers sorted by fqdn
+    :ivar unreachable: controllers, which were not queried because of
+        errors; roles are taken from answers of other controllers
+    """
+
+    commands = {
+        'roles': 'hiera roles',
+        'dc': 'pcs status cluster | grep "Current DC:"',
+        'rabbit': ('crm_resource --locate '
+                   '--resource master_p_rabbitmq-server'),
+        'galera': ('mysql -Nse '
+                   '"SHOW STATUS LIKE \'wsrep_local_state_comment\'"'),
+    }
+
+    def __init__(self, controllers, primary=None, leader=None,
+                 rabbit_master=None, galera_states=None):
+        self.controllers = sorted(controllers,
+                                  key=lambda node: node.data['fqdn'])
+        self.primary = primary
+        self.leader = leader
+        self.rabbit_master = rabbit_master
+        self.galera_states = galera_states or {}
+        self.unreachable = []
+        self.discovered_at = time.time()
+
+    def __repr__(self):
+        return ('<ClusterRoles(primary={0.primary}, leader={0.leader}, '
+                'rabbit_master={0.rabbit_master})>'.format(self))
+
+    @property
+    def non_primary(self):
+        return [x for x in self.controllers if x != self.primary]
+
+    @classmethod
+    def _query_controller(cls, controller):
+        """Return (controller, outputs) or (controller, None) on error"""
+        outputs = {}
+        try:
+            with controller.ssh() as remote:
+                for name, command in cls.commands.items():
+                    result = remote.execute(command, verbose=False)
+                    outputs[name] = (result.stdout_string if result.is_ok
+                                     else '')
+        except Exception as e:
+            logger.warning("Can't query roles of {0}: {1}".format(
+                controller.data['fqdn'], e))
+            return controller, None
+        return controller, outputs
+
+    @classmethod
+    def discover(cls, env):
+        """Query all controllers of env concurrently and collect roles"""
+        controllers = env.get_nodes_by_role('controller')
+        results = parallel_map(cls._query_controller, controllers)
+
+        def find_in(text):
+            for controller in controllers:
+                if controller.data['fqdn'] in text:
+                    return controller
+
+        roles = cls(controllers)
+        for controller, outputs in results:
+            fqdn = controller.data['fqdn']
+            if outputs is None:
+                roles.unreachable.append(controller)
+                roles.galera_states[fqdn] = None
+                continue
+            logger.debug('hiera roles for {} is {}'.format(
+                fqdn, outputs['roles']))
+            if 'primary-controller' in outputs['roles']:
+                roles.primary = controller
+            if roles.leader is None and outputs['dc']:
+                roles.leader = find_in(outputs['dc'])
+            if roles.rabbit_master is None:
+                master_lines = [x for x in outputs['rabbit'].splitlines()
+                                if 'Master' in x]
+                roles.rabbit_master = find_in(' '.join(master_lines))
+            galera_state = outputs['galera'].split()
+            roles.galera_states[fqdn] = (galera_state[-1] if galera_state
+                                         else None)
+        logger.info('Discovered cluster roles: {0}, galera states: '
+                    '{0.galera_states}'.format(roles))
+        return roles
+
+
+class OstfResultCache(object):
+    """File cache of successful OSTF verdicts
+
+    Verdict is stored with timestamp and is valid for `ttl` seconds.
+    File is replaced atomically, so cache may be shared between several
+    test processes.
+    """
+
+    def __init__(self, path=OSTF_CACHE_FILE, ttl=OSTF_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def is_passed(self, key):
+        passed_at = self._load().get(key)
+        return passed_at is not None and time.time() - passed_at < self.ttl
+
+    def set_passed(self, key):
+        data = self._load()
+        now = time.time()
+        data = {k: v for k, v in data.items() if now - v < self.ttl}
+        data[key] = now
+        tmp_path = '{0}.{1}'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_path, self.path)
+
+
 class Environment(environment.Environment):
     """Extended fuelclient Environment model with some helpful methods"""
 
@@ -92,14 +328,19 @@ class Environment(environment.Environment):
     def __init__(self, *args, **kwargs):
         super(Environment, self).__init__(*args, **kwargs)
         self._os_conn = None
+        self._os_conn_lock = threading.Lock()
+        self._cluster_roles = None
+        self._cluster_roles_epoch = None
+        self.inventory = NodeInventory(self)
 
     @property
     def os_conn(self):
-        if self._os_conn is None:
-            self._os_conn = OpenStackActions(
-                controller_ip=self.get_primary_controller_ip(),
-                cert=self.certificate,
-                env=self)
+        with self._os_conn_lock:
+            if self._os_conn is None:
+                self._os_conn = OpenStackActions(
+                    controller_ip=self.get_primary_controller_ip(),
+                    cert=self.certificate,
+                    env=self)
         return self._os_conn
 
     @property
@@ -123,10 +364,10 @@ class Environment(environment.Environment):
 
     def find_node_by_fqdn(self, fqdn):
         """Returns list of fuelclient.objects.Node instances for cluster"""
-        for node in self.get_all_nodes():
-            if node.data['fqdn'] == fqdn:
-                return node
-        raise Exception("Node doesn't found")
+        node = self.inventory.get_by_fqdn(fqdn)
+        if node is None:
+            raise Exception("Node doesn't found")
+        return node
 
     def get_ssh_to_node(self, ip):
         return SSHClient(
@@ -143,8 +384,7 @@ class Environment(environment.Environment):
 
     def get_nodes_by_role(self, role):
         """Returns nodes by assigned role"""
-        return [x for x in self.get_all_nodes()
-                if role in x.data['roles']]
+        return self.inventory.get_by_role(role)
 
     def is_ostf_tests_pass(self, *test_groups):
         """Check for OpenStack tests pass"""
@@ -169,10 +409,50 @@ class Environment(environment.Environment):
                 return False
         return True
 
-    def wait_for_ostf_pass(self):
+    def get_deployment_task_id(self):
+        """Return id of last deployment task of cluster"""
+        tasks = self.connection.get_request(
+            'tasks/?cluster_id={0}'.format(self.id))
+        ids = [x['id'] for x in tasks
+               if x['name'] in ('deploy', 'deployment')]
+        if ids:
+            return max(ids)
+
+    def get_ostf_cache_key(self, devops_env_name, snapshot_name):
+        """Return key to identify cluster state for OSTF results caching
+
+        Returns None if state can't be identified (snapshot is unknown).
+        """
+        if not all([devops_env_name, snapshot_name]):
+            return None
+        return '{0}:{1}:{2}:{3}'.format(devops_env_name, snapshot_name,
+                                        self.id,
+                                        self.get_deployment_task_id())
+
+    def wait_for_ostf_pass(self, devops_env_name=None, snapshot_name=None):
+        """Wait for OSTF tests to pass
+
+        If devops env and snapshot names are passed, successful result is
+        cached and OSTF will not be run again for same snapshot until cache
+        expires (see `OSTF_CACHE_TTL` setting).
+        """
+        cache = OstfResultCache()
+        key = self.get_ostf_cache_key(devops_env_name, snapshot_name)
+        if key is not None and cache.is_passed(key):
+            logger.info('OSTF tests already passed for {}'.format(key))
+            return
         wait(self.is_ostf_tests_pass, timeout_seconds=20 * 60,
              sleep_seconds=20,
              waiting_for='OpenStack to pass OSTF tests')
+        if key is not None:
+            cache.set_passed(key)
+
+    def wait_for_readiness(self, timeout=10 * 60):
+        """Wait for lightweight readiness probes to pass
+
+        It's much faster alternative to `wait_for_ostf_pass`.
+        """
+        return readiness.wait_for_readiness(self, timeout=timeout)
 
     def wait_network_verification(self):
         data = self.verify_network()
@@ -204,101 +484,163 @@ class Environment(environment.Environment):
         if ssl['services']['value']:
             return ssl['cert_data']['value']['content']
 
+    @property
+    def cluster_roles(self):
+        """Cached controllers HA roles
+
+        Refreshed on cluster epoch change (revert, nodes destroy or start)
+        and after `CLUSTER_ROLES_TTL` seconds, as other failover actions
+        (pacemaker resources ban, etc.) change leader and masters too.
+        """
+        roles = self._cluster_roles
+        if (roles is None or
+                time.time() - roles.discovered_at > CLUSTER_ROLES_TTL or
+                not cluster_epoch.is_current(self._cluster_roles_epoch)):
+            self._cluster_roles_epoch = cluster_epoch.value
+            self._cluster_roles = ClusterRoles.discover(self)
+        return self._cluster_roles
+
+    def invalidate_cluster_roles(self):
+        self._cluster_roles = None
+
     @property
     def leader_controller(self):
-        controllers = self.get_nodes_by_role('controller')
-        controller_ip = controllers[0].data['ip']
-        with self.get_ssh_to_node(controller_ip) as remote:
-            response = remote.check_call(
-                'pcs status cluster | grep "Current DC:"')
-        stdout = response.stdout_string
-        for controller in controllers:
-            if controller.data['fqdn'] in stdout:
-                return controller
+        # DC is changed by pacemaker resources ban/move, which don't change
+        # cluster epoch, so leader is always discovered again
+        self.invalidate_cluster_roles()
+        return self.cluster_roles.leader
 
     @property
     def primary_controller(self):
-        controllers = self.get_nodes_by_role('controller')
-        for controller in controllers:
-            with controller.ssh() as remote:
-                response = remote.execute('hiera roles')
-                stdout = ' '.join(response['stdout'])
-                logger.debug('hiera roles for {} is {}'.format(
-                    controller.data['fqdn'], stdout))
-                if 'primary-controller' in stdout:
-                    return controller
-        else:
+        primary_controller = self.cluster_roles.primary
+        if primary_controller is None:
             raise Exception("Can't find primary controller")
+        return primary_controller
 
     @property
     def non_primary_controllers(self):
-        controllers = self.get_nodes_by_role('controller')
-        primary_controller = self.primary_controller
-        non_primary_controllers = [
-            controller for controller in controllers
-            if controller != primary_controller]
-        non_primary_controllers.sort(key=lambda node: node.data['fqdn'])
-        return non_primary_controllers
-
-    def destroy_nodes(self, devops_nodes):
-        node_ips = [node.get_ip_address_by_network_name('admin')
-                    for node in devops_nodes]
-        for node in devops_nodes:
-            node.destroy()
-        wait(lambda: self.check_nodes_get_offline_state(node_ips),
-             timeout_seconds=10 * 60,
-             waiting_for='the nodes get offline state')
+        # Check that primary controller exists
+        self.primary_controller
+        return self.cluster_roles.non_primary
+
+    def wait_nodes_online_state(self, devops_nodes, online, started_at,
+                                timeout=10 * 60):
+        """Wait until fuel reports nodes in expected online state
+
+        Each node is tracked separately, so time it takes to reach state
+        is recorded for every node.
+
+        :param devops_nodes: devops nodes to track
+        :param online: expected value of node `online` attribute
+        :param started_at: timestamp to count time from
+        :return: dict with devops node name as key and seconds, spent to
+            reach expected state, as value
+        """
+        names = {node.get_ip_address_by_network_name('admin'): node.name
+                 for node in devops_nodes}
+        timings = {}
+        state = 'online' if online else 'offline'
+
+        def all_nodes_reached_state():
+            for node in self.inventory.refresh():
+                ip = node.data['ip']
+                if (ip in names and names[ip] not in timings and
+                        node.data['online'] == online):
+                    timings[names[ip]] = time.time() - started_at
+                    logger.info('Node {0} gets {1} state in {2:.1f}s'.format(
+                        names[ip], state, timings[names[ip]]))
+            return len(timings) == len(names)
+
+        wait(all_nodes_reached_state,
+             timeout_seconds=timeout,
+             sleep_seconds=2,
+             waiting_for='the nodes get {} state'.format(state))
+        return timings
+
+    def destroy_nodes(self, devops_nodes, started_at=None):
+        """Destroy devops nodes and wait for them to become offline
+
+        :return: dict with time-to-offline for each node
+        """
+        if started_at is None:
+            started_at = time.time()
+        parallel_map(lambda node: node.destroy(), devops_nodes)
+        cluster_epoch.bump('nodes destroyed')
+        timings = self.wait_nodes_online_state(devops_nodes, online=False,
+                                               started_at=started_at)
 
         def keyfunc(node):
             return node.data['online']
 
-        all_nodes = self.get_all_nodes()
+        all_nodes = self.inventory.nodes
         all_nodes.sort(key=keyfunc)
         for online, nodes in groupby(all_nodes, keyfunc):
             logger.info('online is {0} for nodes {1}'
                         .format(online, list(nodes)))
+        return timings
 
     def warm_shutdown_nodes(self, devops_nodes):
-        for node in devops_nodes:
+        """Shutdown nodes concurrently and destroy them
+
+        :return: dict with time-to-offline for each node
+        """
+        started_at = time.time()
+
+        def shutdown(node):
             node_ip = node.get_ip_address_by_network_name('admin')
             logger.info('Shutdown node {0} with ip {1}'
                         .format(node.name, node_ip))
             with self.get_ssh_to_node(node_ip) as remote:
                 remote.check_call('/sbin/shutdown -Ph now')
-        self.destroy_nodes(devops_nodes)
+
+        parallel_map(shutdown, devops_nodes)
+        return self.destroy_nodes(devops_nodes, started_at=started_at)
 
     def warm_start_nodes(self, devops_nodes):
-        for node in devops_nodes:
+        """Start nodes concurrently and wait for them to become online
+
+        :return: dict with time-to-online for each node
+        """
+        started_at = time.time()
+
+        def start(node):
             logger.info('Starting node {}'.format(node.name))
             node.create()
-        wait(self.check_nodes_get_online_state, timeout_seconds=10 * 60)
-        logger.info('wait until the nodes get online state')
-        for node in self.get_all_nodes():
+
+        parallel_map(start, devops_nodes)
+        cluster_epoch.bump('nodes started')
+        timings = self.wait_nodes_online_state(devops_nodes, online=True,
+                                               started_at=started_at)
+        for node in self.inventory.nodes:
             logger.info('online state of node {0} now is {1}'
                         .format(node.data['name'], node.data['online']))
+        return timings
 
     def warm_restart_nodes(self, devops_nodes):
         logger.info('Reboot (warm restart) nodes %s',
                     [n.name for n in devops_nodes])
-        self.warm_shutdown_nodes(devops_nodes)
-        self.warm_start_nodes(devops_nodes)
+        offline_timings = self.warm_shutdown_nodes(devops_nodes)
+        online_timings = self.warm_start_nodes(devops_nodes)
+        for node in devops_nodes:
+            logger.info('Node {0}: time-to-offline {1:.1f}s, '
+                        'time-to-online {2:.1f}s'.format(
+                            node.name, offline_timings[node.name],
+                            online_timings[node.name]))
 
     def check_nodes_get_offline_state(self, node_ips=()):
         nodes_states = [not x.data['online']
-                        for x in self.get_all_nodes()
+                        for x in self.inventory.refresh()
                         if x.data['ip'] in node_ips]
         return all(nodes_states)
 
     def check_nodes_get_online_state(self):
-        return all([node.data['online'] for node in self.get_all_nodes()])
+        return all([node.data['online'] for node in self.inventory.refresh()])
 
     def get_node_ip_by_host_name(self, hostname):
-        controller_ip = ''
-        for node in self.get_all_nodes():
-            if node.data['fqdn'] == hostname:
-                controller_ip = node.data['ip']
-                break
-        return controller_ip
+        node = self.inventory.get_by_fqdn(hostname)
+        if node is None:
+            return ''
+        return node.data['ip']
 
     def get_node_by_devops_node(self, devops_node, interface='admin'):
         interfaces = devops_node.interface_by_network_name(interface)
@@ -332,6 +674,7 @@ class Environment(environment.Environment):
                                   if x['name'] in net_names]
                 interface['assigned_networks'] = nets_to_assign
             node.upload_node_attribute('interfaces', interfaces)
+        self.inventory.invalidate()
 
         # Verify network
         result = self.wait_network_verification()
@@ -349,6 +692,7 @@ class Environment(environment.Environment):
             fuel_node.set({'name': devops_node.name})
 
         self.assign(fuel_nodes, roles)
+        self.inventory.invalidate()
 
 
 class FuelClient(object):
@@ -399,5 +743,6 @@ class FuelClient(object):
                 for path in ['/root/.ssh/id_rsa',
                              '/root/.ssh/bootstrap.rsa']:
                     with remote.open(path) as f:
-                        self._admin_keys.append(RSAKey.from_private_key(f))
+                        key = paramiko.RSAKey.from_private_key(f)
+                        self._admin_keys.append(key)
         return self._admin_keys
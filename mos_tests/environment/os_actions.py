@@ -15,24 +15,27 @@
 import logging
 import random
 
-from cinderclient import client as cinderclient
-from glanceclient.v2.client import Client as GlanceClient
-from heatclient.v1.client import Client as HeatClient
-from keystoneclient.auth.identity.v2 import Password as KeystonePassword
-from keystoneclient import session
-from keystoneclient.v2_0 import Client as KeystoneClient
-from neutronclient.common.exceptions import NeutronClientException
-from neutronclient.v2_0 import client as neutron_client
-from novaclient import client as nova_client
-from novaclient.exceptions import ClientException as NovaClientException
-import paramiko
 import six
 
 from mos_tests.environment.ssh import SSHClient
 from mos_tests.functions.common import gen_temp_file
+from mos_tests.functions.common import lazy_import
 from mos_tests.functions.common import wait
 from mos_tests.functions import os_cli
 
+# OpenStack clients are imported on first use
+cinderclient = lazy_import('cinderclient.client')
+glance_client = lazy_import('glanceclient.v2.client')
+heat_client = lazy_import('heatclient.v1.client')
+keystone_identity = lazy_import('keystoneclient.auth.identity.v2')
+session = lazy_import('keystoneclient.session')
+keystone_client = lazy_import('keystoneclient.v2_0')
+neutron_exceptions = lazy_import('neutronclient.common.exceptions')
+neutron_client = lazy_import('neutronclient.v2_0.client')
+nova_client = lazy_import('novaclient.client')
+nova_exceptions = lazy_import('novaclient.exceptions')
+paramiko = lazy_import('paramiko')
+
 logger = logging.getLogger(__name__)
 
 
@@ -61,14 +64,14 @@ class OpenStackActions(object):
 
         logger.debug('Auth URL is {0}'.format(auth_url))
 
-        auth = KeystonePassword(username=user,
-                                password=password,
-                                auth_url=auth_url,
-                                tenant_name=tenant)
+        auth = keystone_identity.Password(username=user,
+                                          password=password,
+                                          auth_url=auth_url,
+                                          tenant_name=tenant)
 
         self.session = session.Session(auth=auth, verify=self.path_to_cert)
 
-        self.keystone = KeystoneClient(session=self.session)
+        self.keystone = keystone_client.Client(session=self.session)
         self.keystone.management_url = auth_url
 
         self.nova = nova_client.Client(version=2, session=self.session)
@@ -77,12 +80,12 @@ class OpenStackActions(object):
 
         self.neutron = neutron_client.Client(session=self.session)
 
-        self.glance = GlanceClient(session=self.session)
+        self.glance = glance_client.Client(session=self.session)
 
         endpoint_url = self.session.get_endpoint(service_type='orchestration',
                                                  endpoint_type='publicURL')
         token = self.session.get_token()
-        self.heat = HeatClient(endpoint=endpoint_url, token=token)
+        self.heat = heat_client.Client(endpoint=endpoint_url, token=token)
 
         self.env = env
 
@@ -325,13 +328,13 @@ class OpenStackActions(object):
 
                 identifier = floating_ip['id']
                 wait(is_floating_ip_down, timeout_seconds=60)
-            except NeutronClientException:
+            except neutron_exceptions.NeutronClientException:
                 logger.info('The floatingip {} can not be disassociated.'
                             .format(floating_ip['id']))
         else:
             try:
                 self.nova.servers.remove_floating_ip(srv, floating_ip)
-            except NovaClientException:
+            except nova_exceptions.ClientException:
                 logger.info('The floatingip {} can not be disassociated.'
                             .format(floating_ip))
 
@@ -339,13 +342,13 @@ class OpenStackActions(object):
         if use_neutron:
             try:
                 self.neutron.delete_floatingip(floating_ip['id'])
-            except NeutronClientException:
+            except neutron_exceptions.NeutronClientException:
                 logger.info('floating_ip {} is not deletable'
                             .format(floating_ip['id']))
         else:
             try:
                 self.nova.floating_ips.delete(floating_ip)
-            except NovaClientException:
+            except nova_exceptions.ClientException:
                 logger.info('floating_ip {} is not deletable'
                             .format(floating_ip))
 
@@ -447,7 +450,7 @@ class OpenStackActions(object):
                 continue
             try:
                 self.neutron.delete_subnet(subnet['id'])
-            except NeutronClientException:
+            except neutron_exceptions.NeutronClientException:
                 logger.info(
                     'the subnet {} is not deletable'.format(subnet['id']))
 
@@ -459,28 +462,28 @@ class OpenStackActions(object):
                 continue
             try:
                 self.neutron.delete_router(router['id'])
-            except NeutronClientException:
+            except neutron_exceptions.NeutronClientException:
                 logger.info('the router {} is not deletable'.format(router))
 
     def delete_floating_ips(self):
         for floating_ip in self.nova.floating_ips.list():
             try:
                 self.nova.floating_ips.delete(floating_ip)
-            except NovaClientException:
+            except nova_exceptions.ClientException:
                 self.delete_floating_ip(floating_ip, use_neutron=True)
 
     def delete_servers(self):
         for server in self.nova.servers.list():
             try:
                 self.nova.servers.delete(server)
-            except NovaClientException:
+            except nova_exceptions.ClientException:
                 logger.info('nova server {} is not deletable'.format(server))
 
     def delete_keypairs(self):
         for key_pair in self.nova.keypairs.list():
             try:
                 self.nova.keypairs.delete(key_pair)
-            except NovaClientException:
+            except nova_exceptions.ClientException:
                 logger.info('key pair {} is not deletable'.format(key_pair.id))
 
     def delete_security_groups(self):
@@ -489,7 +492,7 @@ class OpenStackActions(object):
                 continue
             try:
                 self.nova.security_groups.delete(sg)
-            except NovaClientException:
+            except nova_exceptions.ClientException:
                 logger.info(
                     'The Security Group {} is not deletable'.format(sg))
 
@@ -517,7 +520,7 @@ class OpenStackActions(object):
                             'subnet_id': fixed_ip['subnet_id'],
                         }
                     )
-            except NeutronClientException:
+            except neutron_exceptions.NeutronClientException:
                 logger.info('the port {} is not deletable'
                             .format(port['id']))
 
@@ -548,7 +551,7 @@ class OpenStackActions(object):
         for net in networks:
             try:
                 self.neutron.delete_network(net)
-            except NeutronClientException:
+            except neutron_exceptions.NeutronClientException:
                 logger.info('the net {} is not deletable'
                             .format(net))
 
@@ -751,19 +754,19 @@ class OpenStackActions(object):
     def server_hard_reboot(self, server):
         try:
             self.nova.servers.reboot(server.id, reboot_type='HARD')
-        except NovaClientException:
+        except nova_exceptions.ClientException:
             logger.info("nova server {} can't be rebooted".format(server))
 
     def server_start(self, server):
         try:
             self.nova.servers.start(server.id)
-        except NovaClientException:
+        except nova_exceptions.ClientException:
             logger.info("nova server {} can't be started".format(server))
 
     def server_stop(self, server):
         try:
             self.nova.servers.stop(server.id)
-        except NovaClientException:
+        except nova_exceptions.ClientException:
             logger.info("nova server {} can't be stopped".format(server))
 
     def rebuild_server(self, server, image):
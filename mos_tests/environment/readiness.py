@@ -0,0 +1,132 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from collections import OrderedDict
+from itertools import islice
+import logging
+import time
+
+from waiting import TimeoutExpired
+
+from mos_tests.functions.common import parallel_map
+from mos_tests.functions.common import wait
+
+logger = logging.getLogger(__name__)
+
+
+def probe_keystone(env):
+    """Keystone issues token and lists tenants"""
+    return env.os_conn.keystone.tenants.list() is not None
+
+
+def probe_nova(env):
+    """All active nova computes are available"""
+    return env.os_conn.is_nova_ready()
+
+
+def probe_neutron(env):
+    """All neutron agents are alive"""
+    agents = env.os_conn.neutron.list_agents()['agents']
+    return len(agents) > 0 and all(x['alive'] for x in agents)
+
+
+def probe_cinder(env):
+    """Cinder API responds"""
+    return env.os_conn.cinder.volumes.list() is not None
+
+
+def probe_glance(env):
+    """Glance API responds"""
+    list(islice(env.os_conn.glance.images.list(), 1))
+    return True
+
+
+def probe_pacemaker(env):
+    """Pacemaker cluster has quorum and no failed resources"""
+    controller = env.get_nodes_by_role('controller')[0]
+    with controller.ssh() as remote:
+        result = remote.execute('crm_mon -1', verbose=False)
+    output = result.stdout_string
+    return (result.is_ok and 'partition with quorum' in output and
+            'FAILED' not in output)
+
+
+def probe_rabbitmq(env):
+    """All controllers are running nodes of RabbitMQ cluster"""
+    controllers = env.get_nodes_by_role('controller')
+    with controllers[0].ssh() as remote:
+        result = remote.execute('rabbitmqctl cluster_status', verbose=False)
+    if not result.is_ok:
+        return False
+    output = result.stdout_string
+    if 'running_nodes' not in output:
+        return False
+    running_nodes = output.split('running_nodes', 1)[1].split(']', 1)[0]
+    return running_nodes.count('@') >= len(controllers)
+
+
+PROBES = OrderedDict([
+    ('keystone', probe_keystone),
+    ('nova', probe_nova),
+    ('neutron', probe_neutron),
+    ('cinder', probe_cinder),
+    ('glance', probe_glance),
+    ('pacemaker', probe_pacemaker),
+    ('rabbitmq', probe_rabbitmq),
+])
+
+
+def run_probe(env, name, probe, timeout):
+    """Wait for probe to pass
+
+    :return: tuple (name, is passed, seconds spent)
+    """
+    started_at = time.time()
+
+    def is_passed():
+        try:
+            return probe(env)
+        except Exception as e:
+            logger.debug('{0} probe failed: {1}'.format(name, e))
+            return False
+
+    try:
+        wait(is_passed, timeout_seconds=timeout, sleep_seconds=5,
+             waiting_for='{} readiness probe to pass'.format(name))
+        passed = True
+    except TimeoutExpired:
+        passed = False
+    return name, passed, time.time() - started_at
+
+
+def wait_for_readiness(env, probes=None, timeout=10 * 60):
+    """Run readiness probes concurrently and wait for all to pass
+
+    :param env: fuel Environment instance
+    :param probes: dict with probes names and functions, `PROBES` by default
+    :param timeout: timeout for each probe in seconds
+    :return: dict with probe names and seconds, spent to pass it
+    """
+    if probes is None:
+        probes = PROBES
+    results = parallel_map(
+        lambda item: run_probe(env, item[0], item[1], timeout),
+        probes.items())
+    for name, passed, elapsed in results:
+        logger.info('Readiness probe {0}: {1} in {2:.1f}s'.format(
+            name, 'passed' if passed else 'FAILED', elapsed))
+    failed = [name for name, passed, _ in results if not passed]
+    if failed:
+        raise Exception('Readiness probes {} are not passed'.format(failed))
+    return {name: elapsed for name, _, elapsed in results}
@@ -19,9 +19,11 @@ import posixpath
 import stat
 import time
 
-import paramiko
 import six
 
+from mos_tests.functions.common import lazy_import
+
+paramiko = lazy_import('paramiko')
 
 logger = logging.getLogger(__name__)
 
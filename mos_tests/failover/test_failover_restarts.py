@@ -12,7 +12,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import json
 import logging
 import time
 
@@ -35,17 +34,17 @@ class TestFailoverRestarts(TestBase):
                 assert server.status == 'ACTIVE'
 
             # Get user list and check that all users are enabled
-            result = openstack_client('user list --long -f json')
-            for user in json.loads(result):
+            users = openstack_client.get_listing('user list',
+                                                 params='--long')
+            for user in users:
                 assert user['Enabled'] is True
 
             # Get list of services IDs and than description for each service
-            result = openstack_client('service list -f json')
-            id_list = [service['ID'] for service in json.loads(result)]
+            id_list = [service['ID'] for service in
+                       openstack_client.get_listing('service list')]
             for service_id in id_list:
-                cmd = 'service show {} -f json'.format(service_id)
-                result = openstack_client(cmd)
-                service = json.loads(result)
+                service = openstack_client.get_details('service show',
+                                                       params=service_id)
                 assert service['enabled'] is True
 
             for service in self.os_conn.nova.services.list():
@@ -0,0 +1,276 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Packets capture on remote nodes, streamed over SSH
+
+tcpdump writes pcap to stdout, which is read from SSH channel to local
+file (optionally rotated by size) or memory:
+
+    with Capture(remote, bpf_filter='udp port 4789') as capture:
+        do_something()
+    index = capture.index()
+    logger.info(capture.stats)
+"""
+
+import contextlib
+import logging
+import os
+import re
+import struct
+import threading
+
+import six
+
+from mos_tests.functions.pcap import PcapIndex
+
+logger = logging.getLogger(__name__)
+
+PCAP_HEADER_SIZE = 24
+RECORD_HEADER_SIZE = 16
+
+# tcpdump statistics lines, printed to stderr on exit
+STATS_RE = re.compile(
+    r'^(\d+) packets? (captured|received by filter|dropped by kernel|'
+    r'dropped by interface)', re.M)
+STATS_NAMES = {
+    'captured': 'captured',
+    'received by filter': 'received',
+    'dropped by kernel': 'dropped',
+    'dropped by interface': 'if_dropped',
+}
+
+
+class CaptureError(Exception):
+    pass
+
+
+class PcapWriter(object):
+    """Split pcap stream to records and write them to memory or file
+
+    If `path` is not set, data is kept in memory. If `max_size` is set, file
+    is rotated to `<path>.1` (previous one is removed) on exceeding of size,
+    so only last 2 * max_size bytes of capture are kept.
+    """
+
+    def __init__(self, path=None, max_size=None):
+        self.path = path
+        self.max_size = max_size
+        self.header = None
+        self.packets_count = 0
+        self._buffer = b''
+        self._file = six.BytesIO() if path is None else open(path, 'wb')
+        self._size = 0
+        self._little_endian = True
+
+    def feed(self, data):
+        self._buffer += data
+        if self.header is None:
+            if len(self._buffer) < PCAP_HEADER_SIZE:
+                return
+            self.header = self._buffer[:PCAP_HEADER_SIZE]
+            self._little_endian = self.header[:2] in (b'\xd4\xc3', b'\x4d\x3c')
+            self._buffer = self._buffer[PCAP_HEADER_SIZE:]
+            self._write(self.header)
+        length_format = '<I' if self._little_endian else '>I'
+        pos = 0
+        while len(self._buffer) - pos >= RECORD_HEADER_SIZE:
+            incl_len = struct.unpack_from(length_format, self._buffer,
+                                          pos + 8)[0]
+            end = pos + RECORD_HEADER_SIZE + incl_len
+            if end > len(self._buffer):
+                break
+            self._write_record(self._buffer[pos:end])
+            pos = end
+        self._buffer = self._buffer[pos:]
+
+    def _write(self, data):
+        self._file.write(data)
+        self._size += len(data)
+
+    def _write_record(self, record):
+        if (self.max_size is not None and self.path is not None and
+                self._size + len(record) > self.max_size and
+                self._size > PCAP_HEADER_SIZE):
+            self._file.close()
+            os.rename(self.path, self.path + '.1')
+            self._file = open(self.path, 'wb')
+            self._size = 0
+            self._write(self.header)
+        self._write(record)
+        self.packets_count += 1
+
+    @property
+    def paths(self):
+        """Capture files, oldest first"""
+        if self.path is None:
+            return []
+        rotated = self.path + '.1'
+        return [x for x in (rotated, self.path) if os.path.exists(x)]
+
+    def getvalue(self):
+        return self._file.getvalue()
+
+    def close(self):
+        if self._buffer:
+            logger.warning('Last {0} bytes of capture are incomplete '
+                           'record'.format(len(self._buffer)))
+        if self.path is not None:
+            self._file.close()
+
+
+class Capture(object):
+    """tcpdump on remote node, which streams packets over SSH channel
+
+    :param remote: SSHClient, which is used during all capture
+    :param bpf_filter: tcpdump filter expression
+    :param interface: interface name or None to use from `args`
+    :param args: additional tcpdump arguments
+    :param prefix: prepended to tcpdump command (`ip netns exec <ns>`,
+        for example)
+    :param path: local file path or None to keep capture in memory
+    :param max_size: max local file size before rotation
+    """
+
+    def __init__(self, remote, bpf_filter='', interface='any', args='',
+                 path=None, max_size=None, timeout=60, prefix=''):
+        self.remote = remote
+        self.bpf_filter = bpf_filter
+        self.interface = interface
+        self.args = args
+        self.prefix = prefix
+        self.timeout = timeout
+        self.writer = PcapWriter(path=path, max_size=max_size)
+        self.pid = None
+        self.exit_code = None
+        self.stats = {}
+        self.stderr = ''
+        self._chan = None
+        self._stderr = None
+        self._thread = None
+        self._error = None
+
+    @property
+    def command(self):
+        parts = ['{0} tcpdump -U -w -'.format(self.prefix).strip()]
+        if self.interface is not None:
+            parts.append('-i {0}'.format(self.interface))
+        parts.append(self.args)
+        if self.bpf_filter:
+            parts.append(six.moves.shlex_quote(self.bpf_filter))
+        # Shell pid is printed before exec, so it's exact tcpdump pid
+        return "sh -c {0}".format(six.moves.shlex_quote(
+            'echo $$ >&2; exec ' + ' '.join(parts)))
+
+    def start(self):
+        (self._chan, _, _,
+         self._stderr) = self.remote.execute_async(self.command)
+        self._chan.settimeout(self.timeout)
+        self.pid = int(self._stderr.readline())
+        # Wait capture start to not miss first packets
+        while True:
+            line = self._stderr.readline()
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', 'replace')
+            self.stderr += line
+            if not line or 'listening on' in line:
+                break
+        if self._chan.exit_status_ready():
+            self.stop()
+            raise CaptureError('tcpdump on {0} is failed: {1}'.format(
+                self.remote.host, self.stderr))
+        logger.debug('tcpdump (pid {0}) is started on {1}'.format(
+            self.pid, self.remote.host))
+        self._chan.settimeout(None)
+        self._thread = threading.Thread(target=self._read)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _read(self):
+        try:
+            while True:
+                data = self._chan.recv(65536)
+                if not data:
+                    break
+                self.writer.feed(data)
+        except Exception as e:
+            self._error = e
+            logger.exception('Reading capture from {0} is failed'.format(
+                self.remote.host))
+
+    def signal(self):
+        """Send SIGINT to tcpdump"""
+        if self.pid is not None and self.exit_code is None:
+            self.remote.execute('kill -INT {0}'.format(self.pid))
+
+    def wait(self):
+        """Wait tcpdump to exit and collect statistics"""
+        if self._thread is not None:
+            self._thread.join(self.timeout)
+            if self._thread.is_alive():
+                self._chan.close()
+                raise CaptureError('tcpdump on {0} is not stopped'.format(
+                    self.remote.host))
+        self._chan.settimeout(self.timeout)
+        stderr = self._stderr.read()
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode('utf-8', 'replace')
+        self.stderr += stderr
+        self.exit_code = self._chan.recv_exit_status()
+        self._chan.close()
+        self.writer.close()
+        self.stats = {STATS_NAMES[name]: int(value)
+                      for value, name in STATS_RE.findall(self.stderr)}
+        logger.debug('tcpdump on {0} is stopped: {1}'.format(
+            self.remote.host, self.stats))
+        if self.stats.get('dropped'):
+            logger.warning('{0} packets are dropped by kernel on {1}'.format(
+                self.stats['dropped'], self.remote.host))
+        if self._error is not None:
+            raise CaptureError('Capture on {0} is failed: {1}'.format(
+                self.remote.host, self._error))
+
+    def stop(self):
+        self.signal()
+        self.wait()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *err):
+        self.stop()
+
+    def index(self):
+        """Return PcapIndex for in-memory or last file capture"""
+        if self.writer.path is None:
+            return PcapIndex.from_bytes(self.writer.getvalue())
+        return PcapIndex.from_file(self.writer.path)
+
+
+@contextlib.contextmanager
+def capture_together(captures):
+    """Start captures before enter and stop all of them after
+
+    tcpdump processes are signalled all together, before waiting of exit.
+    """
+    started = []
+    try:
+        for capture in captures:
+            started.append(capture.start())
+        yield captures
+    finally:
+        for capture in started:
+            capture.signal()
+        for capture in started:
+            capture.wait()
@@ -0,0 +1,179 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Resident helper, which runs OpenStack CLI clients in one process
+
+This script is uploaded to controller and started by `os_cli.CLISession`
+with sourced openrc. Clients are imported once and called in-process, so
+interpreter startup and imports are paid once per session. Keystone token
+for `openstack` client is cached for each credentials.
+
+Requests are JSON lines on stdin:
+
+    {"id": 1, "argv": ["openstack", "user", "list"], "env": {}}
+
+Each response is one line on stdout, prefixed with marker (lines without
+marker are printed by clients directly to file descriptor and must be
+skipped):
+
+    __MOS_CLI__ {"id": 1, "exit_code": 0, "stdout": "...", "stderr": ""}
+"""
+
+import json
+import logging
+import os
+import sys
+import traceback
+
+import pkg_resources
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+MARKER = '__MOS_CLI__'
+
+# Substrings of keystone errors in stderr, which mean cached token is not
+# valid anymore
+AUTH_ERRORS = ('The request you have made requires authentication',
+               '(HTTP 401)')
+
+# Credentials variables, conflicting with token authentication
+PASSWORD_AUTH_VARS = ('OS_USERNAME', 'OS_PASSWORD', 'OS_USER_DOMAIN_NAME',
+                      'OS_USER_ID')
+
+
+class NoInput(StringIO):
+    """Stdin replacement, which looks like terminal without data
+
+    Clients (glance image-create, for example) read data from stdin if it
+    is not a terminal.
+    """
+
+    def isatty(self):
+        return True
+
+
+_mains = {}
+_tokens = {}
+
+
+def get_main(name):
+    """Return console script entry point function or None"""
+    if name not in _mains:
+        entry_point = next(
+            pkg_resources.iter_entry_points('console_scripts', name), None)
+        # Requirements are not checked to not fail on distro packages
+        _mains[name] = (entry_point.load(require=False)
+                        if entry_point else None)
+    return _mains[name]
+
+
+def run(argv, env):
+    """Run client in-process and return exit code, stdout and stderr"""
+    main = get_main(argv[0])
+    if main is None:
+        return 127, '', '{0}: command not found\n'.format(argv[0])
+    saved = (sys.argv, sys.stdin, sys.stdout, sys.stderr)
+    saved_environ = dict(os.environ)
+    saved_handlers = list(logging.root.handlers)
+    saved_level = logging.root.level
+    stdout, stderr = StringIO(), StringIO()
+    for key, value in env.items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
+    sys.argv = list(argv)
+    sys.stdin, sys.stdout, sys.stderr = NoInput(), stdout, stderr
+    exit_code = 0
+    try:
+        result = main()
+        if isinstance(result, int):
+            exit_code = result
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            exit_code = e.code or 0
+        else:
+            stderr.write('{0}\n'.format(e.code))
+            exit_code = 1
+    except Exception:
+        traceback.print_exc(file=stderr)
+        exit_code = 1
+    finally:
+        sys.argv, sys.stdin, sys.stdout, sys.stderr = saved
+        os.environ.clear()
+        os.environ.update(saved_environ)
+        # Clients configure logging on each run
+        logging.root.handlers = saved_handlers
+        logging.root.setLevel(saved_level)
+    return exit_code, stdout.getvalue(), stderr.getvalue()
+
+
+def get_credentials_key(env):
+    merged = dict(os.environ, **{k: v for k, v in env.items() if v})
+    return tuple(merged.get(x) for x in ('OS_AUTH_URL', 'OS_USERNAME',
+                                         'OS_TENANT_NAME', 'OS_PROJECT_NAME'))
+
+
+def run_with_token(argv, env):
+    """Run `openstack` command with cached token
+
+    Token is requested on first call for each credentials and is dropped
+    if command fails with authentication error.
+    """
+    key = get_credentials_key(env)
+    if key not in _tokens:
+        exit_code, stdout, _ = run(
+            ['openstack', 'token', 'issue', '-f', 'value', '-c', 'id'], env)
+        if exit_code != 0:
+            return run(argv, env)
+        _tokens[key] = stdout.strip()
+    token_env = dict(env, OS_AUTH_TYPE='token', OS_TOKEN=_tokens[key])
+    for name in PASSWORD_AUTH_VARS:
+        token_env[name] = None
+    exit_code, stdout, stderr = run(argv, token_env)
+    if exit_code != 0 and any(x in stderr for x in AUTH_ERRORS):
+        _tokens.pop(key, None)
+        return run(argv, env)
+    return exit_code, stdout, stderr
+
+
+def respond(data):
+    sys.stdout.write('{0} {1}\n'.format(MARKER, json.dumps(data)))
+    sys.stdout.flush()
+
+
+def serve():
+    respond({'id': 0, 'ready': True})
+    for line in iter(sys.stdin.readline, ''):
+        line = line.strip()
+        if not line:
+            continue
+        request = json.loads(line)
+        argv, env = request['argv'], request.get('env', {})
+        try:
+            if argv[0] == 'openstack':
+                exit_code, stdout, stderr = run_with_token(argv, env)
+            else:
+                exit_code, stdout, stderr = run(argv, env)
+        except Exception:
+            exit_code, stdout, stderr = 1, '', traceback.format_exc()
+        respond({'id': request['id'], 'exit_code': exit_code,
+                 'stdout': stdout, 'stderr': stderr})
+
+
+if __name__ == '__main__':
+    serve()
@@ -12,8 +12,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import importlib
 import inspect
 import logging
+from multiprocessing.pool import ThreadPool
 import os
 import socket
 from tempfile import NamedTemporaryFile
@@ -631,6 +633,49 @@ def wait(*args, **kwargs):
         raise e
 
 
+class LazyModule(object):
+    """Module proxy, which imports module on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __repr__(self):
+        return '<LazyModule {0}>'.format(self._name)
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def lazy_import(name):
+    """Return proxy to module, which will be imported on first use
+
+    Used to avoid heavy modules import on tests collection.
+    """
+    return LazyModule(name)
+
+
+def parallel_map(func, iterable, max_workers=None):
+    """Apply func to each item of iterable concurrently in threads
+
+    :param func: callable with single argument
+    :param iterable: items to process
+    :param max_workers: threads count, one thread per item by default
+    :return: list with results in the same order as items
+    """
+    items = list(iterable)
+    if len(items) == 0:
+        return []
+    pool = ThreadPool(max_workers or len(items))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def gen_random_resource_name(prefix=None, reduce_by=None):
     random_name = str(uuid.uuid4()).replace('-', '')[::reduce_by]
     if prefix:
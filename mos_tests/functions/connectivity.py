@@ -0,0 +1,366 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Connectivity monitoring with ping or TCP connect probes
+
+    with ConnectivityMonitor('10.0.0.4', remote=remote) as monitor:
+        monitor.wait_stable(10)
+        monitor.mark('ban')
+        ban_l3_agent()
+        monitor.wait_stable(50)
+    logger.info(monitor.timeline('ban'))
+    assert monitor.time_to_recover('ban') < 10
+
+Times of all probes are stored in local clock, so they can be compared
+with `time.time()` and events of monitors on different hosts.
+"""
+
+import array
+import contextlib
+import logging
+import re
+import shlex
+import signal
+import socket
+import subprocess
+import threading
+import time
+
+import six
+
+from mos_tests.functions.common import lazy_import
+from mos_tests.functions.common import wait
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+# Reply line of iputils (with optional -D timestamp) or busybox ping
+PING_REPLY = re.compile(
+    r'^(?:\[(?P<timestamp>\d+\.\d+)\] )?\d+ bytes from .*?seq=(?P<seq>\d+) '
+    r'.*?time=(?P<rtt>[\d.]+) ms')
+# iputils ping -O line about lost reply
+PING_LOST = re.compile(r'no answer yet for icmp_seq=(?P<seq>\d+)')
+
+NAN = float('nan')
+
+
+class ProbeLog(object):
+    """Compact log of probes send time and round trip time
+
+    Probes are indexed by sequence number, lost probes have NaN rtt. Send
+    time of probes without reply is interpolated from neighbours.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.first_seq = None
+        self.sent = array.array('d')
+        self.rtt = array.array('d')
+        # Added to send times to convert them to local clock
+        self.clock_offset = 0.0
+        self._offset_known = False
+        self.ok_streak = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sent)
+
+    def _extend(self, index):
+        missing = index + 1 - len(self.sent)
+        if missing > 0:
+            self.sent.extend([NAN] * missing)
+            self.rtt.extend([NAN] * missing)
+            if missing > 1:
+                self.ok_streak = 0
+
+    def add(self, seq, sent_at, rtt):
+        """Add probe result, rtt is None for lost probe"""
+        with self._lock:
+            if self.first_seq is None:
+                self.first_seq = seq
+            index = seq - self.first_seq
+            if index < 0:
+                return
+            self._extend(index)
+            self.sent[index] = sent_at
+            if rtt is None:
+                self.ok_streak = 0
+            else:
+                self.rtt[index] = rtt
+                if index == len(self.sent) - 1:
+                    self.ok_streak += 1
+
+    def probes(self):
+        """Return arrays of send times (in local clock) and success flags"""
+        with self._lock:
+            sent = np.array(self.sent, dtype=np.float64)
+            rtt = np.array(self.rtt, dtype=np.float64)
+        known = ~np.isnan(sent)
+        if known.any() and not known.all():
+            indexes = np.arange(len(sent))
+            if known.sum() > 1:
+                sent = np.interp(indexes, indexes[known], sent[known])
+            else:
+                start = indexes[known][0]
+                sent = sent[known][0] + (indexes - start) * self.interval
+        return sent + self.clock_offset, ~np.isnan(rtt)
+
+    def outages(self, start=None, end=None):
+        """Return list of (start, end, lost probes count) of outages
+
+        Outage is continuous sequence of lost probes, it starts at first lost
+        probe send time and ends at send time of next success probe (None,
+        if connectivity is not recovered).
+        """
+        sent, ok = self.probes()
+        result = []
+        lost = np.flatnonzero(~ok)
+        if len(lost) == 0:
+            return result
+        # Split lost probes indexes to continuous groups
+        breaks = np.flatnonzero(np.diff(lost) != 1) + 1
+        for group in np.split(lost, breaks):
+            first, last = group[0], group[-1]
+            outage_end = sent[last + 1] if last + 1 < len(sent) else None
+            if start is not None and (outage_end or np.inf) < start:
+                continue
+            if end is not None and sent[first] > end:
+                continue
+            result.append((sent[first], outage_end, len(group)))
+        return result
+
+    def stats(self, start=None, end=None):
+        """Return dict with probes statistics in time range"""
+        sent, ok = self.probes()
+        mask = np.ones(len(sent), dtype=bool)
+        if start is not None:
+            mask &= sent >= start
+        if end is not None:
+            mask &= sent <= end
+        sent_count = int(mask.sum())
+        received = int((ok & mask).sum())
+        outages = self.outages(start, end)
+        durations = [(x[1] or sent[-1]) - x[0] for x in outages]
+        return {
+            'sent': sent_count,
+            'received': received,
+            'loss': (100.0 * (sent_count - received) / sent_count
+                     if sent_count else 0.0),
+            'outages': len(outages),
+            'longest_outage': max(durations) if durations else 0.0,
+        }
+
+    def time_to_recover(self, at):
+        """Return seconds from `at` to end of first next outage
+
+        Return 0 if there is no outages after `at` and None if
+        connectivity is not recovered.
+        """
+        for outage_start, outage_end, _ in self.outages(start=at):
+            if outage_end is None:
+                return None
+            return max(outage_end - at, 0.0)
+        return 0.0
+
+    def timeline(self, at, before=5.0, after=30.0):
+        """Return line of probes around `at` time
+
+        `.` is success probe, `x` is lost, `|` marks `at` moment.
+        """
+        sent, ok = self.probes()
+        mask = (sent >= at - before) & (sent <= at + after)
+        chars = []
+        marked = False
+        for sent_at, success in zip(sent[mask], ok[mask]):
+            if not marked and sent_at >= at:
+                chars.append('|')
+                marked = True
+            chars.append('.' if success else 'x')
+        if not marked:
+            chars.append('|')
+        return ''.join(chars)
+
+
+class ConnectivityMonitor(ProbeLog):
+    """Background probes of target availability
+
+    By default ping is used, it's executed on `remote` (SSHClient) or on
+    local host if remote is None. `prefix` is prepended to ping command
+    (`ip netns exec <ns>`, for example). If `port` is set, TCP connect
+    probes are made from local host instead of ping.
+
+    :param timestamps: use iputils ping `-D -O` flags, which are not
+        supported by busybox ping (cirros VMs)
+    """
+
+    def __init__(self, target, remote=None, interval=1.0, prefix='',
+                 port=None, timestamps=True, timeout=1, name=None):
+        super(ConnectivityMonitor, self).__init__(interval=interval)
+        self.target = target
+        self.remote = remote
+        self.prefix = prefix
+        self.port = port
+        self.timestamps = timestamps
+        self.timeout = timeout
+        self.name = name or '{0} -> {1}'.format(
+            getattr(remote, 'host', 'localhost'), target)
+        self.events = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._pid = None
+        self._proc = None
+        self._chan = None
+
+    def __repr__(self):
+        return '<ConnectivityMonitor {0}>'.format(self.name)
+
+    @property
+    def command(self):
+        flags = ['-n']
+        if self.timestamps:
+            flags.append('-D -O')
+        if self.interval != 1:
+            flags.append('-i {0}'.format(self.interval))
+        ping = '{prefix} ping {flags} -W {timeout} {target}'.format(
+            prefix=self.prefix, flags=' '.join(flags), timeout=self.timeout,
+            target=self.target)
+        # Shell pid is printed before exec, so it's exact ping pid
+        return 'sh -c {0}'.format(six.moves.shlex_quote(
+            'echo $$; exec ' + ping.strip()))
+
+    def mark(self, event):
+        """Save event time to analyse probes around it"""
+        self.events[event] = time.time()
+        return self.events[event]
+
+    def _get_time(self, at):
+        return self.events.get(at, at)
+
+    def time_to_recover(self, at):
+        return super(ConnectivityMonitor, self).time_to_recover(
+            self._get_time(at))
+
+    def timeline(self, at, before=5.0, after=30.0):
+        return super(ConnectivityMonitor, self).timeline(
+            self._get_time(at), before=before, after=after)
+
+    def start(self):
+        if self.port is not None:
+            self._thread = threading.Thread(target=self._run_tcp)
+        else:
+            if self.remote is None:
+                # No outer shell, so SIGINT on stop is received by ping
+                self._proc = subprocess.Popen(
+                    shlex.split(self.command), stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT)
+                stdout = self._proc.stdout
+            else:
+                self._chan, _, stdout, _ = self.remote.execute_async(
+                    self.command, merge_stderr=True)
+            self._pid = int(stdout.readline())
+            self._thread = threading.Thread(target=self._read_ping,
+                                            args=(stdout,))
+        self._thread.daemon = True
+        self._thread.start()
+        logger.debug('Connectivity monitor {0} is started'.format(self.name))
+        return self
+
+    def add_ping_line(self, line, received_at=None):
+        """Parse ping output line and add probe"""
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        match = PING_REPLY.search(line)
+        if match is None:
+            match = PING_LOST.search(line)
+            if match is not None:
+                self.add(int(match.group('seq')), NAN, None)
+            return
+        if received_at is None:
+            received_at = time.time()
+        rtt = float(match.group('rtt')) / 1000
+        timestamp = match.group('timestamp')
+        if timestamp is None:
+            sent_at = received_at - rtt
+        else:
+            # Remote clock is converted with min observed delay
+            timestamp = float(timestamp)
+            offset = received_at - timestamp
+            if not self._offset_known or offset < self.clock_offset:
+                self.clock_offset = offset
+                self._offset_known = True
+            sent_at = timestamp - rtt
+        self.add(int(match.group('seq')), sent_at, rtt)
+
+    def _read_ping(self, stdout):
+        for line in iter(stdout.readline, b''):
+            self.add_ping_line(line)
+
+    def _run_tcp(self):
+        seq = 0
+        next_at = time.time()
+        while not self._stop.is_set():
+            sent_at = time.time()
+            try:
+                sock = socket.create_connection((self.target, self.port),
+                                                timeout=self.timeout)
+                sock.close()
+                rtt = time.time() - sent_at
+            except (socket.error, socket.timeout):
+                rtt = None
+            self.add(seq, sent_at, rtt)
+            seq += 1
+            next_at += self.interval
+            self._stop.wait(max(next_at - time.time(), 0))
+
+    def stop(self):
+        self._stop.set()
+        if self._proc is not None:
+            self._proc.send_signal(signal.SIGINT)
+            self._proc.wait()
+        elif self._pid is not None:
+            self.remote.execute('kill -INT {0}'.format(self._pid))
+        if self._thread is not None:
+            self._thread.join(self.timeout + 10)
+        if self._chan is not None:
+            self._chan.close()
+        logger.debug('Connectivity monitor {0} is stopped: {1}'.format(
+            self.name, self.stats()))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *err):
+        self.stop()
+
+    def wait_stable(self, count, timeout=5 * 60):
+        """Wait for `count` success probes in a row"""
+        wait(lambda: self.ok_streak >= count,
+             timeout_seconds=timeout,
+             sleep_seconds=self.interval,
+             waiting_for='{0} success probes in a row for {1}'.format(
+                 count, self.name))
+
+
+@contextlib.contextmanager
+def monitor_together(monitors):
+    """Start all monitors before enter and stop them after"""
+    started = []
+    try:
+        for monitor in monitors:
+            started.append(monitor.start())
+        yield monitors
+    finally:
+        for monitor in started:
+            monitor.stop()
@@ -0,0 +1,351 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Conntrack table snapshots and events
+
+Filters are passed to `conntrack` (so kernel dumps only matched entries),
+entries are parsed to numpy record array with fields from `DTYPE`:
+
+    with compute.ssh() as remote:
+        table = snapshot(remote, protocol='icmp', src='10.0.0.4')
+    zones = table.zones()
+    replied = table.select(table.match(unreplied=False))
+
+Events are streamed over SSH channel:
+
+    with ConntrackEvents(remote, events='NEW', protocol='icmp') as events:
+        start_ping()
+        events.wait(lambda table: len(table.zones()) == 2)
+"""
+
+import logging
+import re
+import threading
+import time
+
+import six
+
+from mos_tests.functions.common import lazy_import
+from mos_tests.functions.common import wait
+from mos_tests.functions.pcap import int_to_ip
+from mos_tests.functions.pcap import ip_to_int
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+PROTOCOLS = {'icmp': 1, 'tcp': 6, 'udp': 17}
+
+# TCP states, index in tuple is stored in `state` field (0 for none)
+STATES = ('', 'NONE', 'SYN_SENT', 'SYN_RECV', 'ESTABLISHED', 'FIN_WAIT',
+          'CLOSE_WAIT', 'LAST_ACK', 'TIME_WAIT', 'CLOSE', 'LISTEN',
+          'SYN_SENT2')
+
+EVENTS = ('', 'NEW', 'UPDATE', 'DESTROY')
+
+ADDRESS_FIELDS = ('src', 'dst', 'reply_src', 'reply_dst')
+
+# Entry in plain, extended (`-o extended`) or event (`-E`, optionally with
+# `-o timestamp`) format. IPv6 entries are not matched.
+ENTRY_RE = re.compile(
+    r'^(?:\s*\[[\d.]+\])?(?:\s*\[(?P<event>[A-Z]+)\])?\s*'
+    r'(?:ipv4\s+\d+\s+)?[a-z\-]+\s+(?P<proto>\d+)\s+'
+    r'(?:(?P<timeout>\d+)\s+)?(?:(?P<state>[A-Z_]+2?)\s+)?'
+    r'src=(?P<src>[\d.]+) dst=(?P<dst>[\d.]+) '
+    r'(?:sport=(?P<sport>\d+) dport=(?P<dport>\d+) )?'
+    r'(?:type=(?P<type>\d+) code=(?P<code>\d+) id=(?P<id>\d+) )?'
+    r'[^\n]*?(?P<unreplied>\[UNREPLIED\] )?'
+    r'src=(?P<reply_src>[\d.]+) dst=(?P<reply_dst>[\d.]+)'
+    r'(?: sport=(?P<reply_sport>\d+) dport=(?P<reply_dport>\d+))?'
+    r'(?: type=(?P<reply_type>\d+) code=(?P<reply_code>\d+) '
+    r'id=(?P<reply_id>\d+))?'
+    r'(?P<assured> \[ASSURED\])?'
+    r'(?:[^\n]*? mark=(?P<mark>\d+))?(?:[^\n]*? zone=(?P<zone>\d+))?',
+    re.M)
+ENTRY_GROUPS = sorted(ENTRY_RE.groupindex, key=ENTRY_RE.groupindex.get)
+
+DTYPE = [
+    ('proto', 'u1'),
+    ('timeout', 'i4'),
+    ('state', 'u1'),
+    ('src', 'u4'),
+    ('dst', 'u4'),
+    ('sport', 'i4'),
+    ('dport', 'i4'),
+    ('type', 'i2'),
+    ('code', 'i2'),
+    ('id', 'i4'),
+    ('reply_src', 'u4'),
+    ('reply_dst', 'u4'),
+    ('reply_sport', 'i4'),
+    ('reply_dport', 'i4'),
+    ('reply_type', 'i2'),
+    ('reply_code', 'i2'),
+    ('reply_id', 'i4'),
+    ('unreplied', '?'),
+    ('assured', '?'),
+    ('mark', 'u4'),
+    ('zone', 'u2'),
+    ('event', 'u1'),
+    ('received_at', 'f8'),
+]
+
+# Fields, which identify connection
+KEY_FIELDS = ('proto', 'zone', 'src', 'dst', 'sport', 'dport', 'type',
+              'code', 'id')
+
+
+class ConntrackError(Exception):
+    pass
+
+
+def build_command(action='-L', protocol=None, src=None, dst=None, zone=None,
+                  events=None):
+    """Return conntrack command with filters
+
+    :param action: '-L' to list entries, '-E' to watch events
+    :param events: comma separated event types for '-E' ('NEW,DESTROY')
+    """
+    parts = ['conntrack', action]
+    if events is not None:
+        parts.append('-e {0}'.format(events))
+    if protocol is not None:
+        parts.append('-p {0}'.format(protocol))
+    if src is not None:
+        parts.append('-s {0}'.format(src))
+    if dst is not None:
+        parts.append('-d {0}'.format(dst))
+    if zone is not None:
+        parts.append('-w {0}'.format(zone))
+    return ' '.join(parts)
+
+
+def parse_entries(text):
+    """Return list of tuples with `ENTRY_GROUPS` strings"""
+    return ENTRY_RE.findall(text)
+
+
+def _convert_column(values, convert):
+    # Values are highly repeated, so each one is converted once
+    converted = {x: convert(x) for x in set(values)}
+    return [converted[x] for x in values]
+
+
+def to_records(entries, received_at=0.0):
+    """Convert parsed entries to numpy record array with `DTYPE` fields
+
+    :param received_at: time for all entries or sequence of times
+    """
+    records = np.zeros(len(entries), dtype=DTYPE)
+    if len(entries) == 0:
+        return records
+    for name, values in zip(ENTRY_GROUPS, zip(*entries)):
+        if name in ADDRESS_FIELDS:
+            convert = ip_to_int
+        elif name == 'state':
+            convert = lambda x: STATES.index(x) if x in STATES else 0
+        elif name == 'event':
+            convert = lambda x: EVENTS.index(x) if x in EVENTS else 0
+        elif name in ('unreplied', 'assured'):
+            convert = bool
+        elif name in ('mark', 'zone'):
+            convert = lambda x: int(x or 0)
+        else:
+            convert = lambda x: int(x or -1)
+        records[name] = _convert_column(values, convert)
+    records['received_at'] = received_at
+    return records
+
+
+class ConntrackTable(object):
+    """Conntrack entries as numpy record array"""
+
+    def __init__(self, records):
+        self.records = records
+
+    @classmethod
+    def from_text(cls, text, received_at=0.0):
+        if isinstance(text, bytes):
+            text = text.decode('utf-8', 'replace')
+        return cls(to_records(parse_entries(text), received_at))
+
+    @classmethod
+    def from_lines(cls, lines, received_at=0.0):
+        return cls.from_text('\n'.join(x.rstrip('\n') for x in lines),
+                             received_at)
+
+    def __len__(self):
+        return len(self.records)
+
+    def match(self, protocol=None, state=None, event=None, **conditions):
+        """Return boolean array of entries matched all conditions
+
+        Conditions are `DTYPE` fields values, addresses can be strings.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if protocol is not None:
+            conditions['proto'] = PROTOCOLS.get(protocol, protocol)
+        if state is not None:
+            conditions['state'] = STATES.index(state)
+        if event is not None:
+            conditions['event'] = EVENTS.index(event)
+        for name, value in conditions.items():
+            if name in ADDRESS_FIELDS and isinstance(value,
+                                                     six.string_types):
+                value = ip_to_int(value)
+            mask &= self.records[name] == value
+        return mask
+
+    def count(self, **conditions):
+        return int(self.match(**conditions).sum())
+
+    def select(self, mask):
+        return self.__class__(self.records[mask])
+
+    def zones(self):
+        return set(int(x) for x in np.unique(self.records['zone']))
+
+    def keys(self):
+        """Return list of connections keys (see `KEY_FIELDS`)"""
+        columns = [self.records[x].tolist() for x in KEY_FIELDS]
+        return list(zip(*columns))
+
+    def diff(self, other):
+        """Return (added, removed) tables of `other` relative to self"""
+        keys = set(self.keys())
+        other_keys = set(other.keys())
+        added = np.array([x not in keys for x in other.keys()], dtype=bool)
+        removed = np.array([x not in other_keys for x in self.keys()],
+                           dtype=bool)
+        return other.select(added), self.select(removed)
+
+    def describe(self, limit=20):
+        """Return text with first `limit` entries"""
+        lines = []
+        for record in self.records[:limit]:
+            parts = ['proto={0}'.format(record['proto'])]
+            if record['state']:
+                parts.append(STATES[record['state']])
+            for prefix in ('', 'reply_'):
+                parts.append('{0}>{1}'.format(
+                    int_to_ip(record[prefix + 'src']),
+                    int_to_ip(record[prefix + 'dst'])))
+            if record['id'] != -1:
+                parts.append('id={0}'.format(record['id']))
+            if record['unreplied']:
+                parts.append('UNREPLIED')
+            parts.append('zone={0}'.format(record['zone']))
+            lines.append(' '.join(parts))
+        if len(self) > limit:
+            lines.append('... {0} more entries'.format(len(self) - limit))
+        return '\n'.join(lines)
+
+
+def snapshot(remote, **filters):
+    """Return ConntrackTable of entries, matched filters
+
+    :param filters: `build_command` filters
+    """
+    command = build_command('-L', **filters)
+    result = remote.execute(command, verbose=False)
+    if result['exit_code'] != 0:
+        raise ConntrackError('{0} is failed: {1}'.format(
+            command, ''.join(result['stderr'])))
+    table = ConntrackTable.from_lines(result['stdout'], time.time())
+    logger.debug('{0} conntrack entries are read from {1}'.format(
+        len(table), getattr(remote, 'host', remote)))
+    return table
+
+
+class ConntrackEvents(object):
+    """`conntrack -E` on remote node, events are collected in background
+
+    Each event is stored as entry with `event` type and local
+    `received_at` time.
+    """
+
+    def __init__(self, remote, events=None, timeout=60, **filters):
+        self.remote = remote
+        self.command = build_command('-E', events=events, **filters)
+        self.timeout = timeout
+        self.pid = None
+        self._entries = []
+        self._times = []
+        self._lock = threading.Lock()
+        self._chan = None
+        self._thread = None
+
+    def start(self):
+        # Shell pid is printed before exec, so it's exact conntrack pid
+        command = 'sh -c {0}'.format(six.moves.shlex_quote(
+            'echo $$; exec ' + self.command))
+        self._chan, _, stdout, _ = self.remote.execute_async(
+            command, merge_stderr=True)
+        self.pid = int(stdout.readline())
+        self._thread = threading.Thread(target=self._read, args=(stdout,))
+        self._thread.daemon = True
+        self._thread.start()
+        logger.debug('{0} is started on {1}'.format(self.command,
+                                                    self.remote.host))
+        return self
+
+    def _read(self, stdout):
+        for line in iter(stdout.readline, b''):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', 'replace')
+            if not line:
+                break
+            entries = parse_entries(line)
+            if entries:
+                with self._lock:
+                    self._entries.extend(entries)
+                    self._times.extend([time.time()] * len(entries))
+
+    def table(self):
+        """Return ConntrackTable of events received so far"""
+        with self._lock:
+            entries, times = list(self._entries), list(self._times)
+        return ConntrackTable(to_records(entries, times))
+
+    def wait(self, predicate, timeout=60, waiting_for='conntrack events'):
+        """Wait for `predicate(table)` is True and return table"""
+        result = []
+
+        def check():
+            table = self.table()
+            if predicate(table):
+                result.append(table)
+                return True
+            return False
+
+        wait(check, timeout_seconds=timeout, sleep_seconds=0.5,
+             waiting_for=waiting_for)
+        return result[-1]
+
+    def stop(self):
+        if self.pid is not None:
+            self.remote.execute('kill -INT {0}'.format(self.pid))
+            self.pid = None
+        if self._thread is not None:
+            self._thread.join(self.timeout)
+        if self._chan is not None:
+            self._chan.close()
+        logger.debug('{0} events are received by {1}'.format(
+            len(self._entries), self.command))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *err):
+        self.stop()
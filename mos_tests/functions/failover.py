@@ -0,0 +1,334 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""L3 HA failover measurement
+
+Router states (`ha_state` of l3 agents from neutron API and keepalived
+state on controllers) are polled in background together with connectivity
+monitor, fault injection time is marked, and all timings are reported in
+milliseconds relative to it:
+
+    measurement = FailoverMeasurement(
+        [ha_state_tracker(os_conn, router_id)] +
+        [keepalived_tracker(x, router_id) for x in controllers])
+    measurement.monitor = ConnectivityMonitor(floating_ip)
+    with measurement:
+        measurement.monitor.wait_stable(10)
+        measurement.mark('ban')
+        ban_l3_agent()
+        measurement.monitor.wait_stable(50)
+    report = measurement.report('ban')
+    logger.info(report)
+    assert report.downtime_ms < 10000
+"""
+
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVED_STATE = '/var/lib/neutron/ha_confs/{router_id}/state'
+
+
+class StateTracker(object):
+    """Background polling of states, only changes are stored
+
+    `get_states` returns dict with state of each key (host, usually). If it
+    raises, poll is skipped and last known states are kept. Change time is
+    the middle of poll request.
+
+    :param active_state: state of key, which serves router
+    """
+
+    def __init__(self, name, get_states, interval=0.5, active_state=None):
+        self.name = name
+        self.get_states = get_states
+        self.interval = interval
+        self.active_state = active_state
+        # List of (time, key, state)
+        self.transitions = []
+        self._states = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return '<StateTracker {0}>'.format(self.name)
+
+    def poll(self):
+        started_at = time.time()
+        try:
+            states = self.get_states()
+        except Exception as e:
+            logger.debug('{0} poll is failed: {1}'.format(self.name, e))
+            return
+        observed_at = (started_at + time.time()) / 2
+        with self._lock:
+            for key, state in sorted(states.items()):
+                if key in self._states and self._states[key] == state:
+                    continue
+                self._states[key] = state
+                self.transitions.append((observed_at, key, state))
+
+    def states(self):
+        """Return dict with last known state of each key"""
+        with self._lock:
+            return dict(self._states)
+
+    def transitions_after(self, at):
+        """Return list of (seconds from `at`, key, state) changes"""
+        with self._lock:
+            return [(x[0] - at, x[1], x[2]) for x in self.transitions
+                    if x[0] >= at]
+
+    def first(self, state, at):
+        """Return seconds from `at` to first change of any key to `state`
+
+        Keys, which are in `state` at `at` moment, are skipped even if they
+        leave it and return back later. Return None, if there is no such
+        change.
+        """
+        with self._lock:
+            transitions = list(self.transitions)
+        states_at = {}
+        for changed_at, key, key_state in transitions:
+            if changed_at < at:
+                states_at[key] = key_state
+            elif key_state == state and states_at.get(key) != state:
+                return changed_at - at
+        return None
+
+    def _run(self):
+        next_at = time.time()
+        while not self._stop.is_set():
+            self.poll()
+            next_at += self.interval
+            self._stop.wait(max(next_at - time.time(), 0))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        # Poll of destroyed node may hang, so thread is not waited forever
+        if self._thread is not None:
+            self._thread.join(self.interval + 10)
+        close = getattr(self.get_states, 'close', None)
+        if close is not None:
+            close()
+        logger.debug('{0} is stopped with {1} transitions'.format(
+            self.name, len(self.transitions)))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *err):
+        self.stop()
+
+
+def ha_state_tracker(os_conn, router_id, interval=1):
+    """Return StateTracker of l3 agents `ha_state` for router
+
+    State is 'dead' for agents, which are not alive.
+    """
+    def get_states():
+        agents = os_conn.get_l3_for_router(router_id)['agents']
+        return {x['host']: x['ha_state'] if x['alive'] else 'dead'
+                for x in agents}
+
+    return StateTracker('ha_state', get_states,
+                        interval=interval, active_state='active')
+
+
+class KeepalivedState(object):
+    """Keepalived state of router on node, read over single SSH session
+
+    Session is reopened after errors, but not more often than
+    `reconnect_delay`, so dead node doesn't block polling for long. No
+    state is returned while waiting for reconnect. State is 'missing' if
+    router is not hosted on node.
+    """
+
+    def __init__(self, node, router_id, reconnect_delay=5):
+        self.node = node
+        self.fqdn = node.data['fqdn']
+        self.command = 'cat {0}'.format(
+            KEEPALIVED_STATE.format(router_id=router_id))
+        self.reconnect_delay = reconnect_delay
+        self._remote = None
+        self._connect_at = 0
+
+    def __call__(self):
+        if self._remote is None:
+            if time.time() < self._connect_at:
+                return {}
+            self._connect_at = time.time() + self.reconnect_delay
+            self._remote = self.node.ssh().__enter__()
+        try:
+            result = self._remote.execute(self.command, verbose=False)
+        except Exception:
+            self.close()
+            raise
+        if not result.is_ok:
+            return {self.fqdn: 'missing'}
+        return {self.fqdn: result.stdout_string.strip()}
+
+    def close(self):
+        if self._remote is not None:
+            self._remote.clear()
+            self._remote = None
+
+
+def keepalived_tracker(node, router_id, interval=0.5):
+    """Return StateTracker of keepalived router state on node"""
+    return StateTracker('keepalived on {0}'.format(node.data['fqdn']),
+                        KeepalivedState(node, router_id), interval=interval,
+                        active_state='master')
+
+
+class FailoverReport(object):
+    """Failover timings relative to fault injection, in milliseconds
+
+    Downtime is total time of outages of connectivity monitor, which are
+    ended (or not recovered) after fault. Precision of it is probes
+    interval (`resolution_ms`).
+    """
+
+    def __init__(self, event, downtime_ms, longest_outage_ms, lost,
+                 recovered, resolution_ms, switchover_ms, transitions):
+        self.event = event
+        self.downtime_ms = downtime_ms
+        self.longest_outage_ms = longest_outage_ms
+        self.lost = lost
+        self.recovered = recovered
+        self.resolution_ms = resolution_ms
+        # Tracker name: ms to first new active key
+        self.switchover_ms = switchover_ms
+        # Tracker name: list of (ms, key, state)
+        self.transitions = transitions
+
+    def properties(self, prefix='failover'):
+        """Return list of (name, value) for junit xml report"""
+        prefix = '{0}.{1}'.format(prefix, self.event)
+        result = [
+            ('{0}.downtime_ms'.format(prefix), '{0:.0f}'.format(
+                self.downtime_ms)),
+            ('{0}.longest_outage_ms'.format(prefix), '{0:.0f}'.format(
+                self.longest_outage_ms)),
+            ('{0}.lost'.format(prefix), str(self.lost)),
+            ('{0}.recovered'.format(prefix), str(self.recovered)),
+            ('{0}.resolution_ms'.format(prefix), '{0:.0f}'.format(
+                self.resolution_ms)),
+        ]
+        for name, value in sorted(self.switchover_ms.items()):
+            if value is not None:
+                result.append(('{0}.switchover_ms.{1}'.format(
+                    prefix, re.sub(r'\W+', '_', name)),
+                    '{0:.0f}'.format(value)))
+        return result
+
+    def __str__(self):
+        lines = ['Failover after {0}: downtime {1:.0f}ms (longest outage '
+                 '{2:.0f}ms, {3} probes lost, resolution {4:.0f}ms)'
+                 '{5}'.format(self.event, self.downtime_ms,
+                              self.longest_outage_ms, self.lost,
+                              self.resolution_ms,
+                              '' if self.recovered else ', NOT RECOVERED')]
+        for name, transitions in sorted(self.transitions.items()):
+            switchover = self.switchover_ms.get(name)
+            lines.append('  {0}{1}:'.format(
+                name, '' if switchover is None else
+                ', new active in {0:.0f}ms'.format(switchover)))
+            for changed_at, key, state in transitions:
+                lines.append('    {0:+8.0f}ms {1}: {2}'.format(
+                    changed_at, key, state))
+        return '\n'.join(lines)
+
+
+class FailoverMeasurement(object):
+    """Connectivity monitor and state trackers, started and stopped together
+
+    :param monitor: ConnectivityMonitor, it can be set after creation
+    """
+
+    def __init__(self, trackers=(), monitor=None):
+        self.trackers = list(trackers)
+        self.monitor = monitor
+        self.events = {}
+        self._started = []
+
+    def mark(self, event):
+        """Save fault injection time"""
+        self.events[event] = time.time()
+        logger.info('Failover measurement: {0} at {1:.3f}'.format(
+            event, self.events[event]))
+        return self.events[event]
+
+    def start(self):
+        parts = self.trackers
+        if self.monitor is not None:
+            parts = [self.monitor] + parts
+        try:
+            for part in parts:
+                self._started.append(part.start())
+        except Exception:
+            self.stop()
+            raise
+        return self
+
+    def stop(self):
+        while self._started:
+            self._started.pop().stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *err):
+        self.stop()
+
+    def report(self, event):
+        """Return FailoverReport for marked event"""
+        at = self.events[event]
+        downtime = longest = 0.0
+        lost = 0
+        recovered = True
+        resolution = 0.0
+        if self.monitor is not None:
+            resolution = self.monitor.interval
+            sent, _ = self.monitor.probes()
+            for start, end, count in self.monitor.outages(start=at):
+                if end is None:
+                    recovered = False
+                    end = sent[-1]
+                downtime += end - start
+                longest = max(longest, end - start)
+                lost += count
+        switchover = {}
+        transitions = {}
+        for tracker in self.trackers:
+            transitions[tracker.name] = [
+                (x[0] * 1000, x[1], x[2])
+                for x in tracker.transitions_after(at)]
+            if tracker.active_state is not None:
+                value = tracker.first(tracker.active_state, at)
+                switchover[tracker.name] = (None if value is None else
+                                            value * 1000)
+        return FailoverReport(event, downtime * 1000, longest * 1000, lost,
+                              recovered, resolution * 1000, switchover,
+                              transitions)
@@ -0,0 +1,289 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Concurrent iperf measurements between many hosts pairs
+
+Servers of all pairs are started first (each pair has own port), then all
+clients are run together, so measurements overlap in time. iperf3 (JSON
+output) is used if it's installed on both hosts of pair, iperf (CSV output)
+otherwise:
+
+    results = run_iperf_matrix(
+        [(vm1, vm2, vm2_ip), (vm2, vm1, vm1_ip)],
+        connect=lambda vm: os_conn.ssh_to_instance(env, vm, keypair,
+                                                   username='ubuntu'))
+    for result in results:
+        assert result.stats(warmup=5)['mean'] <= limit, result
+
+Throughput is taken per interval, from client for TCP and from server (what
+is really received) for UDP.
+"""
+
+import csv
+import json
+import logging
+import time
+
+import six
+
+from mos_tests.functions.common import lazy_import
+from mos_tests.functions.common import parallel_map
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+BASE_PORT = 5201
+
+COMMANDS = {
+    'iperf3': {
+        'server': 'iperf3 -s -1 -J -p {port}',
+        'client': 'iperf3 -c {ip} -p {port} -t {duration} -i {interval} -J',
+        'udp_server': '',
+        'udp_client': ' -u -b {bandwidth}',
+    },
+    'iperf': {
+        'server': 'iperf -s -p {port} -y C -i {interval}',
+        'client': 'iperf -c {ip} -p {port} -t {duration} -i {interval} -y C',
+        'udp_server': ' -u',
+        'udp_client': ' -u -b {bandwidth}',
+    },
+}
+
+SERVER_LOG = '/tmp/iperf_{port}.log'
+START_SERVER = 'nohup {server} > {log} 2> {log}.err < /dev/null & echo $!'
+# iperf3 server exits after single test, iperf server is stopped by SIGINT
+STOP_SERVER = {
+    'iperf3': ('for i in $(seq 10); do kill -0 {pid} 2>/dev/null || break; '
+               'sleep 1; done; kill {pid} 2>/dev/null; cat {log}'),
+    'iperf': 'kill -INT {pid}; sleep 1; cat {log}',
+}
+
+
+class IperfError(Exception):
+    pass
+
+
+def parse_iperf3_json(output):
+    """Return lists of intervals start offsets and bits per second"""
+    if isinstance(output, (list, tuple)):
+        output = ''.join(output)
+    try:
+        data = json.loads(output)
+    except ValueError:
+        raise IperfError('Wrong iperf3 output: {0}'.format(output))
+    if data.get('error'):
+        raise IperfError(data['error'])
+    starts, bps = [], []
+    for interval in data.get('intervals', []):
+        total = interval['sum']
+        if total.get('omitted'):
+            continue
+        starts.append(total['start'])
+        bps.append(total['bits_per_second'])
+    return starts, bps
+
+
+def parse_iperf_csv(lines, interval=1):
+    """Return lists of intervals start offsets and bits per second
+
+    Summary lines (with time range of whole test) are skipped.
+    """
+    starts, bps = [], []
+    for row in csv.reader(x.strip() for x in lines):
+        if len(row) < 9 or '-' not in row[6]:
+            continue
+        start, end = [float(x) for x in row[6].split('-')]
+        if end - start > interval * 1.5:
+            continue
+        starts.append(start)
+        bps.append(float(row[8]))
+    return starts, bps
+
+
+class IperfResult(object):
+    """Per-interval throughput of single client
+
+    :param starts: intervals start offsets (seconds from test start)
+    :param bps: intervals throughput, bits per second
+    """
+
+    def __init__(self, name, starts, bps, tool='iperf3', udp=False):
+        self.name = name
+        self.tool = tool
+        self.udp = udp
+        self.starts = np.array(starts, dtype=np.float64)
+        self.bps = np.array(bps, dtype=np.float64)
+
+    def trimmed(self, warmup=0):
+        """Return throughput of intervals started after warm-up
+
+        All intervals are returned if test is shorter than warm-up.
+        """
+        values = self.bps[self.starts >= warmup]
+        return values if len(values) else self.bps
+
+    def stats(self, warmup=0):
+        """Return dict with mean, p5, p95, min and max throughput"""
+        values = self.trimmed(warmup)
+        if len(values) == 0:
+            raise IperfError('There are no results for {0}'.format(self.name))
+        p5, p95 = np.percentile(values, [5, 95])
+        return {
+            'intervals': len(values),
+            'mean': float(values.mean()),
+            'p5': float(p5),
+            'p95': float(p95),
+            'min': float(values.min()),
+            'max': float(values.max()),
+        }
+
+    def __str__(self):
+        if len(self.bps) == 0:
+            return '{0}: no results'.format(self.name)
+        stats = self.stats()
+        return ('{name} ({tool}, {proto}): mean {mean:.0f}, p5 {p5:.0f}, '
+                'p95 {p95:.0f} bits/s in {intervals} intervals').format(
+                    name=self.name, tool=self.tool,
+                    proto='udp' if self.udp else 'tcp', **stats)
+
+
+def detect_tool(remote):
+    result = remote.execute('command -v iperf3', verbose=False)
+    return 'iperf3' if result['exit_code'] == 0 else 'iperf'
+
+
+class IperfPair(object):
+    """Server and client of one measurement"""
+
+    def __init__(self, client, server, server_ip, port, udp=False,
+                 duration=30, interval=1, bandwidth='10M'):
+        self.client = client
+        self.server = server
+        self.server_ip = server_ip
+        self.port = port
+        self.udp = udp
+        self.duration = duration
+        self.interval = interval
+        self.bandwidth = bandwidth
+        self.tool = None
+        self.pid = None
+        self.log = SERVER_LOG.format(port=port)
+        self.client_output = None
+        self.server_output = None
+
+    @property
+    def name(self):
+        return '{0} -> {1}:{2}'.format(
+            getattr(self.client, 'name', six.text_type(self.client)),
+            self.server_ip, self.port)
+
+    def _format(self, kind):
+        commands = COMMANDS[self.tool]
+        udp = commands['udp_' + kind] if self.udp else ''
+        return (commands[kind] + udp).format(
+            ip=self.server_ip, port=self.port, duration=self.duration,
+            interval=self.interval, bandwidth=self.bandwidth)
+
+    def start_server(self, remote):
+        output = remote.check_call(
+            START_SERVER.format(server=self._format('server'), log=self.log),
+            verbose=False)
+        self.pid = int(output['stdout'][-1])
+
+    def run_client(self, remote):
+        command = self._format('client')
+        result = remote.execute(command, verbose=False)
+        self.client_output = result['stdout']
+        if result['exit_code'] != 0:
+            raise IperfError('{0} is failed on {1}: {2}'.format(
+                command, self.name,
+                ''.join(result['stdout'] + result['stderr'])))
+
+    def stop_server(self, remote):
+        if self.pid is None:
+            return
+        output = remote.execute(
+            STOP_SERVER[self.tool].format(pid=self.pid, log=self.log),
+            verbose=False)
+        self.pid = None
+        self.server_output = output['stdout']
+
+    def result(self):
+        # Sender rate is meaningless for UDP, so server report is used
+        output = self.server_output if self.udp else self.client_output
+        if self.tool == 'iperf3':
+            starts, bps = parse_iperf3_json(output)
+        else:
+            starts, bps = parse_iperf_csv(output, self.interval)
+        return IperfResult(self.name, starts, bps, tool=self.tool,
+                           udp=self.udp)
+
+
+def run_iperf_matrix(pairs, connect, udp=False, duration=30, interval=1,
+                     bandwidth='10M', base_port=BASE_PORT, max_workers=None):
+    """Run iperf for all pairs concurrently
+
+    :param pairs: list of (client, server, server_ip)
+    :param connect: callable, which returns SSHClient for host
+    :param udp: use UDP with `bandwidth` target rate instead of TCP
+    :param duration: test time in seconds
+    :param max_workers: count of concurrent connections, all by default
+    :return: list of IperfResult in the same order as pairs
+    """
+    pairs = [IperfPair(client, server, ip, base_port + i, udp=udp,
+                       duration=duration, interval=interval,
+                       bandwidth=bandwidth)
+             for i, (client, server, ip) in enumerate(pairs)]
+
+    hosts = {}
+    for pair in pairs:
+        for host in (pair.client, pair.server):
+            hosts[id(host)] = host
+
+    def detect(host):
+        with connect(host) as remote:
+            return detect_tool(remote)
+
+    host_ids = list(hosts)
+    tools = dict(zip(host_ids, parallel_map(
+        detect, [hosts[x] for x in host_ids], max_workers)))
+    for pair in pairs:
+        both = set([tools[id(pair.client)], tools[id(pair.server)]])
+        pair.tool = 'iperf3' if both == set(['iperf3']) else 'iperf'
+
+    def start_server(pair):
+        with connect(pair.server) as remote:
+            pair.start_server(remote)
+
+    def run_client(pair):
+        with connect(pair.client) as remote:
+            pair.run_client(remote)
+
+    def stop_server(pair):
+        with connect(pair.server) as remote:
+            pair.stop_server(remote)
+
+    started_at = time.time()
+    try:
+        parallel_map(start_server, pairs, max_workers)
+        parallel_map(run_client, pairs, max_workers)
+    finally:
+        parallel_map(stop_server, [x for x in pairs if x.pid is not None],
+                     max_workers)
+    results = [pair.result() for pair in pairs]
+    logger.info('iperf for {0} pairs is done in {1:.1f}s:\n{2}'.format(
+        len(pairs), time.time() - started_at,
+        '\n'.join(six.text_type(x) for x in results)))
+    return results
@@ -0,0 +1,157 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Full mesh reachability check
+
+Each source host (VM, usually) is connected once, all targets are pinged
+from it concurrently by backgrounded pings, and sources are processed in
+parallel:
+
+    matrix = check_mesh(
+        servers, targets=lambda vm: ips_to_ping[vm.id],
+        connect=lambda vm: os_conn.ssh_to_instance(env, vm, keypair))
+    assert not matrix.unreachable, matrix
+"""
+
+import logging
+import re
+import time
+
+import six
+
+from mos_tests.functions.common import parallel_map
+
+logger = logging.getLogger(__name__)
+
+MARKER = 'MESH'
+
+# Average rtt from iputils (rtt min/avg/max/mdev = ...) or busybox
+# (round-trip min/avg/max = ...) ping summary
+AVG_RTT = re.compile(r'min/avg/max\S* = [\d.]+/([\d.]+)/')
+
+SWEEP_COMMAND = (
+    'for ip in {ips}; do '
+    '(out=$(ping -c {count} -W {wait} $ip 2>&1); '
+    'echo "{marker} $ip $? "$out) & '
+    'done; wait')
+
+
+def build_sweep_command(ips, count=1, wait=1):
+    """Return shell command, which pings all ips concurrently
+
+    Output of each ping is printed as single line (with flattened ping
+    output), so lines of concurrent pings are not mixed.
+    """
+    return SWEEP_COMMAND.format(ips=' '.join(ips), count=count, wait=wait,
+                                marker=MARKER)
+
+
+def parse_sweep(lines):
+    """Return dict with average rtt (ms) or None for each pinged ip"""
+    results = {}
+    for line in lines:
+        parts = line.split(None, 3)
+        if len(parts) < 3 or parts[0] != MARKER:
+            continue
+        ip, exit_code = parts[1], parts[2]
+        rtt = None
+        if exit_code == '0':
+            match = AVG_RTT.search(line)
+            rtt = float(match.group(1)) if match else 0.0
+        results[ip] = rtt
+    return results
+
+
+class ReachabilityMatrix(object):
+    """Average rtt (ms) or None for each source and target ip"""
+
+    def __init__(self):
+        self.results = {}
+
+    def add(self, source, results):
+        self.results[source] = results
+
+    @property
+    def unreachable(self):
+        """List of (source, ip) pairs without connectivity"""
+        return [(source, ip)
+                for source, results in sorted(self.results.items())
+                for ip, rtt in sorted(results.items()) if rtt is None]
+
+    def __str__(self):
+        lines = []
+        for source, results in sorted(self.results.items()):
+            cells = ['{0}: {1}'.format(
+                ip, 'FAIL' if rtt is None else '{0:.2f}ms'.format(rtt))
+                for ip, rtt in sorted(results.items())]
+            lines.append('{0} -> {1}'.format(source, ', '.join(cells)))
+        return '\n'.join(lines)
+
+
+def sweep(connect, source, ips, count=1, wait=1, timeout=3 * 60,
+          retry_delay=5):
+    """Ping ips from source and repeat for failed ones until timeout
+
+    One session, returned by `connect(source)`, is used for all sweeps.
+    Connection errors are retried until timeout too.
+    """
+    pending = sorted(set(ips))
+    results = dict.fromkeys(pending)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            with connect(source) as remote:
+                while pending:
+                    output = remote.execute(
+                        build_sweep_command(pending, count, wait),
+                        verbose=False)
+                    results.update(parse_sweep(output['stdout']))
+                    pending = [x for x in pending if results[x] is None]
+                    if not pending or time.time() > deadline:
+                        return results
+                    time.sleep(retry_delay)
+            return results
+        except Exception as e:
+            if time.time() > deadline:
+                logger.error('Sweep from {0} is failed: {1}'.format(source,
+                                                                     e))
+                return results
+            logger.debug('Sweep from {0} is failed, retry: {1}'.format(
+                source, e))
+            time.sleep(retry_delay)
+
+
+def check_mesh(sources, targets, connect, count=1, wait=1, timeout=3 * 60,
+               max_workers=None):
+    """Ping targets from all sources in parallel
+
+    :param sources: hosts to ping from
+    :param targets: callable, which returns ips to ping for source
+    :param connect: callable, which returns SSHClient for source
+    :param max_workers: count of concurrent sources, all by default
+    :return: ReachabilityMatrix with sources names
+    """
+    def check(source):
+        return sweep(connect, source, targets(source), count=count,
+                     wait=wait, timeout=timeout)
+
+    sources = list(sources)
+    started_at = time.time()
+    matrix = ReachabilityMatrix()
+    for source, results in zip(sources, parallel_map(check, sources,
+                                                     max_workers)):
+        matrix.add(getattr(source, 'name', six.text_type(source)), results)
+    logger.info('Mesh of {0} sources is checked in {1:.1f}s:\n{2}'.format(
+        len(sources), time.time() - started_at, matrix))
+    return matrix
@@ -12,19 +12,105 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
+import itertools
 import json
+import logging
+import operator
+import os
+import re
+import shlex
+import threading
+import weakref
 
 import six
-from tempest.lib.cli import output_parser as parser
-from tempest.lib import exceptions
+
+from mos_tests.environment.ssh import CommandResult
+from mos_tests.functions import cli_helper
+from mos_tests.functions.common import lazy_import
+from mos_tests.settings import OS_CLI_PERSISTENT
+
+# tempest is imported on first use
+exceptions = lazy_import('tempest.lib.exceptions')
+
+logger = logging.getLogger(__name__)
+
+# Shell constructions, which can't be executed by CLI helper
+SHELL_SYNTAX = re.compile(r'[|&;<>$`()]')
+
+# Same as tempest `output_parser.delimiter_line`
+DELIMITER_LINE = re.compile(r'^\+\-[\+\-]+\-\+$')
+
+
+def _get_cell(cell_slice, line):
+    return (line[cell_slice],)
+
+
+def iter_table(lines):
+    """Parse CLI ascii-table lines and yield rows as lists of strings
+
+    First yielded row is header. It's streaming and faster replacement of
+    tempest `output_parser.table` with same results: each delimiter line
+    defines columns, lines without `|` are skipped.
+    """
+    if isinstance(lines, six.string_types):
+        lines = lines.split('\n')
+    get_cells = None
+    for line in lines:
+        if line[:2] == '+-' and DELIMITER_LINE.match(line.rstrip()):
+            line = line.rstrip()
+            positions = [i for i, x in enumerate(line) if x == '+']
+            slices = [slice(a + 1, b) for a, b in zip(positions,
+                                                      positions[1:])]
+            if len(slices) == 1:
+                # itemgetter returns item instead of tuple for one slice
+                get_cells = functools.partial(_get_cell, slices[0])
+            else:
+                get_cells = operator.itemgetter(*slices)
+            continue
+        if get_cells is None or '|' not in line:
+            continue
+        yield [x.strip() for x in get_cells(line)]
+
+
+def listing(lines):
+    """Return list of dicts with rows of CLI output table"""
+    rows = iter_table(lines)
+    headers = next(rows, None)
+    if headers is None:
+        return []
+    return [dict(zip(headers, row)) for row in rows]
+
+
+def details(lines):
+    """Return dict with properties of first CLI output table"""
+    if isinstance(lines, six.string_types):
+        lines = lines.split('\n')
+    table_lines = []
+    delimiters = 0
+    for line in lines:
+        if DELIMITER_LINE.match(line):
+            delimiters += 1
+        if delimiters:
+            table_lines.append(line)
+        if delimiters == 3:
+            break
+    rows = iter_table(table_lines)
+    headers = next(rows, ())
+    if 'Property' not in headers or 'Value' not in headers:
+        raise exceptions.InvalidStructure()
+    return {row[0]: row[1] for row in rows}
 
 
 class Result(six.text_type):
     def listing(self):
-        return parser.listing(self)
+        return listing(self)
 
     def details(self):
-        return parser.details(self)
+        return details(self)
+
+    def json(self):
+        return json.loads(self)
 
     def __add__(self, other):
         if not isinstance(other, six.text_type):
@@ -32,9 +118,142 @@ class Result(six.text_type):
         return self.__class__(super(Result, self).__add__(other))
 
 
-def os_execute(remote, command, fail_ok=False, merge_stderr=False):
+class CLISession(object):
+    """Resident CLI helper process on remote
+
+    Helper (`cli_helper` module) runs clients commands in one long-lived
+    python process with sourced openrc, so each command doesn't pay for
+    interpreter startup, clients import and authentication.
+    """
+
+    helper_path = '/tmp/mos_cli_helper.py'
+
+    def __init__(self, remote, timeout=10 * 60):
+        # Sessions are cached by remote, they must not keep it alive
+        self.remote = weakref.proxy(remote)
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._chan = None
+        self._stdin = None
+        self._stdout = None
+
+    @staticmethod
+    def parse_command(command):
+        """Return env and argv of simple command or None
+
+        Commands with pipes, redirects, substitutions, etc. are not
+        supported. `env VAR=value` prefix and disabled stdin (`<&-`) are
+        allowed.
+        """
+        command = re.sub(r'(^|\s)<&-(?=\s|$)', ' ', command)
+        if SHELL_SYNTAX.search(command):
+            return None
+        if six.PY2 and isinstance(command, six.text_type):
+            command = command.encode('utf-8')
+        try:
+            tokens = shlex.split(command)
+        except ValueError:
+            return None
+        env = {}
+        if tokens and tokens[0] == 'env':
+            tokens.pop(0)
+            while tokens and re.match(r'^\w+=', tokens[0]):
+                key, value = tokens.pop(0).split('=', 1)
+                env[key] = value
+        if not tokens:
+            return None
+        return env, tokens
+
+    @property
+    def is_alive(self):
+        return (self._chan is not None and not self._chan.closed and
+                not self._chan.exit_status_ready())
+
+    def start(self):
+        source = os.path.join(os.path.dirname(__file__), 'cli_helper.py')
+        with open(source) as f:
+            content = f.read()
+        with self.remote.open(self.helper_path, 'w') as f:
+            f.write(content)
+        self._chan, self._stdin, self._stdout, _ = self.remote.execute_async(
+            '. openrc && exec python -u {}'.format(self.helper_path),
+            merge_stderr=True)
+        self._chan.settimeout(self.timeout)
+        self._read_response(0)
+
+    def close(self):
+        if self._chan is not None:
+            self._chan.close()
+            self._chan = None
+
+    def _read_response(self, request_id):
+        while True:
+            line = self._stdout.readline()
+            if not line:
+                raise Exception('CLI helper exited unexpectedly')
+            if isinstance(line, six.binary_type):
+                line = line.decode('utf-8')
+            if not line.startswith(cli_helper.MARKER):
+                continue
+            data = json.loads(line[len(cli_helper.MARKER):])
+            if data['id'] == request_id:
+                return data
+
+    def execute(self, env, argv):
+        with self._lock:
+            request_id = next(self._ids)
+            request = {'id': request_id, 'argv': argv, 'env': env}
+            self._stdin.write(json.dumps(request) + '\n')
+            self._stdin.flush()
+            data = self._read_response(request_id)
+        return CommandResult({
+            'stdout': data['stdout'].encode('utf-8').splitlines(True),
+            'stderr': data['stderr'].encode('utf-8').splitlines(True),
+            'exit_code': data['exit_code'],
+        })
+
+
+# Started CLI sessions (or False, if helper can't be started) for remotes
+_sessions = weakref.WeakKeyDictionary()
+
+
+def get_session(remote):
+    """Return started CLI session for remote or None if unsupported"""
+    session = _sessions.get(remote)
+    if session is None or (session and not session.is_alive):
+        session = CLISession(remote)
+        try:
+            session.start()
+        except Exception as e:
+            logger.warning('CLI session is not available on {0}: {1}'.format(
+                remote.host, e))
+            session.close()
+            session = False
+        _sessions[remote] = session
+    return session or None
+
+
+def execute_in_session(remote, command):
+    """Execute command in CLI session or return None if unsupported"""
+    parsed = CLISession.parse_command(command)
+    if parsed is None:
+        return None
+    session = get_session(remote)
+    if session is None:
+        return None
+    logger.debug("Executing command in CLI session: '{}'".format(command))
+    return session.execute(*parsed)
+
+
+def os_execute(remote, command, fail_ok=False, merge_stderr=False,
+               persistent=False):
+    result = None
+    if persistent:
+        result = execute_in_session(remote, command)
     command = '. openrc && {}'.format(command.encode('utf-8'))
-    result = remote.execute(command)
+    if result is None:
+        result = remote.execute(command)
     if not fail_ok and not result.is_ok:
         raise exceptions.CommandFailed(result['exit_code'],
                                        command.decode('utf-8'),
@@ -49,9 +268,15 @@ def os_execute(remote, command, fail_ok=False, merge_stderr=False):
 class CLICLient(object):
 
     command = ''
+    # Global flags and action params to get output in JSON, if supported
+    json_flags = ''
+    json_params = ''
 
-    def __init__(self, remote):
+    def __init__(self, remote, persistent=None):
         self.remote = remote
+        if persistent is None:
+            persistent = OS_CLI_PERSISTENT
+        self.persistent = persistent
         super(CLICLient, self).__init__()
 
     def build_command(self, action, flags='', params='', prefix=''):
@@ -61,11 +286,45 @@ class CLICLient(object):
                 merge_stderr=False):
         command = self.build_command(action, flags, params, prefix)
         return os_execute(self.remote, command, fail_ok=fail_ok,
-                          merge_stderr=merge_stderr)
+                          merge_stderr=merge_stderr,
+                          persistent=self.persistent)
+
+    @property
+    def supports_json(self):
+        return bool(self.json_flags or self.json_params)
+
+    def _call_json(self, action, flags='', params='', prefix=''):
+        flags = u' '.join([flags, self.json_flags])
+        params = u' '.join([params, self.json_params])
+        return self(action, flags=flags, params=params, prefix=prefix).json()
+
+    def get_listing(self, action, flags='', params='', prefix=''):
+        """Return list of dicts from JSON output or parsed table
+
+        Note that JSON keys and values types are defined by client and can
+        differ from table columns.
+        """
+        if self.supports_json:
+            return self._call_json(action, flags, params, prefix)
+        return self(action, flags=flags, params=params,
+                    prefix=prefix).listing()
+
+    def get_details(self, action, flags='', params='', prefix=''):
+        """Return dict from JSON output or parsed properties table"""
+        if self.supports_json:
+            return self._call_json(action, flags, params, prefix)
+        return self(action, flags=flags, params=params,
+                    prefix=prefix).details()
 
 
 class OpenStack(CLICLient):
     command = 'openstack'
+    json_params = '-f json'
+
+    def get_details(self, action, flags='', params='', prefix=''):
+        params = u' '.join([params, self.json_params])
+        output = self(action, flags=flags, params=params, prefix=prefix)
+        return self.details(output)
 
     def details(self, output):
         data = json.loads(output)
@@ -74,36 +333,32 @@ class OpenStack(CLICLient):
         return data
 
     def project_create(self, name):
-        output = self('project create', params='{} -f json'.format(name))
-        return self.details(output)
+        return self.get_details('project create', params=name)
 
     def project_delete(self, name):
         return self('project delete', params=name)
 
     def user_create(self, name, password, project=None):
-        params = '{name} --password {password} -f json'.format(
-            name=name, password=password)
+        params = '{name} --password {password}'.format(name=name,
+                                                       password=password)
         if project is not None:
             params += ' --project {}'.format(project)
-        output = self('user create', params=params)
-        return self.details(output)
+        return self.get_details('user create', params=params)
 
     def user_delete(self, name):
         return self('user delete', params=name)
 
     def role_create(self, name):
-        output = self('role create', params='{} -f json'.format(name))
-        return self.details(output)
+        return self.get_details('role create', params=name)
 
     def role_delete(self, name):
         return self('role delete', params=name)
 
     def assign_role_to_user(self, role_name, user, project):
-        output = self(
+        return self.get_details(
             'role add',
-            params='{name} --user {user} --project {project} -f json'.format(
+            params='{name} --user {user} --project {project}'.format(
                 name=role_name, user=user, project=project))
-        return self.details(output)
 
 
 class Glance(CLICLient):
@@ -117,6 +372,7 @@ class Glance(CLICLient):
 
 class Ironic(CLICLient):
     command = 'ironic'
+    json_flags = '--json'
 
 
 class Murano(CLICLient):
@@ -0,0 +1,235 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Open vSwitch flows and ports snapshots
+
+Flows (`ovs-ofctl dump-flows`) and ports (`ovs-vsctl --format=json`) are
+collected from all nodes concurrently and can be compared before and after
+agents restart:
+
+    before = collect(env.get_nodes_by_role('compute'))
+    restart_agents()
+    after = collect(env.get_nodes_by_role('compute'))
+    for fqdn in before:
+        added, removed = before[fqdn].flows.diff(after[fqdn].flows)
+        assert before[fqdn].port_tags() == after[fqdn].port_tags()
+"""
+
+import collections
+import json
+import logging
+
+import six
+
+from mos_tests.functions.common import parallel_map
+
+logger = logging.getLogger(__name__)
+
+BRIDGES = ('br-int', 'br-tun')
+
+# Default OpenFlow priority, it is not shown in dump-flows output
+DEFAULT_PRIORITY = 32768
+
+# dump-flows fields, which are not part of match
+FLOW_FIELDS = ('cookie', 'duration', 'table', 'n_packets', 'n_bytes',
+               'idle_age', 'hard_age', 'idle_timeout', 'hard_timeout',
+               'importance', 'send_flow_rem', 'check_overlap',
+               'reset_counts', 'priority')
+
+Flow = collections.namedtuple(
+    'Flow', ['bridge', 'cookie', 'table', 'priority', 'match', 'actions',
+             'n_packets', 'n_bytes'])
+
+
+class OvsError(Exception):
+    pass
+
+
+def parse_flow(line, bridge=None):
+    """Return Flow for `ovs-ofctl dump-flows` line or None"""
+    head, sep, actions = line.strip().partition(' actions=')
+    if not sep:
+        return None
+    fields = {}
+    match = []
+    for part in head.replace(', ', ',').split(','):
+        key, _, value = part.partition('=')
+        if key in FLOW_FIELDS:
+            fields[key] = value
+        elif part:
+            match.append(part)
+    return Flow(bridge=bridge,
+                cookie=int(fields.get('cookie', '0'), 16),
+                table=int(fields.get('table', 0)),
+                priority=int(fields.get('priority', DEFAULT_PRIORITY)),
+                match=','.join(match),
+                actions=actions,
+                n_packets=int(fields.get('n_packets', 0)),
+                n_bytes=int(fields.get('n_bytes', 0)))
+
+
+def _flow_key(flow):
+    """Flow identity, independent of cookie and statistics"""
+    return flow.bridge, flow.table, flow.priority, flow.match, flow.actions
+
+
+class FlowTable(object):
+    """Flows of bridges, indexed by cookie and (table, priority)"""
+
+    def __init__(self, flows=()):
+        self.flows = list(flows)
+        self.by_cookie = collections.defaultdict(list)
+        self.by_table = collections.defaultdict(list)
+        self.bridges = set()
+        for flow in self.flows:
+            self._index(flow)
+
+    def _index(self, flow):
+        self.by_cookie[flow.cookie].append(flow)
+        self.by_table[(flow.table, flow.priority)].append(flow)
+        self.bridges.add(flow.bridge)
+
+    def add_lines(self, lines, bridge):
+        self.bridges.add(bridge)
+        for line in lines:
+            flow = parse_flow(line, bridge)
+            if flow is not None:
+                self.flows.append(flow)
+                self._index(flow)
+
+    def __len__(self):
+        return len(self.flows)
+
+    def __iter__(self):
+        return iter(self.flows)
+
+    def filter(self, bridge=None, cookie=None, table=None, priority=None):
+        return FlowTable(
+            x for x in self.flows
+            if (bridge is None or x.bridge == bridge) and
+            (cookie is None or x.cookie == cookie) and
+            (table is None or x.table == table) and
+            (priority is None or x.priority == priority))
+
+    def cookies(self):
+        """Return dict with set of cookies for each bridge"""
+        result = {x: set() for x in self.bridges}
+        for flow in self.flows:
+            result[flow.bridge].add(flow.cookie)
+        return result
+
+    def diff(self, other):
+        """Return (added, removed) FlowTables of `other` relative to self
+
+        Flows are compared without cookies and statistics, so flows, which
+        are reinstalled with new cookie, are not shown.
+        """
+        keys = set(_flow_key(x) for x in self.flows)
+        other_keys = set(_flow_key(x) for x in other.flows)
+        added = FlowTable(x for x in other.flows
+                          if _flow_key(x) not in keys)
+        removed = FlowTable(x for x in self.flows
+                            if _flow_key(x) not in other_keys)
+        return added, removed
+
+    def describe(self, limit=20):
+        lines = ['{0} cookie={1:#x} table={2} priority={3} {4} '
+                 'actions={5}'.format(x.bridge, x.cookie, x.table,
+                                      x.priority, x.match, x.actions)
+                 for x in self.flows[:limit]]
+        if len(self) > limit:
+            lines.append('... {0} more flows'.format(len(self) - limit))
+        return '\n'.join(lines)
+
+
+def read_flows(remote, bridges=BRIDGES):
+    """Return FlowTable of existing bridges from node"""
+    flows = FlowTable()
+    for bridge in bridges:
+        result = remote.execute('ovs-ofctl dump-flows {0}'.format(bridge),
+                                verbose=False)
+        # br-tun is missing on VLAN environments
+        if result.is_ok:
+            flows.add_lines(result['stdout'], bridge)
+    return flows
+
+
+def decode_ovsdb_value(value):
+    """Convert ovsdb JSON value (atom, set, map or uuid) to python"""
+    if isinstance(value, list) and len(value) == 2:
+        kind, data = value
+        if kind == 'set':
+            return [decode_ovsdb_value(x) for x in data]
+        if kind == 'map':
+            return {decode_ovsdb_value(k): decode_ovsdb_value(v)
+                    for k, v in data}
+        if kind in ('uuid', 'named-uuid'):
+            return data
+    return value
+
+
+def parse_ovsdb_json(text):
+    """Return list of rows dicts from `ovs-vsctl --format=json list`"""
+    data = json.loads(text)
+    return [dict(zip(data['headings'], [decode_ovsdb_value(x) for x in row]))
+            for row in data['data']]
+
+
+class OvsSnapshot(object):
+    """Flows and ports of one node"""
+
+    def __init__(self, name, flows, ports):
+        self.name = name
+        self.flows = flows
+        self.ports = ports
+
+    @classmethod
+    def collect(cls, remote, bridges=BRIDGES, name=None):
+        """Read flows of existing bridges and ports from node"""
+        flows = read_flows(remote, bridges)
+        result = remote.execute(
+            'ovs-vsctl --format=json --columns=name,tag,external_ids '
+            'list Port', verbose=False)
+        if not result.is_ok:
+            raise OvsError('ovs-vsctl is failed on {0}: {1}'.format(
+                name, result.stderr_string))
+        ports = {x['name']: x for x in parse_ovsdb_json(result.stdout_string)}
+        return cls(name, flows, ports)
+
+    def port_tags(self):
+        """Return dict with local VLAN tag for each tagged port"""
+        tags = {}
+        for name, port in self.ports.items():
+            # Empty set is returned for port without tag
+            if isinstance(port['tag'], six.integer_types):
+                tags[name] = port['tag']
+        return tags
+
+
+def collect(nodes, bridges=BRIDGES, max_workers=None):
+    """Collect OvsSnapshot from all nodes concurrently
+
+    :return: dict of node fqdn and OvsSnapshot
+    """
+    def get_snapshot(node):
+        with node.ssh() as remote:
+            return OvsSnapshot.collect(remote, bridges=bridges,
+                                       name=node.data['fqdn'])
+
+    snapshots = parallel_map(get_snapshot, nodes, max_workers)
+    logger.debug('OVS snapshots are collected: {0}'.format(', '.join(
+        '{0} ({1} flows, {2} ports)'.format(x.name, len(x.flows),
+                                            len(x.ports))
+        for x in snapshots)))
+    return {x.name: x for x in snapshots}
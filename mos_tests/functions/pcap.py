@@ -0,0 +1,272 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-process pcap reader with columnar index of packets headers
+
+Capture is read once, Ethernet (or Linux cooked, `tcpdump -i any`),
+802.1Q, IPv4, ARP, UDP and VXLAN headers are decoded for all packets
+together with numpy and stored as columns. Filters are answered from
+columns without re-reading file:
+
+    index = PcapIndex.from_file('vxlan.pcap')
+    index.count(protocol='icmp', src='10.0.0.3', dst='10.0.0.4')
+
+Like tshark, address filters match any layer (outer or VXLAN encapsulated).
+"""
+
+import logging
+import os
+import socket
+import struct
+
+from mos_tests.functions.common import lazy_import
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_LINUX_SLL = 113
+
+ETH_P_IP = 0x0800
+ETH_P_ARP = 0x0806
+ETH_P_8021Q = 0x8100
+
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+VXLAN_PORT = 4789
+
+# pcap magic: (records header format, fraction of second divider)
+MAGICS = {
+    b'\xd4\xc3\xb2\xa1': ('<IIII', 1e6),
+    b'\xa1\xb2\xc3\xd4': ('>IIII', 1e6),
+    b'\x4d\x3c\xb2\xa1': ('<IIII', 1e9),
+    b'\xa1\xb2\x3c\x4d': ('>IIII', 1e9),
+}
+
+LAYERS = ('outer', 'inner')
+
+
+class PcapError(Exception):
+    pass
+
+
+def ip_to_int(ip):
+    return struct.unpack('!I', socket.inet_aton(ip))[0]
+
+
+def int_to_ip(value):
+    return socket.inet_ntoa(struct.pack('!I', int(value)))
+
+
+def read_records(data):
+    """Return link type and arrays of packets timestamps, lengths, offsets
+
+    Only classic pcap format (written by `tcpdump -w`) is supported.
+    """
+    if len(data) < 24 or data[:4] not in MAGICS:
+        raise PcapError('Not a pcap file')
+    record_format, divider = MAGICS[data[:4]]
+    linktype = struct.unpack(record_format[0] + 'I', data[20:24])[0]
+    record = struct.Struct(record_format)
+    unpack_from = record.unpack_from
+    timestamps, lengths, offsets, ends = [], [], [], []
+    pos, size = 24, len(data)
+    while pos + 16 <= size:
+        sec, frac, incl_len, orig_len = unpack_from(data, pos)
+        pos += 16
+        if pos + incl_len > size:
+            logger.warning('Capture is truncated, last packet is skipped')
+            break
+        timestamps.append(sec + frac / divider)
+        lengths.append(orig_len)
+        offsets.append(pos)
+        pos += incl_len
+        ends.append(pos)
+    return (linktype, np.array(timestamps, dtype=np.float64),
+            np.array(lengths, dtype=np.int64),
+            np.array(offsets, dtype=np.int64), np.array(ends, dtype=np.int64))
+
+
+class _Reader(object):
+    """Gather big-endian fields at arrays of offsets
+
+    Offsets beyond data are clipped, so such values must be masked by
+    packets lengths checks.
+    """
+
+    def __init__(self, data):
+        self.data = np.frombuffer(data, dtype=np.uint8)
+        self.limit = max(len(self.data) - 1, 0)
+
+    def u8(self, pos):
+        return self.data[np.minimum(pos, self.limit)].astype(np.int64)
+
+    def u16(self, pos):
+        return (self.u8(pos) << 8) | self.u8(pos + 1)
+
+    def u32(self, pos):
+        return (self.u16(pos) << 16) | self.u16(pos + 2)
+
+
+def decode_l2(reader, start, end, linktype, mask):
+    """Return ethertype (0 for unknown packets) and L3 offset arrays"""
+    if linktype == LINKTYPE_ETHERNET:
+        ethertype, l3 = reader.u16(start + 12), start + 14
+    elif linktype == LINKTYPE_LINUX_SLL:
+        ethertype, l3 = reader.u16(start + 14), start + 16
+    else:
+        raise PcapError('Unsupported link type {0}'.format(linktype))
+    is_vlan = ethertype == ETH_P_8021Q
+    ethertype = np.where(is_vlan, reader.u16(l3 + 2), ethertype)
+    l3 = np.where(is_vlan, l3 + 4, l3)
+    ethertype = np.where(mask & (l3 <= end), ethertype, 0)
+    return ethertype, l3
+
+
+def decode_l3(reader, ethertype, l3, end):
+    """Return dict of IPv4 and ARP columns and L4 offset array"""
+    is_ip = (ethertype == ETH_P_IP) & (l3 + 20 <= end)
+    is_arp = (ethertype == ETH_P_ARP) & (l3 + 28 <= end)
+    proto = np.where(is_ip, reader.u8(l3 + 9), -1)
+    columns = {
+        'ethertype': ethertype,
+        'ip_proto': proto,
+        'ip_src': np.where(is_ip, reader.u32(l3 + 12), -1),
+        'ip_dst': np.where(is_ip, reader.u32(l3 + 16), -1),
+        'arp_src': np.where(is_arp, reader.u32(l3 + 14), -1),
+        'arp_dst': np.where(is_arp, reader.u32(l3 + 24), -1),
+    }
+    l4 = l3 + (reader.u8(l3) & 0xf) * 4
+    return columns, l4
+
+
+class PcapIndex(object):
+    """Columns of decoded packets headers
+
+    `columns` contains arrays `timestamp`, `length`, `vni` (-1 for not
+    VXLAN packets) and for `outer` and VXLAN `inner` layers (prefixed with
+    layer name): `ethertype`, `ip_proto`, `ip_src`, `ip_dst`, `arp_src`,
+    `arp_dst`. Missing values are -1, addresses are integers.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_bytes(cls, data):
+        linktype, timestamps, lengths, offsets, ends = read_records(data)
+        reader = _Reader(data)
+        mask = np.ones(len(offsets), dtype=bool)
+        columns = {'timestamp': timestamps, 'length': lengths}
+
+        ethertype, l3 = decode_l2(reader, offsets, ends, linktype, mask)
+        outer, l4 = decode_l3(reader, ethertype, l3, ends)
+        is_vxlan = ((outer['ip_proto'] == IPPROTO_UDP) &
+                    (reader.u16(l4 + 2) == VXLAN_PORT) & (l4 + 16 <= ends))
+        columns['vni'] = np.where(is_vxlan, reader.u32(l4 + 12) >> 8, -1)
+
+        ethertype, l3 = decode_l2(reader, l4 + 16, ends, LINKTYPE_ETHERNET,
+                                  is_vxlan)
+        inner, _ = decode_l3(reader, ethertype, l3, ends)
+        for layer, layer_columns in zip(LAYERS, (outer, inner)):
+            for name, values in layer_columns.items():
+                columns['{0}_{1}'.format(layer, name)] = values
+        return cls(columns)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        index = cls.from_bytes(data)
+        logger.debug('{0} packets are read from {1}'.format(len(index), path))
+        return index
+
+    def __len__(self):
+        return len(self.columns['timestamp'])
+
+    def _any_layer(self, name, value):
+        return ((self.columns['outer_' + name] == value) |
+                (self.columns['inner_' + name] == value))
+
+    def match(self, protocol=None, src=None, dst=None, vni=None,
+              not_vni=None):
+        """Return boolean array of packets, matched all conditions
+
+        :param protocol: 'ip', 'arp', 'icmp', 'tcp', 'udp' or 'vxlan'
+        :param src: source IP (ARP sender address for 'arp' protocol)
+        :param dst: destination IP (ARP target address for 'arp' protocol)
+        :param vni: VXLAN packets with this VNI
+        :param not_vni: VXLAN packets with VNI other than this
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if protocol == 'vxlan' or not_vni is not None:
+            mask &= self.columns['vni'] != -1
+        elif protocol == 'arp':
+            mask &= self._any_layer('ethertype', ETH_P_ARP)
+        elif protocol == 'ip':
+            mask &= self._any_layer('ethertype', ETH_P_IP)
+        elif protocol is not None:
+            ip_proto = {'icmp': IPPROTO_ICMP, 'tcp': IPPROTO_TCP,
+                        'udp': IPPROTO_UDP}[protocol]
+            mask &= self._any_layer('ip_proto', ip_proto)
+        prefix = 'arp' if protocol == 'arp' else 'ip'
+        if src is not None:
+            mask &= self._any_layer(prefix + '_src', ip_to_int(src))
+        if dst is not None:
+            mask &= self._any_layer(prefix + '_dst', ip_to_int(dst))
+        if vni is not None:
+            mask &= self.columns['vni'] == int(vni)
+        if not_vni is not None:
+            mask &= self.columns['vni'] != int(not_vni)
+        return mask
+
+    def count(self, **conditions):
+        return int(self.match(**conditions).sum())
+
+    def describe(self, mask, limit=20):
+        """Return text with summary of first `limit` matched packets"""
+        lines = []
+        for i in np.flatnonzero(mask)[:limit]:
+            parts = ['{0:.6f}'.format(self.columns['timestamp'][i])]
+            if self.columns['vni'][i] != -1:
+                parts.append('vni {0}'.format(self.columns['vni'][i]))
+            for layer in LAYERS:
+                for name in ('ip', 'arp'):
+                    src = self.columns['{0}_{1}_src'.format(layer, name)][i]
+                    dst = self.columns['{0}_{1}_dst'.format(layer, name)][i]
+                    if src != -1:
+                        parts.append('{0} {1} > {2}'.format(
+                            name.upper(), int_to_ip(src), int_to_ip(dst)))
+            lines.append(' '.join(parts))
+        total = int(mask.sum())
+        if total > limit:
+            lines.append('... {0} more packets'.format(total - limit))
+        return '\n'.join(lines)
+
+
+_cache = {}
+
+
+def read_pcap(path):
+    """Return PcapIndex for file, cached until file is changed"""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    if key not in _cache:
+        for old_key in [x for x in _cache if x[0] == path]:
+            del _cache[old_key]
+        _cache[key] = PcapIndex.from_file(path)
+    return _cache[key]
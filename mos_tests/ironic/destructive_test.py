@@ -117,7 +117,7 @@ def test_reboot_all_ironic_conductors(env, env_name):
         with conductor.ssh() as remote:
             with remote.open('/root/openrc', 'w') as f:
                 f.write(openrc)
-            drivers_data = os_cli.Ironic(remote)('driver-list').listing()
+            drivers_data = os_cli.Ironic(remote).get_listing('driver-list')
             assert len(drivers_data) > 0
             if drivers is None:
                 drivers = drivers_data
@@ -143,7 +143,7 @@ def test_reboot_all_ironic_conductors(env, env_name):
             with remote.open('/root/openrc', 'w') as f:
                 f.write(openrc)
             ironic_cli = os_cli.Ironic(remote)
-            assert ironic_cli('driver-list').listing() == drivers
+            assert ironic_cli.get_listing('driver-list') == drivers
 
 
 @pytest.mark.check_env_('has_2_or_more_ironic_conductors')
@@ -20,6 +20,7 @@ import pytest
 import six
 
 from mos_tests.functions.common import wait
+from mos_tests.functions.mesh import check_mesh
 from mos_tests import settings
 
 
@@ -197,17 +198,32 @@ class TestBase(object):
                                                  res['stderr']))
 
     def check_vm_connectivity(self, timeout=3 * 60):
-        """Check that all vms can ping each other and public ip"""
+        """Check that all vms can ping each other and public ip
+
+        All vms are checked in parallel, each vm pings all ips at once.
+        """
         servers = self.os_conn.get_servers()
-        for server1 in servers:
+        servers_ips = {x.id: list(self.os_conn.get_nova_instance_ips(
+            x).values()) for x in servers}
+
+        def get_ips_to_ping(server):
             ips_to_ping = [settings.PUBLIC_TEST_IP]
             for server2 in servers:
-                if server1 == server2:
-                    continue
-                ips_to_ping += self.os_conn.get_nova_instance_ips(
-                    server2).values()
-            self.check_ping_from_vm(server1, self.instance_keypair,
-                                    ips_to_ping, timeout=timeout)
+                if server2.id != server.id:
+                    ips_to_ping += servers_ips[server2.id]
+            return ips_to_ping
+
+        def connect(server):
+            return self.os_conn.ssh_to_instance(
+                self.env, server, self.instance_keypair,
+                username=self.cirros_creds['username'],
+                password=self.cirros_creds['password'])
+
+        matrix = check_mesh(servers, get_ips_to_ping, connect,
+                            timeout=timeout)
+        assert not matrix.unreachable, (
+            'Instances have NO connection, but they should have.\n'
+            '{0}'.format(matrix))
 
     def run_on_cirros(self, vm, cmd):
         """Run command on Cirros VM, connected by floating ip.
@@ -20,6 +20,7 @@ import time
 import pytest
 
 from mos_tests.environment.os_actions import OpenStackActions
+from mos_tests.functions import conntrack
 from mos_tests.functions.common import wait
 from mos_tests.neutron.python_tests.base import TestBase
 
@@ -183,31 +184,23 @@ def restart_ping(os_clients, env, servers, group_num=None):
 
 
 def is_ping_has_same_id(compute):
-    id_expr = re.compile(r'id=(?P<id>\d+)')
     with compute.ssh() as remote:
-        output = remote.execute('conntrack -L | grep 10.0.0.4 | grep icmp')
+        table = conntrack.snapshot(remote, protocol='icmp', src='10.0.0.4')
 
-    if 'UNREPLIED' not in output.stdout_string:
+    if table.count(unreplied=True) == 0:
         return False
-    ids_data = defaultdict(set)
-    for line in output['stdout']:
-        id_val = int(id_expr.search(line).group('id'))
-        ids_data[id_val].add('[UNREPLIED]' in line)
-    last_id = max(ids_data.keys())
-    return ids_data[last_id] == set([True, False])
+    last_id = table.records['id'].max()
+    last = table.select(table.match(id=last_id))
+    return set(last.records['unreplied'].tolist()) == set([True, False])
 
 
 def check_zones_assigment_to_devices(compute):
     __tracebackhide__ = True
     with compute.ssh() as remote:
-        conntrack_output = remote.check_call(
-            'conntrack -L | grep 10.0.0.4 | grep icmp')
+        table = conntrack.snapshot(remote, protocol='icmp', src='10.0.0.4')
         iptables_output = remote.check_call('iptables -L -t raw')
 
-    zones = set()
-    for line in conntrack_output['stdout']:
-        zone = re.search(r'zone=(?P<zone>\d+)', line).group('zone')
-        zones.add(zone)
+    zones = set(str(x) for x in table.zones())
 
     for start, line in enumerate(iptables_output['stdout']):
         if 'Chain neutron-openvswi-PREROUTING' in line:
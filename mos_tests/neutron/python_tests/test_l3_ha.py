@@ -13,20 +13,17 @@
 #    under the License.
 
 from collections import defaultdict
-from collections import namedtuple
 from contextlib import contextmanager
 import logging
-import re
-import signal
-import subprocess
-import threading
 
 import pytest
-from six.moves.queue import Empty
-from six.moves.queue import Queue
 
 from mos_tests.environment.devops_client import DevopsClient
+from mos_tests.functions.capture import Capture
+from mos_tests.functions.capture import capture_together
 from mos_tests.functions.common import wait
+from mos_tests.functions.connectivity import ConnectivityMonitor
+from mos_tests.functions import failover
 from mos_tests.neutron.python_tests.base import TestBase
 from mos_tests import settings
 
@@ -34,123 +31,39 @@ from mos_tests import settings
 logger = logging.getLogger(__name__)
 
 
-def get_ping_seq(line):
-    """Return ping seq"""
-    seq = re.search(r'seq=(\d+) ', line)
-    if seq is None:
-        return None
-    return int(seq.group(1))
-
-
-def ping_groups(stdout):
-    """Generate ping info for each line of stdout
-
-    Format:
-        * `sent` - count of sent packets
-        * `received` - count of received packets
-        * `group_len` - len of last continuous group of success pings
-    """
-    PingInfo = namedtuple('PingInfo', ['sent', 'received', 'group_len'])
-    prev_seq = -1
-    group_start = 0
-    received = 0
-    for line in stdout:
-        logger.debug('Ping result: {}'.format(line.strip()))
-        seq = get_ping_seq(line)
-        if seq is None:
-            continue
-        received += 1
-        if seq != prev_seq + 1:
-            logger.debug('ping interrupted')
-            group_start = seq
-        pi = PingInfo(sent=seq, received=received,
-                      group_len=seq - group_start)
-        yield pi
-        prev_seq = seq
-
-
-class PingThread(threading.Thread):
-    def __init__(self, remote, ip_to_ping,
-                 timeout=10 * 60, *args, **kwargs):
-        super(PingThread, self).__init__(*args, **kwargs)
-        self.stdout_q = Queue()
-        self._stop = threading.Event()
-        self.remote = remote
-        self.ip_to_ping = ip_to_ping
-        self.timeout = timeout
-        self.stdin = None
-        self.chan = None
-
-    def run(self):
-        remote = self.remote
-        command = 'ping {0} 2&>1'.format(self.ip_to_ping)
-        self.chan, self.stdin, stdout, _ = remote.execute_async(command)
-        for line in stdout:
-            self.stdout_q.put(line)
-
-    def stop(self):
-        self._stop.set()
-        if self.stdin is not None:
-            self.stdin.write(chr(signal.SIGINT))
-            self.stdin.flush()
-        if self.chan is not None:
-            self.chan.close()
-
-    def stopped(self):
-        return self._stop.isSet()
-
-    def iter_output(self):
-        while True:
-            try:
-                yield self.stdout_q.get(timeout=self.timeout)
-            except Empty:
-                self.stop()
-                self._Thread__stop()
-                raise Exception('Timeout was reached during communicate '
-                                'with thread')
-
-
 @pytest.mark.check_env_('is_l3_ha', 'has_2_or_more_computes')
 class TestL3HA(TestBase):
     """Tests for L3 HA"""
 
     @contextmanager
-    def background_ping_from_host(self, ip_to_ping, recover_pings=50):
+    def background_ping_from_host(self, ip_to_ping, recover_pings=50,
+                                  interval=1, measurement=None):
         """Start ping from host to `ip_to_ping` before enter and stop it after
 
         Return dict with ping stat
 
         :param ip_to_ping: ip address to ping from `vm`
+        :param recover_pings: count of continuous pings to determine that
+            connect is restored
+        :param measurement: FailoverMeasurement to run together with ping
         """
 
         result = {}
 
         logger.info('Start ping on {0}'.format(ip_to_ping))
-        proc = subprocess.Popen(['ping', ip_to_ping], stdout=subprocess.PIPE)
-        try:
-            proc.stdout.readline()
-            output = []
-            for line_count in range(10):
-                output.append(proc.stdout.readline().strip())
-
+        monitor = ConnectivityMonitor(ip_to_ping, interval=interval)
+        if measurement is not None:
+            measurement.monitor = monitor
+        with measurement or monitor:
+            monitor.wait_stable(10)
             yield result
-            # terminate ping subprocess and fill analyzed result
             logger.info('Wait for ping restored')
-            for line_count in range(recover_pings):
-                output.append(proc.stdout.readline().strip())
-            proc.terminate()
-            output += proc.communicate()[0].split('\n')
-            groups = ping_groups(output)
-            for ping_info in groups:
-                result['received'] = ping_info.received
-                result['sent'] = ping_info.sent
-        finally:
-            if proc.returncode is None:
-                proc.kill()
+            monitor.wait_stable(recover_pings)
+        result.update(monitor.stats())
 
     @contextmanager
     def background_ping(self, vm, vm_keypair, ip_to_ping, good_pings=50,
-                        proxy_node=None):
+                        proxy_node=None, measurement=None):
         """Start ping from `vm` to `ip_to_ping` before enter and stop it after
 
         Return dict with ping stat
@@ -160,6 +73,7 @@ class TestL3HA(TestBase):
         :param ip_to_ping: ip address to ping from `vm`
         :param good_pings: count of continuous pings to determine that connect
             is restored
+        :param measurement: FailoverMeasurement to run together with ping
         """
         result = {
             'received': 0,
@@ -168,27 +82,71 @@ class TestL3HA(TestBase):
 
         with self.os_conn.ssh_to_instance(self.env, vm, vm_keypair,
                                           proxy_node=proxy_node) as remote:
-            t = PingThread(remote=remote, ip_to_ping=ip_to_ping)
+            monitor = ConnectivityMonitor(ip_to_ping, remote=remote,
+                                          timestamps=False)
+            if measurement is not None:
+                measurement.monitor = monitor
             logger.info('Start ping on {0}'.format(ip_to_ping))
-            t.start()
+            with measurement or monitor:
+                # Wait for 10 not interrupted packets
+                monitor.wait_stable(10, timeout=10 * 60)
 
-            groups = ping_groups(t.iter_output())
+                yield result
 
-            # Wait for 10 not interrupted packets
-            for ping_info in groups:
-                if ping_info.group_len >= 10:
-                    break
+                logger.info('Wait for ping restored')
+                monitor.wait_stable(good_pings, timeout=10 * 60)
+        result.update(monitor.stats())
 
-            yield result
+    @contextmanager
+    def capture_gateway_icmp(self, router_id, hosts):
+        """Capture ICMP on router gateway port on `hosts` before enter and
+        stop it after
 
-            logger.info('Wait for ping restored')
-            for ping_info in groups:
-                result['received'] = ping_info.received
-                result['sent'] = ping_info.sent
-                if ping_info.group_len >= good_pings:
-                    break
-            t.stop()
-            t.join()
+        Return dict with Capture for each host
+        """
+        port = self.os_conn.neutron.list_ports(
+            device_owner='network:router_gateway',
+            device_id=router_id)['ports'][0]
+        interface = 'qg-{0}'.format(port['id'][:11])
+        prefix = 'ip netns exec qrouter-{0}'.format(router_id)
+        remotes = {x: self.env.find_node_by_fqdn(x).ssh() for x in hosts}
+        try:
+            captures = {}
+            for host, remote in remotes.items():
+                logger.info('Start tcpdump on {0}'.format(host))
+                remote.reconnect()
+                captures[host] = Capture(remote, bpf_filter='icmp',
+                                         interface=interface, prefix=prefix)
+            with capture_together(list(captures.values())):
+                yield captures
+        finally:
+            for remote in remotes.values():
+                remote.clear()
+
+    def failover_measurement(self, router_id):
+        """Return FailoverMeasurement with router states trackers"""
+        trackers = [failover.ha_state_tracker(self.os_conn, router_id)]
+        trackers.extend(failover.keepalived_tracker(x, router_id)
+                        for x in self.env.get_nodes_by_role('controller'))
+        return failover.FailoverMeasurement(trackers)
+
+    @pytest.fixture
+    def record_failover(self, request):
+        """Log failover report and attach it to junit xml report"""
+        def record(measurement, event):
+            report = measurement.report(event)
+            logger.info(report)
+            properties = report.properties()
+            if hasattr(request.node, 'user_properties'):
+                request.node.user_properties.extend(properties)
+            else:
+                xml = getattr(request.config, '_xml', None)
+                if xml is not None:
+                    node_reporter = xml.node_reporter(request.node.nodeid)
+                    for name, value in properties:
+                        node_reporter.add_property(name, value)
+            return report
+        return record
 
     def get_active_l3_agents_for_router(self, router_id):
         agents = self.os_conn.get_l3_for_router(router_id)
@@ -265,7 +223,7 @@ class TestL3HA(TestBase):
     @pytest.mark.testrail_id('542785', params={'ban_count': 2})
     @pytest.mark.parametrize('ban_count', [1, 2], ids=['once', 'twice'])
     def test_ban_l3_agent_with_active_ha_state(self, router, prepare_openstack,
-                                               ban_count):
+                                               ban_count, record_failover):
         """Ban l3-agent with ACTIVE ha_state for router
 
         Scenario:
@@ -283,6 +241,9 @@ class TestL3HA(TestBase):
             10. Stop ping
             11. Check that ping lost no more than 10 packets
             12. Repeat steps 7-10 `ban_count` times
+
+        Failover downtime and router states transitions are reported for
+        each ban.
         """
         # collect l3 agents and group it by hs_state
         agents = defaultdict(list)
@@ -301,14 +262,18 @@ class TestL3HA(TestBase):
 
         node_to_ban = agents['active'][0]['host']
 
-        for _ in range(ban_count):
+        for i in range(ban_count):
+            measurement = self.failover_measurement(router['router']['id'])
+            event = 'ban{0}'.format(i + 1)
 
             # Ban l3 agent
             with self.background_ping(vm=server1,
                                       vm_keypair=self.instance_keypair,
-                                      ip_to_ping=server2_ip) as ping_result:
+                                      ip_to_ping=server2_ip,
+                                      measurement=measurement) as ping_result:
                 with self.env.get_ssh_to_node(controller_ip) as remote:
                     logger.info("Ban L3 agent on node {0}".format(node_to_ban))
+                    measurement.mark(event)
                     remote.check_call(
                         "pcs resource ban neutron-l3-agent {0}".format(
                             node_to_ban))
@@ -317,6 +282,7 @@ class TestL3HA(TestBase):
                         from_node=node_to_ban)
                     node_to_ban = new_agent['host']
 
+            record_failover(measurement, event)
             assert ping_result['sent'] - ping_result['received'] < 10
 
     @pytest.mark.testrail_id('542794')
@@ -394,7 +360,7 @@ class TestL3HA(TestBase):
 
     @pytest.mark.testrail_id('542786')
     def test_destroy_primary_controller(self, router, prepare_openstack,
-                                        env_name):
+                                        env_name, record_failover):
         """Destroy primary controller (l3 agent on it should be
             with ACTIVE ha_state)
 
@@ -409,10 +375,15 @@ class TestL3HA(TestBase):
             7. If node from step 6 isn't primary controller,
                 reschedule router1 to primary by banning all another
                 and then clear them
-            8. Start ping vm2 from vm1 by floating ip
+            8. Start ping vm2 by floating ip from host
             9. Destroy primary controller
             10. Stop ping
-            11. Check that ping lost no more than 10 packets
+            11. Check that ping is recovered and downtime is less than
+                10 seconds (10 lost packets)
+            12. Check ping vm2 from vm1 by floating ip
+
+        Failover downtime of floating ip ping from host and router states
+        transitions are reported.
         """
         router_id = router['router']['id']
         agents = self.get_active_l3_agents_for_router(router_id)
@@ -440,15 +411,24 @@ class TestL3HA(TestBase):
         server2 = self.os_conn.nova.servers.find(name="server02")
         server2_ip = self.os_conn.get_nova_instance_ips(server2)['floating']
 
-        logger.info("Destroy primary controller {}".format(
-            primary_controller.data['fqdn']))
         devops_node = DevopsClient.get_node_by_mac(
             env_name=env_name, mac=primary_controller.data['mac'])
-        devops_node.destroy()
 
-        self.wait_router_rescheduled(router_id=router['router']['id'],
-                                     from_node=primary_controller.data['fqdn'],
-                                     timeout_seconds=5 * 60)
+        measurement = self.failover_measurement(router_id)
+        with self.background_ping_from_host(ip_to_ping=server2_ip,
+                                            measurement=measurement):
+            logger.info("Destroy primary controller {}".format(
+                primary_controller.data['fqdn']))
+            measurement.mark('destroy')
+            devops_node.destroy()
+
+            self.wait_router_rescheduled(
+                router_id=router_id,
+                from_node=primary_controller.data['fqdn'],
+                timeout_seconds=5 * 60)
+        report = record_failover(measurement, 'destroy')
+        assert report.recovered
+        assert report.downtime_ms < 10 * 1000
 
         self.check_ping_from_vm(vm=server1, vm_keypair=self.instance_keypair,
                                 ip_to_ping=server2_ip)
@@ -617,55 +597,34 @@ class TestL3HA(TestBase):
         assert (ping_result['sent'] - ping_result['received']) < 10
 
     @pytest.mark.testrail_id('542789')
-    def test_ban_l3_agent_with_tcpdump_check(self, router, prepare_openstack):
-        """Ban l3 active agent and check it by tcpdump log.
+    def test_ban_l3_agent_with_tcpdump_check(self, router, prepare_openstack,
+                                             record_failover):
+        """Ban l3 active agent and check router states on controllers.
 
          Steps:
             1. Create network net01, subnet net01_subnet
             2. Create router with gateway to external net and
                interface with net01
             3. Launch instance and associate floating IP
-            4. Start tcpdump on all controllers
-            5. Check ping from external host to instance by floating IP
-            6. Ban active l3 agent
-            7. Wait until router rescheduled
-            8. Stop ping
-            9. Stop tcpdump
-            10. Check that tcpdump results and active l3 agents statuses
-            11. Check that ping lost less than 10 packets
+            4. Start tcpdump on router gateway port on all l3 agents nodes
+               of router
+            5. Start tracking of router keepalived state on all controllers
+               and l3 agents ha_state
+            6. Check ping from external host to instance by floating IP
+            7. Ban active l3 agent
+            8. Wait until router rescheduled
+            9. Stop ping
+            10. Stop tracking and tcpdump
+            11. Check that ICMP replies are moved from banned l3 agent node
+                to new active one
+            12. Check that keepalived on new active l3 agent node became
+                master after ban
+            13. Check that ping downtime is less than 10 seconds
         """
-        def start_tcpdump_in_background(node, router_id, active_qg_iface_id):
-            """Start tcpdump on l3ha-router provided port.
-
-            :param node: node on which start tcpdump
-            :param router_id: router id on which start tcpdump
-            :param active_qg_iface_id: interface id on which start tcpdump
-            """
-            logger.info('Start tcpdump on {0}'.format(node.data['fqdn']))
-            cmd_for_tcpdump = (
-                'ip netns exec qrouter-{router_id} '
-                'tcpdump -n -l -tttt -i {qg_port_id} icmp '
-                '<&- >/tmp/tcpdump.log 2>&1 &'.format(
-                    router_id=router_id, qg_port_id=active_qg_iface_id))
-
-            with node.ssh() as remote:
-                remote.check_call(cmd_for_tcpdump)
-
-        def get_last_package_datetime(node):
-            """Get last package time from tcpdump log on provided node
-
-            :param node: node on which we need to analyze log
-            :return: last time from log or None, if log is empty
-            """
-            with node.ssh() as remote:
-                res = remote.execute("grep 'ICMP echo reply' /tmp/tcpdump.log")
-                if res['exit_code'] != 0:
-                    return None
-                res = remote.execute(
-                    "grep 'ICMP echo reply' /tmp/tcpdump.log | "
-                    "tail -1 | cut -d ' ' -f 1,2")
-                last_checked = res['stdout'][0].strip()
-                return last_checked
+        def get_reply_times(capture):
+            index = capture.index()
+            mask = index.match(protocol='icmp', src=instance_ip)
+            return index.columns['timestamp'][mask]
 
         instance = self.os_conn.nova.servers.find(name="server02")
         instance_ip = (
@@ -675,46 +634,44 @@ class TestL3HA(TestBase):
         controllers = self.env.get_nodes_by_role('controller')
         active_agents = self.get_active_l3_agents_for_router(router_id)
         active_hostname = active_agents[0]['host']
+        router_hosts = [x['host'] for x in
+                        self.os_conn.get_l3_for_router(router_id)['agents']]
 
-        # determine port for start tcpdump on it
-        active_l3_qg_port_for_router_id = self.os_conn.neutron.list_ports(
-            device_owner='network:router_gateway',
-            device_id=router_id)['ports'][0]['id']
-        active_qg_iface_id = 'qg-{}'.format(
-            active_l3_qg_port_for_router_id[:11])
-
-        # Start tcpdump on all controllers
-        for controller in controllers:
-            start_tcpdump_in_background(controller, router_id,
-                                        active_qg_iface_id)
+        measurement = self.failover_measurement(router_id)
         # Ban l3 agent
-        with self.background_ping_from_host(
-                ip_to_ping=instance_ip) as ping_result:
-            with controllers[0].ssh() as remote:
-                logger.info("Ban active l3 agent")
-                remote.check_call(
-                    "pcs resource ban neutron-l3-agent {0}".format(
-                        active_hostname))
-                new_active_agent = self.wait_router_rescheduled(
-                    router_id=router['router']['id'],
-                    from_node=active_hostname)
-                new_active_hostname = new_active_agent['host']
-
-        # kill tcpdump on controllers
-        for controller in controllers:
-            logger.info('Killing tcpdump on {0}'.format(
-                controller.data['fqdn']))
-            with controller.ssh() as remote:
-                remote.execute('killall tcpdump')
-
-        # check that l3 active agents matching with tcpdump results
-        last_active_node = self.env.find_node_by_fqdn(active_hostname)
-        new_active_node = self.env.find_node_by_fqdn(new_active_hostname)
-        last_tcpdump_results = get_last_package_datetime(last_active_node)
-        new_tcpdump_results = get_last_package_datetime(new_active_node)
-        assert (last_tcpdump_results and new_tcpdump_results) is not None
-        assert last_tcpdump_results < new_tcpdump_results
-        assert (ping_result['sent'] - ping_result['received']) < 10
+        with self.capture_gateway_icmp(router_id, router_hosts) as captures:
+            with self.background_ping_from_host(
+                    ip_to_ping=instance_ip, recover_pings=250, interval=0.2,
+                    measurement=measurement):
+                with controllers[0].ssh() as remote:
+                    logger.info("Ban active l3 agent")
+                    measurement.mark('ban')
+                    remote.check_call(
+                        "pcs resource ban neutron-l3-agent {0}".format(
+                            active_hostname))
+                    new_active_agent = self.wait_router_rescheduled(
+                        router_id=router['router']['id'],
+                        from_node=active_hostname)
+                    new_active_hostname = new_active_agent['host']
+
+        # check that ICMP replies are moved to new active l3 agent node
+        last_replies = get_reply_times(captures[active_hostname])
+        new_replies = get_reply_times(captures[new_active_hostname])
+        assert len(last_replies) > 0, (
+            'There are no ICMP replies on {0}'.format(active_hostname))
+        assert len(new_replies) > 0, (
+            'There are no ICMP replies on {0}'.format(new_active_hostname))
+        assert last_replies.max() < new_replies.max()
+
+        # check that l3 active agents matching with keepalived states
+        report = record_failover(measurement, 'ban')
+        new_master_ms = report.switchover_ms[
+            'keepalived on {0}'.format(new_active_hostname)]
+        assert new_master_ms is not None, (
+            'Keepalived on {0} is not switched to master'.format(
+                new_active_hostname))
+        assert report.recovered
+        assert report.downtime_ms < 10 * 1000
 
     def reschedule_active_l3_agt(self, router_id,
                                  to_controller, from_controller):
@@ -21,6 +21,7 @@ import time
 import pytest
 
 from mos_tests.functions.common import wait
+from mos_tests.functions import ovs
 from mos_tests.neutron.python_tests.base import TestBase
 from mos_tests import settings
 
@@ -116,17 +117,11 @@ class OvsBase(TestBase):
             :return: cookie value
         """
         cookies = {'br-int': set(), 'br-tun': set()}
-
-        cookie_pattern = re.compile(r'cookie=[^,]+')
         with compute.ssh() as remote:
-            result = remote.check_call('ovs-ofctl dump-flows br-int')
-            cookies_list = cookie_pattern.findall(result.stdout_string)
-            cookies['br-int'].update(cookies_list)
-
-            result = remote.execute('ovs-ofctl dump-flows br-tun')
-            if result.is_ok:
-                cookies_list = cookie_pattern.findall(result.stdout_string)
-                cookies['br-tun'].update(cookies_list)
+            flows = ovs.read_flows(remote)
+        cookies.update(flows.cookies())
+        assert len(flows.filter(bridge='br-int')) > 0, (
+            'There are no flows on br-int')
         return cookies
 
 
@@ -298,27 +293,6 @@ class TestOVSRestartTwoVms(OvsBase):
 class TestPortTags(OvsBase):
     """Check that port tags aren't change after ovs-agent restart"""
 
-    def get_ports_tags_data(self, lines):
-        """Returns dict with ports as keys and tags as values"""
-        port_tags = {}
-        last_offset = 0
-        port = None
-        for line in lines[1:]:
-            line = line.rstrip()
-            key, val = line.split(None, 1)
-            offset = len(line) - len(line.lstrip())
-            if port is None:
-                if key.lower() == 'port':
-                    port = val.strip('"')
-                    last_offset = offset
-                    continue
-            elif offset <= last_offset:
-                port = None
-            elif key.lower() == 'tag:':
-                port_tags[port] = val
-                port = None
-        return port_tags
-
     @pytest.mark.testrail_id('542664')
     def test_port_tags_immutable(self):
         """Check that ports tags don't change their values after
@@ -335,19 +309,15 @@ class TestPortTags(OvsBase):
                 remain the same
         """
 
-        def get_ovs_port_tags(nodes):
-            ovs_cfg = {}
-            for node in nodes:
-                with node.ssh() as remote:
-                    result = remote.check_call('ovs-vsctl show')
-                    ports_tags = self.get_ports_tags_data(result['stdout'])
-                    ovs_cfg[node.data['fqdn']] = ports_tags
-            return ovs_cfg
+        def get_ovs_port_tags(snapshots):
+            return {name: snapshot.port_tags()
+                    for name, snapshot in snapshots.items()}
 
         nodes = self.env.get_all_nodes()
 
         # Collect ovs-vsctl data before test
-        ovs_before_port_tags = get_ovs_port_tags(nodes)
+        ovs_before = ovs.collect(nodes)
+        ovs_before_port_tags = get_ovs_port_tags(ovs_before)
 
         # ban and clear ovs-agents on controllers
         controller = self.env.get_nodes_by_role('controller')[0]
@@ -367,7 +337,13 @@ class TestPortTags(OvsBase):
         time.sleep(30)
 
         # Collect ovs-vsctl data after test
-        ovs_after_port_tags = get_ovs_port_tags(nodes)
+        ovs_after = ovs.collect(nodes)
+        ovs_after_port_tags = get_ovs_port_tags(ovs_after)
+        for name, snapshot in ovs_before.items():
+            added, removed = snapshot.flows.diff(ovs_after[name].flows)
+            logger.debug('Flows changes on {0}:\nadded:\n{1}\n'
+                         'removed:\n{2}'.format(name, added.describe(),
+                                                removed.describe()))
 
         # Compare
         assert ovs_after_port_tags == ovs_before_port_tags
@@ -12,13 +12,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import csv
 import logging
 
 import pytest
 
 from mos_tests.functions import common
 from mos_tests.functions import file_cache
+from mos_tests.functions import iperf
 from mos_tests.neutron.python_tests import base
 from mos_tests import settings
 
@@ -26,8 +26,10 @@ logger = logging.getLogger(__name__)
 pytestmark = pytest.mark.undestructive
 
 BOOT_MARKER = 'INSTANCE BOOT COMPLETED'
-TCP_PORT = 5002
-UDP_PORT = 5003
+IPERF_PORT = 5002
+UDP_BANDWIDTH = '10M'
+# First seconds of iperf results are skipped, TCP rate is not stable there
+WARMUP = 5
 
 
 def wait_instances_to_boot(os_conn, instances):
@@ -134,12 +136,9 @@ class TestQoSBase(base.TestBase):
         userdata = '\n'.join([
             '#!/bin/bash -v',
             'apt-get install -yq iperf',
-            'iperf -s -p {tcp_port} <&- > /tmp/iperf.log 2>&1 &',
-            'iperf -u -s -p {udp_port} <&- > /tmp/iperf_udp.log 2>&1 &',
+            'apt-get install -yq iperf3',
             'echo "{marker}"',
-        ]).format(marker=BOOT_MARKER,
-                  tcp_port=TCP_PORT,
-                  udp_port=UDP_PORT)
+        ]).format(marker=BOOT_MARKER)
 
         return cls.os_conn.create_server(
             name=name,
@@ -153,59 +152,47 @@ class TestQoSBase(base.TestBase):
             wait_for_active=False,
             wait_for_avaliable=False)
 
-    def get_iperf_result(self,
-                         remote,
-                         server_ip,
-                         time=80,
-                         interval=20,
-                         udp=False):
-        interval = min(interval, time)
-        port = UDP_PORT if udp else TCP_PORT
-        if udp:
-            cmd = ('iperf -u -c {ip} -p {port} -x CDMS -y C -t {time} '
-                   '-i {interval} --bandwidth 10M')
-        else:
-            cmd = 'iperf -c {ip} -p {port} -y C -t {time} -i {interval}'
-        result = remote.check_call(cmd.format(ip=server_ip,
-                                              port=port,
-                                              time=time,
-                                              interval=interval))
-        assert not result['stderr'], 'Error during iperf execution, {}'.format(
-            result)
-        if udp:
-            # Show only server report
-            stdout = result['stdout'][-1:]
-        else:
-            stdout = result['stdout']
-            # Exclude summary
-            if len(stdout) > 1:
-                stdout = stdout[:-1]
-            # Strip first result, because it almost always too high
-            if len(stdout) > 1:
-                stdout = stdout[1:]
-        reader = csv.reader(stdout)
-        for line in reader:
-            yield line
-
-    def check_iperf_bandwidth(self,
-                              client,
-                              server,
-                              limit,
-                              ip_type='fixed',
-                              **kwargs):
-        server_ip = self.os_conn.get_nova_instance_ips(server)[ip_type]
-        with self.os_conn.ssh_to_instance(
-                self.env,
-                client,
-                username='ubuntu',
-                vm_keypair=self.instance_keypair) as remote:
-            for line in self.get_iperf_result(remote, server_ip, **kwargs):
-                bandwidth = int(line[8])
-                if bandwidth < 0.8 * limit:
-                    raise Exception(
-                        'Bandwidth is too low: {0}, limit is {1}'.format(
-                            bandwidth, limit))
-                assert bandwidth <= limit * 1.05
+    def get_iperf_results(self, pairs, ip_type='fixed', time=30, udp=False):
+        """Run iperf for (client, server) pairs concurrently"""
+        def connect(vm):
+            return self.os_conn.ssh_to_instance(
+                self.env, vm, username='ubuntu',
+                vm_keypair=self.instance_keypair)
+
+        pairs = [(client, server,
+                  self.os_conn.get_nova_instance_ips(server)[ip_type])
+                 for client, server in pairs]
+        return iperf.run_iperf_matrix(pairs, connect, udp=udp, duration=time,
+                                      bandwidth=UDP_BANDWIDTH,
+                                      base_port=IPERF_PORT)
+
+    def check_iperf_bandwidths(self, checks, **kwargs):
+        """Check that bandwidth is restricted by limit for all pairs
+
+        :param checks: list of (client, server, limit), all pairs are
+            measured at the same time
+        """
+        results = self.get_iperf_results(
+            [(client, server) for client, server, _ in checks], **kwargs)
+        for (_, _, limit), result in zip(checks, results):
+            stats = result.stats(warmup=WARMUP)
+            if stats['mean'] < 0.8 * limit:
+                raise Exception(
+                    'Bandwidth is too low: {0}, limit is {1}'.format(
+                        result, limit))
+            assert stats['mean'] <= limit * 1.05, result
+            assert stats['p95'] <= limit * 1.2, result
+
+    def check_iperf_bandwidth(self, client, server, limit, **kwargs):
+        self.check_iperf_bandwidths([(client, server, limit)], **kwargs)
+
+    def check_iperf_not_limited(self, checks, **kwargs):
+        """Check that bandwidth exceeds limit for all pairs"""
+        results = self.get_iperf_results(
+            [(client, server) for client, server, _ in checks], **kwargs)
+        for (_, _, limit), result in zip(checks, results):
+            stats = result.stats(warmup=WARMUP)
+            assert stats['mean'] > limit * 1.05, result
 
 
 @pytest.mark.check_env_('has_1_or_more_computes')
@@ -320,17 +307,9 @@ class TestTraficBetweenComputes(DifferentComputesInstancesMixin, TestQoSBase):
         """
 
         instance1, instance2 = instances
-        with pytest.raises(AssertionError):
-            self.check_iperf_bandwidth(instance1,
-                                       instance2,
-                                       limit=4000 * 1024,
-                                       time=20)
-
-        with pytest.raises(AssertionError):
-            self.check_iperf_bandwidth(instance2,
-                                       instance1,
-                                       limit=4000 * 1024,
-                                       time=20)
+        self.check_iperf_not_limited([(instance1, instance2, 4000 * 1024),
+                                      (instance2, instance1, 4000 * 1024)],
+                                     time=20)
 
         instance1_ip = os_conn.get_nova_instance_ips(instance1)['fixed']
         port1 = os_conn.get_port_by_fixed_ip(instance1_ip)
@@ -358,9 +337,8 @@ class TestTraficBetweenComputes(DifferentComputesInstancesMixin, TestQoSBase):
         os_conn.neutron.update_port(
             port2['id'], {'port': {'qos_policy_id': policy2['policy']['id']}})
 
-        self.check_iperf_bandwidth(instance1, instance2, limit=3000 * 1024)
-
-        self.check_iperf_bandwidth(instance2, instance1, limit=4000 * 1024)
+        self.check_iperf_bandwidths([(instance1, instance2, 3000 * 1024),
+                                     (instance2, instance1, 4000 * 1024)])
 
     @pytest.mark.testrail_id('838310')
     def test_restrictions_on_net_and_vm(self, instances, os_conn,
@@ -466,25 +444,16 @@ class TestTraficBetweenComputes(DifferentComputesInstancesMixin, TestQoSBase):
         })
 
         instance1, instance2 = instances
-        with pytest.raises(AssertionError):
-            self.check_iperf_bandwidth(instance1,
-                                       instance2,
-                                       limit=3000 * 1024,
-                                       time=20)
-
-        with pytest.raises(AssertionError):
-            self.check_iperf_bandwidth(instance2,
-                                       instance1,
-                                       limit=3000 * 1024,
-                                       time=20)
+        self.check_iperf_not_limited([(instance1, instance2, 3000 * 1024),
+                                      (instance2, instance1, 3000 * 1024)],
+                                     time=20)
         # Update net with policy
         os_conn.neutron.update_network(
             self.net['network']['id'],
             {'network': {'qos_policy_id': policy1['policy']['id']}})
 
-        self.check_iperf_bandwidth(instance1, instance2, limit=3000 * 1024)
-
-        self.check_iperf_bandwidth(instance2, instance1, limit=3000 * 1024)
+        self.check_iperf_bandwidths([(instance1, instance2, 3000 * 1024),
+                                     (instance2, instance1, 3000 * 1024)])
 
 
 class TestPolicyWithNetCreate(DifferentComputesInstancesMixin, TestQoSBase):
@@ -542,11 +511,8 @@ class TestPolicyWithNetCreate(DifferentComputesInstancesMixin, TestQoSBase):
             self.rule['bandwidth_limit_rule']['id'],
             self.policy['policy']['id'])
 
-        with pytest.raises(AssertionError):
-            self.check_iperf_bandwidth(instances[0],
-                                       instances[1],
-                                       limit=3000 * 1024,
-                                       time=20)
+        self.check_iperf_not_limited(
+            [(instances[0], instances[1], 3000 * 1024)], time=20)
 
 
 @pytest.mark.check_env_('has_2_or_more_computes')
@@ -594,19 +560,12 @@ class TestTraficBetween3InstancesInOneNet(TestQoSBase):
 
         instance1, instance2, instance3 = instances
 
-        with pytest.raises(AssertionError):
-            self.check_iperf_bandwidth(instance1,
-                                       instance2,
-                                       limit=3000 * 1024,
-                                       time=10,
-                                       udp=udp)
-
-        with pytest.raises(AssertionError):
-            self.check_iperf_bandwidth(instance1,
-                                       instance3,
-                                       limit=3000 * 1024,
-                                       time=10,
-                                       udp=udp)
+        # Traffic of both pairs is limited on instance1 port, so pairs are
+        # checked one by one
+        self.check_iperf_not_limited([(instance1, instance2, 3000 * 1024)],
+                                     time=10, udp=udp)
+        self.check_iperf_not_limited([(instance1, instance3, 3000 * 1024)],
+                                     time=10, udp=udp)
 
         # Create policy for port
         instance1_ip = os_conn.get_nova_instance_ips(instance1)['fixed']
@@ -698,18 +657,10 @@ class TestTraficBetween3InstancesInDifferentNet(
         """
         instance1, instance2, instance3 = instances
 
-        with pytest.raises(AssertionError):
-            self.check_iperf_bandwidth(instance1,
-                                       instance2,
-                                       limit=3000 * 1024,
-                                       ip_type='floating',
-                                       time=20)
-
-        with pytest.raises(AssertionError):
-            self.check_iperf_bandwidth(instance1,
-                                       instance3,
-                                       limit=3000 * 1024,
-                                       time=20)
+        self.check_iperf_not_limited([(instance1, instance2, 3000 * 1024)],
+                                     ip_type='floating', time=20)
+        self.check_iperf_not_limited([(instance1, instance3, 3000 * 1024)],
+                                     time=20)
 
         # Create policy for port
         instance1_ip = os_conn.get_nova_instance_ips(instance1)['fixed']
@@ -833,19 +784,10 @@ class TestWithFloating(TwoNetAndComputesThreeInstances, TestQoSBase):
         """
         instance1, instance2, instance3 = instances
 
-        with pytest.raises(AssertionError):
-            self.check_iperf_bandwidth(instance1,
-                                       instance2,
-                                       limit=3000 * 1024,
-                                       time=20,
-                                       ip_type='floating')
-
-        with pytest.raises(AssertionError):
-            self.check_iperf_bandwidth(instance1,
-                                       instance3,
-                                       limit=3000 * 1024,
-                                       time=20,
-                                       ip_type='floating')
+        self.check_iperf_not_limited([(instance1, instance2, 3000 * 1024)],
+                                     time=20, ip_type='floating')
+        self.check_iperf_not_limited([(instance1, instance3, 3000 * 1024)],
+                                     time=20, ip_type='floating')
 
         # Create policy for port
         instance1_ip = os_conn.get_nova_instance_ips(instance1)['fixed']
@@ -13,14 +13,13 @@
 #    under the License.
 
 from contextlib import contextmanager
-from distutils.spawn import find_executable
 import logging
-import subprocess
-import threading
 
 import pytest
 
+from mos_tests.functions.capture import Capture
 from mos_tests.functions.common import gen_temp_file
+from mos_tests.functions.pcap import read_pcap
 from mos_tests.neutron.python_tests.base import TestBase
 
 
@@ -29,87 +28,58 @@ logger = logging.getLogger(__name__)
 
 @contextmanager
 def tcpdump(ip, env, log_path, tcpdump_args):
-    """Start tcpdump on vxlan port before enter and stop it after
+    """Start tcpdump on node before enter and stop it after
 
-    Log will download to log_path argument
+    Capture is streamed to log_path file during tcpdump work
     """
-    def tcpdump(ip):
+    with env.get_ssh_to_node(ip) as remote:
         logger.info('Start tcpdump on {0}'.format(ip))
-        with env.get_ssh_to_node(ip) as remote:
-            result = remote.execute(
-                'tcpdump -U {0} -w /tmp/vxlan.log'.format(tcpdump_args))
-            assert result['exit_code'] == 0
-
-    thread = threading.Thread(target=tcpdump, args=(ip,))
-    try:
-        # Start tcpdump
-        thread.start()
-        yield
-    except Exception:
-        raise
-    else:
-        # Download log
-        with env.get_ssh_to_node(ip) as remote:
-            remote.download('/tmp/vxlan.log', log_path)
-    finally:
-        # Kill tcpdump
-        with env.get_ssh_to_node(ip) as remote:
-            remote.execute('killall tcpdump')
-        thread.join(0)
+        with Capture(remote, interface=None, args=tcpdump_args,
+                     path=log_path):
+            yield
 
 
 def tcpdump_vxlan(ip, env, log_path):
     """Start tcpdump on vxlan port before enter and stop it after
 
-    Log will download to log_path argument
+    Capture is streamed to log_path file
     """
     return tcpdump(ip, env, log_path, '-U -vvni any port 4789')
 
 
-def _run_tshark_on_vxlan(log_file, cond):
-    tshark = find_executable('tshark')
-    return subprocess.check_output([
-        tshark, '-d', 'udp.port==4789,vxlan', '-r', log_file,
-        '-Y', '{0}'.format(cond)])
-
-
 def check_all_traffic_has_vni(vni, log_file):
     __tracebackhide__ = True
-    output = _run_tshark_on_vxlan(log_file, 'vxlan.vni!={0}'.format(vni))
-    if output.strip():
-        pytest.fail(
-            "Log contains records with another VNI\n{0}".format(output))
+    index = read_pcap(log_file)
+    mask = index.match(not_vni=vni)
+    if mask.any():
+        pytest.fail("Log contains records with another VNI\n{0}".format(
+            index.describe(mask)))
 
 
 def get_arp_traffic(src_ip, dst_ip, log_file):
-    cond = (
-        "arp.dst.proto_ipv4=={dst_ip} and "
-        "arp.src.proto_ipv4=={src_ip}".format(dst_ip=dst_ip, src_ip=src_ip))
-    return _run_tshark_on_vxlan(log_file, cond)
+    index = read_pcap(log_file)
+    mask = index.match(protocol='arp', src=src_ip, dst=dst_ip)
+    return index.describe(mask) if mask.any() else ''
 
 
 def check_no_arp_traffic(src_ip, dst_ip, log_file):
     __tracebackhide__ = True
     output = get_arp_traffic(src_ip, dst_ip, log_file)
-    if output.strip():
+    if output:
         pytest.fail("Log contains ARP traffic\n{0}".format(output))
 
 
 def check_arp_traffic(src_ip, dst_ip, log_file):
     __tracebackhide__ = True
     output = get_arp_traffic(src_ip, dst_ip, log_file)
-    if not output.strip():
+    if not output:
         pytest.fail("Log not contains ARP traffic")
 
 
 def check_icmp_traffic(src_ip, dst_ip, log_file):
     __tracebackhide__ = True
-    cond = "icmp and ip.src=={src_ip} and ip.dst=={dst_ip}".format(
-        src_ip=src_ip,
-        dst_ip=dst_ip
-    )
-    output = _run_tshark_on_vxlan(log_file, cond)
-    if not output.strip():
+    index = read_pcap(log_file)
+    if not index.match(protocol='icmp', src=src_ip, dst=dst_ip).any():
         pytest.fail(
             "Log not contains ICMP traffic from {src_ip} to {dst_ip}".format(
                 src_ip=src_ip,
@@ -138,7 +108,6 @@ class TestVxlanBase(TestBase):
         return router
 
 
-@pytest.mark.requires_('tshark')
 class TestVxlan(TestVxlanBase):
     """Simple Vxlan tests"""
 
@@ -298,7 +267,6 @@ class TestVxlanL2pop(TestVxlanBase):
         '542633', params={'tcpdump_args': '-vvni any port 4789'})
     @pytest.mark.testrail_id(
         '542637', params={'tcpdump_args': '-n src host {source_ip} -i any'})
-    @pytest.mark.requires_('tshark')
     @pytest.mark.check_env_('has_2_or_more_computes')
     @pytest.mark.parametrize('tcpdump_args', [
         '-vvni any port 4789',
@@ -509,7 +477,6 @@ class TestVxlanL2pop(TestVxlanBase):
                 assert any([x in stdout for x in compute3.ip_list])
 
     @pytest.mark.testrail_id('542638')
-    @pytest.mark.requires_('tshark')
     @pytest.mark.check_env_('has_2_or_more_computes')
     def test_broadcast_traffic_propagation_single_net(self, router):
         """Check broadcast traffic between instances placed in a single
@@ -12,8 +12,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import re
-import subprocess
 from time import sleep
 from time import time
 
@@ -24,6 +22,7 @@ import six
 from mos_tests.environment.ssh import SSHClient
 from mos_tests.functions.base import OpenStackTestCase
 from mos_tests.functions import common as common_functions
+from mos_tests.functions.connectivity import ConnectivityMonitor
 
 
 @pytest.mark.undestructive
@@ -508,39 +507,35 @@ class NovaIntegrationTests(OpenStackTestCase):
                        self.nova.hypervisors.list()}
         old_hyper = getattr(instance, "OS-EXT-SRV-ATTR:hypervisor_hostname")
         new_hyper = [h for h in hypervisors.keys() if h != old_hyper][0]
-        # Start ping of the vm in background
-        ping = subprocess.Popen(["/bin/ping", "-c20", "-i1", ip_to_ping],
-                                stdout=subprocess.PIPE)
-        # Then run the migration
-        self.nova.servers.live_migrate(instance, new_hyper,
-                                       block_migration=True,
-                                       disk_over_commit=False)
-
-        # Check that migration is over, usually it takes about 10-15 seconds
-        def instance_hypervisor():
-            instance.get()
-            return getattr(instance, "OS-EXT-SRV-ATTR:hypervisor_hostname")
-
-        common_functions.wait(lambda: instance_hypervisor() == new_hyper,
-                              timeout_seconds=timeout * 60,
-                              waiting_for='instance hypervisor to be changed')
+        # Start ping of the vm in background and run the migration
+        with ConnectivityMonitor(ip_to_ping) as ping:
+            self.nova.servers.live_migrate(instance, new_hyper,
+                                           block_migration=True,
+                                           disk_over_commit=False)
+
+            # Check that migration is over, usually it takes about 10-15
+            # seconds
+            def instance_hypervisor():
+                instance.get()
+                return getattr(instance,
+                               "OS-EXT-SRV-ATTR:hypervisor_hostname")
+
+            common_functions.wait(
+                lambda: instance_hypervisor() == new_hyper,
+                timeout_seconds=timeout * 60,
+                waiting_for='instance hypervisor to be changed')
         self.assertEqual(instance.status, 'ACTIVE')
 
-        # Now wait till background ping is over
-        ping.wait()
         # And check that vm was reachable during migration
-        output = re.search(r'(\d+)% packet loss', ping.stdout.read())
-        loss = int(output.group(1))
+        loss = ping.stats()['loss']
         if loss > 90:
             msg = "Packets loss during migration {}% exceeds the 90% limit"
             raise AssertionError(msg.format(loss))
 
         # And now sure that vm is stable after the migration
-        ping = subprocess.Popen(["/bin/ping", "-c300", "-i0.4",
-                                ip_to_ping], stdout=subprocess.PIPE)
-        ping.wait()
-        output = re.search('([0-9]+)% packet loss', ping.stdout.read())
-        loss = int(output.group(1))
+        with ConnectivityMonitor(ip_to_ping, interval=0.4) as ping:
+            sleep(300 * 0.4)
+        loss = ping.stats()['loss']
         if loss > 10:
             msg = "Packets loss during stability {}% exceeds the 10% limit"
             raise AssertionError(msg.format(loss))
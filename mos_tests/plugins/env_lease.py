@@ -0,0 +1,130 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import fcntl
+import logging
+import os
+import tempfile
+import time
+
+import pytest
+
+__doc__ = """This module allow to run tests on pool of devops environments.
+
+Each pytest process (or xdist worker) leases one free environment from
+`--env-pool` and uses it as `env_name` fixture value, so all fuel and
+OpenStack fixtures and snapshot reverts are bound to leased environment.
+
+Lease is an exclusive `flock` on `<lease dir>/<env name>.lock` file. It is
+held until process ends, so crashed workers never leave stale leases.
+
+An example (run neutron tests on 3 environments):
+
+    py.test mos_tests/neutron -n 3 -S snapshot --env-pool env1,env2,env3
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def pytest_addoption(parser):
+    parser.addoption("--env-pool", action="store",
+                     help="Comma separated fuel devops env names to lease "
+                          "one env for each test process")
+    parser.addoption("--env-lease-dir", action="store",
+                     default=os.path.join(tempfile.gettempdir(),
+                                          'mos_tests_env_leases'),
+                     help="Directory for env lease lock files")
+    parser.addoption("--env-lease-timeout", action="store", type=int,
+                     default=60 * 60,
+                     help="Seconds to wait for free env in pool")
+
+
+class EnvLease(object):
+    """File lock based lease of one env from pool"""
+
+    def __init__(self, lease_dir, env_names, owner):
+        self.lease_dir = lease_dir
+        self.env_names = env_names
+        self.owner = owner
+        self.env_name = None
+        self._lock_file = None
+
+    def _try_lock(self, env_name):
+        path = os.path.join(self.lease_dir, '{}.lock'.format(env_name))
+        lock_file = open(path, 'a+')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as e:
+            lock_file.close()
+            if e.errno in (errno.EACCES, errno.EAGAIN):
+                return False
+            raise
+        lock_file.truncate(0)
+        lock_file.write('{0} {1}\n'.format(self.owner, os.getpid()))
+        lock_file.flush()
+        self._lock_file = lock_file
+        self.env_name = env_name
+        return True
+
+    def acquire(self, timeout):
+        if not os.path.exists(self.lease_dir):
+            try:
+                os.makedirs(self.lease_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        end_time = time.time() + timeout
+        while True:
+            for env_name in self.env_names:
+                if self._try_lock(env_name):
+                    logger.info('{0} leased env {1}'.format(self.owner,
+                                                            env_name))
+                    return env_name
+            if time.time() > end_time:
+                raise Exception("Can't lease any env from {0} in {1} "
+                                "seconds".format(self.env_names, timeout))
+            time.sleep(5)
+
+    def release(self):
+        if self._lock_file is None:
+            return
+        logger.info('{0} releases env {1}'.format(self.owner, self.env_name))
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+        self._lock_file = None
+        self.env_name = None
+
+
+def get_worker_id(config):
+    for attr in ('workerinput', 'slaveinput'):
+        worker_input = getattr(config, attr, None)
+        if worker_input is not None:
+            return worker_input.get('workerid', worker_input.get('slaveid'))
+    return 'master'
+
+
+@pytest.yield_fixture(scope='session')
+def leased_env_name(request):
+    """Name of env leased from `--env-pool` or None if pool is not set"""
+    pool = request.config.getoption("--env-pool")
+    if not pool:
+        yield None
+        return
+    env_names = [x.strip() for x in pool.split(',') if x.strip()]
+    lease = EnvLease(request.config.getoption("--env-lease-dir"),
+                     env_names, owner=get_worker_id(request.config))
+    env_name = lease.acquire(request.config.getoption("--env-lease-timeout"))
+    yield env_name
+    lease.release()
@@ -0,0 +1,306 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from collections import OrderedDict
+import logging
+import sqlite3
+import time
+import uuid
+
+import pytest
+
+from mos_tests.plugins.revert_scheduler import is_destructive
+from mos_tests.plugins.revert_scheduler import split_to_classes
+from mos_tests.plugins.revert_scheduler import split_to_groups
+from mos_tests.plugins.testrail_id import get_testrail_id
+
+__doc__ = """This module stores tests history and uses it to order tests.
+
+`--history-db=FILE` enables saving of each test outcome and duration
+(setup + call + teardown) to sqlite FILE. Tests are identified by
+`testrail_id` marker (or by node id, if test is not marked), so history
+survives tests renaming and moving.
+
+With `--history-order` tests, which failed in recent runs, run first, and
+cheaper tests run before expensive ones. Tests are sorted only inside
+groups of revert scheduler, so reverts constraints are kept:
+
+* modules and classes are never interleaved;
+* undestructive tests of class run before destructive ones, destructive
+  tests with the same fixtures are kept together;
+* classes marked as `incremental` are never splitted or reordered inside.
+
+With `--history-eta` estimated remaining time is printed after each test.
+Estimation is based on history durations, corrected by ratio of actual and
+estimated time of already finished tests.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Count of last runs of each test to take into account
+HISTORY_DEPTH = 10
+
+# Rows older than that are removed from db
+HISTORY_KEEP_DAYS = 90
+
+
+def pytest_addoption(parser):
+    parser.addoption("--history-db", action="store", metavar="FILE",
+                     help="Save tests outcomes and durations to sqlite FILE")
+    parser.addoption("--history-order", action="store_true",
+                     help="Run recently failed and cheap tests first "
+                          "(requires --history-db)")
+    parser.addoption("--history-eta", action="store_true",
+                     help="Print estimated remaining time after each test "
+                          "(requires --history-db)")
+
+
+class CaseStats(object):
+    """Last runs of one test, newest first"""
+
+    def __init__(self):
+        self.runs = []
+
+    def add(self, outcome, duration):
+        self.runs.append((outcome, duration))
+
+    @property
+    def fail_score(self):
+        """Recency weighted failures count
+
+        Last failure weights 1, previous one 0.5 and so on.
+        """
+        return sum(0.5 ** i for i, (outcome, _) in enumerate(self.runs)
+                   if outcome == 'failed')
+
+    @property
+    def duration(self):
+        """Mean duration of not skipped runs or None"""
+        durations = [duration for outcome, duration in self.runs
+                     if outcome != 'skipped']
+        if not durations:
+            return None
+        return sum(durations) / len(durations)
+
+
+class RunHistory(object):
+    """Sqlite storage of tests outcomes"""
+
+    def __init__(self, path):
+        self.path = path
+        self.run_id = str(uuid.uuid4())
+        self._pending = []
+        conn = self._connect()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                         'test_key TEXT, nodeid TEXT, run_id TEXT, '
+                         'finished_at REAL, outcome TEXT, duration REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_key '
+                         'ON results (test_key, finished_at)')
+        conn.close()
+
+    def _connect(self):
+        # Parallel workers write to the same file, so wait for lock
+        return sqlite3.connect(self.path, timeout=60)
+
+    def load(self, keys=None):
+        """Return dict with test keys and CaseStats"""
+        stats = {}
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT test_key, outcome, duration '
+                                'FROM results ORDER BY finished_at DESC')
+            for key, outcome, duration in rows:
+                if keys is not None and key not in keys:
+                    continue
+                case = stats.setdefault(key, CaseStats())
+                if len(case.runs) < HISTORY_DEPTH:
+                    case.add(outcome, duration)
+        finally:
+            conn.close()
+        return stats
+
+    def add(self, key, nodeid, outcome, duration):
+        self._pending.append((key, nodeid, self.run_id, time.time(),
+                              outcome, duration))
+
+    def save(self):
+        """Write pending results to db and drop old rows"""
+        if not self._pending:
+            return
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany('INSERT INTO results VALUES '
+                                 '(?, ?, ?, ?, ?, ?)', self._pending)
+                conn.execute('DELETE FROM results WHERE finished_at < ?',
+                             (time.time() - HISTORY_KEEP_DAYS * 24 * 60 * 60,))
+        finally:
+            conn.close()
+        self._pending = []
+
+
+def get_test_key(item):
+    test_id = get_testrail_id(item)
+    if test_id is not None:
+        return str(test_id)
+    return item.nodeid
+
+
+def estimate_durations(items, stats):
+    """Return dict with node ids and estimated durations
+
+    Tests without history are estimated with median of known durations.
+    """
+    known = {}
+    for item in items:
+        case = stats.get(get_test_key(item))
+        if case is not None and case.duration is not None:
+            known[item.nodeid] = case.duration
+    default = 0
+    if known:
+        values = sorted(known.values())
+        default = values[len(values) // 2]
+    return {x.nodeid: known.get(x.nodeid, default) for x in items}
+
+
+def order_by_history(items, stats, durations):
+    """Return items, ordered by recent failures and duration"""
+    fail_scores = {}
+    for item in items:
+        case = stats.get(get_test_key(item))
+        fail_scores[item.nodeid] = case.fail_score if case else 0
+
+    def priority(unit):
+        return (-max(fail_scores[x.nodeid] for x in unit),
+                sum(durations[x.nodeid] for x in unit))
+
+    def order(parts, key):
+        """Sort parts by key, return (best key, flat items list)"""
+        keyed = sorted((key(x) for x in parts), key=lambda x: x[0])
+        return keyed[0][0], [item for _, part in keyed for item in part]
+
+    def order_group(units):
+        units = sorted(units, key=priority)
+        return priority(units[0]), [item for unit in units for item in unit]
+
+    def order_class(class_items):
+        groups = split_to_groups(class_items)
+        # Undestructive group stays first to keep reverts count
+        head_key, head = None, []
+        if not any(map(is_destructive, groups[0][0])):
+            head_key, head = order_group(groups.pop(0))
+        if not groups:
+            return (False, head_key), head
+        best, tail = order(groups, order_group)
+        if head_key is not None:
+            best = min(best, head_key)
+        return (True, best), head + tail
+
+    def order_module(module_items):
+        best, ordered = order(split_to_classes(module_items), order_class)
+        return (any(map(is_destructive, ordered)), best[1]), ordered
+
+    modules = OrderedDict()
+    for item in items:
+        modules.setdefault(item.module, []).append(item)
+    return order(modules.values(), order_module)[1]
+
+
+class HistoryRecorder(object):
+    """Collect outcomes of running tests and estimate remaining time"""
+
+    def __init__(self, history):
+        self.history = history
+        self.durations = {}
+        self.estimated = {}
+        self.finished = set()
+        self._phases = {}
+
+    def add_report(self, item_key, report):
+        outcome, duration = self._phases.get(report.nodeid, ('passed', 0))
+        duration += report.duration
+        if report.failed:
+            outcome = 'failed'
+        elif report.skipped and outcome != 'failed':
+            outcome = 'skipped'
+        self._phases[report.nodeid] = (outcome, duration)
+        if report.when == 'teardown':
+            del self._phases[report.nodeid]
+            self.history.add(item_key, report.nodeid, outcome, duration)
+            self.durations[report.nodeid] = duration
+            self.finished.add(report.nodeid)
+
+    def get_remaining(self):
+        """Return estimated remaining seconds"""
+        remaining = sum(v for k, v in self.estimated.items()
+                        if k not in self.finished)
+        done_estimated = sum(self.estimated.get(k, 0) for k in self.finished)
+        done_actual = sum(self.durations.values())
+        if done_estimated > 0:
+            # Current env may be slower or faster than usual
+            ratio = min(max(done_actual / done_estimated, 0.5), 2)
+            remaining *= ratio
+        return remaining
+
+
+def get_recorder(config):
+    return getattr(config, '_history_recorder', None)
+
+
+def pytest_configure(config):
+    path = config.getoption("--history-db")
+    if path:
+        config._history_recorder = HistoryRecorder(RunHistory(path))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_collection_modifyitems(session, config, items):
+    # Reorder after all other plugins, including revert scheduler
+    yield
+    recorder = get_recorder(config)
+    if recorder is None:
+        return
+    keys = set(get_test_key(x) for x in items)
+    stats = recorder.history.load(keys)
+    recorder.estimated = estimate_durations(items, stats)
+    if config.getoption("--history-order"):
+        items[:] = order_by_history(items, stats, recorder.estimated)
+    logger.info('Estimated run time: {:.0f}s'.format(
+        sum(recorder.estimated.values())))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    recorder = get_recorder(item.config)
+    if recorder is None:
+        return
+    report = outcome.get_result()
+    recorder.add_report(get_test_key(item), report)
+    if report.when == 'teardown' and item.config.getoption("--history-eta"):
+        remaining = recorder.get_remaining()
+        terminal = item.config.pluginmanager.getplugin('terminalreporter')
+        message = 'Estimated remaining time: {0:.0f}m {1:.0f}s'.format(
+            *divmod(remaining, 60))
+        logger.info(message)
+        if terminal is not None:
+            terminal.write_line('')
+            terminal.write_line(message)
+
+
+def pytest_sessionfinish(session):
+    recorder = get_recorder(session.config)
+    if recorder is not None:
+        recorder.history.save()
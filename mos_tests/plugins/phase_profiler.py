@@ -0,0 +1,212 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import os
+import re
+import time
+
+import pytest
+
+__doc__ = """This module measures time of each test phase.
+
+Enabled with `--profile-phases=DIR` option. For each test it measures:
+
+* setup, call and teardown phases;
+* setup and teardown of every fixture;
+* any custom section, marked with `timed_phase` (snapshot revert, for
+  example).
+
+Timings are attached to junit xml report as test properties
+(`duration.setup.<fixture>`, `duration.call`, etc.) and written to DIR as
+flamegraph folded stacks (one `<module>.folded` file per test module), which
+can be rendered with `flamegraph.pl DIR/module.folded > module.svg`.
+"""
+
+
+def pytest_addoption(parser):
+    parser.addoption("--profile-phases", action="store", metavar="DIR",
+                     help="Measure time of fixtures and test phases and "
+                          "save flamegraph stacks to DIR")
+
+
+class PhaseProfiler(object):
+    """Collect nested timings of sections for each test"""
+
+    def __init__(self):
+        self.item = None
+        self.records = OrderedDict()
+        self._stack = []
+
+    def start(self, name):
+        self._stack.append((name, time.time(), self.item))
+
+    def stop(self, name):
+        if name not in [x[0] for x in self._stack]:
+            return
+        while self._stack:
+            stack_name, started_at, item = self._stack[-1]
+            path = tuple(x[0] for x in self._stack)
+            self._stack.pop()
+            if item is not None:
+                self.records.setdefault(item, []).append(
+                    (path, time.time() - started_at))
+            if stack_name == name:
+                break
+
+    @contextmanager
+    def section(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def get_totals(self, item):
+        """Return dict with dot separated path as key and seconds"""
+        totals = OrderedDict()
+        for path, seconds in self.records.get(item, []):
+            key = '.'.join(path)
+            totals[key] = totals.get(key, 0) + seconds
+        return totals
+
+    def get_folded(self, item):
+        """Return stacks with self time in flamegraph folded format"""
+        totals = OrderedDict()
+        for path, seconds in self.records.get(item, []):
+            totals[path] = totals.get(path, 0) + seconds
+        children = {}
+        for path, seconds in totals.items():
+            parent = path[:-1]
+            children[parent] = children.get(parent, 0) + seconds
+        prefix = [get_module_name(item), item.name]
+        lines = []
+        for path, seconds in totals.items():
+            self_time = max(seconds - children.get(path, 0), 0)
+            stack = ';'.join(prefix + list(path))
+            lines.append('{0} {1}'.format(stack, int(self_time * 1000)))
+        return lines
+
+
+def get_module_name(item):
+    return item.nodeid.split('::')[0]
+
+
+def get_profiler(config):
+    return getattr(config, '_phase_profiler', None)
+
+
+@contextmanager
+def timed_phase(item, name):
+    """Measure time of code block as custom phase of item"""
+    profiler = get_profiler(item.config)
+    if profiler is None:
+        yield
+    else:
+        with profiler.section(name):
+            yield
+
+
+def pytest_configure(config):
+    if config.getoption("--profile-phases"):
+        config._phase_profiler = PhaseProfiler()
+
+
+def _runtest_phase(item, name):
+    profiler = get_profiler(item.config)
+    if profiler is None:
+        return None
+    profiler.item = item
+    return profiler.section(name)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_setup(item):
+    section = _runtest_phase(item, 'setup')
+    if section is None:
+        yield
+    else:
+        with section:
+            yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    section = _runtest_phase(item, 'call')
+    if section is None:
+        yield
+    else:
+        with section:
+            yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_teardown(item, nextitem):
+    section = _runtest_phase(item, 'teardown')
+    if section is None:
+        yield
+    else:
+        with section:
+            yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_fixture_setup(fixturedef, request):
+    profiler = get_profiler(request.config)
+    if profiler is None:
+        yield
+        return
+    name = fixturedef.argname
+    # Finalizers are called in reverse order, so fixture teardown will be
+    # placed between these two
+    fixturedef.addfinalizer(lambda: profiler.stop(name))
+    with profiler.section(name):
+        yield
+    fixturedef.addfinalizer(lambda: profiler.start(name))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    profiler = get_profiler(item.config)
+    if profiler is not None and call.when == 'teardown':
+        properties = [('duration.{}'.format(key), '{:.3f}'.format(value))
+                      for key, value in profiler.get_totals(item).items()]
+        if hasattr(item, 'user_properties'):
+            item.user_properties.extend(properties)
+        else:
+            xml = getattr(item.config, '_xml', None)
+            if xml is not None:
+                node_reporter = xml.node_reporter(item.nodeid)
+                for name, value in properties:
+                    node_reporter.add_property(name, value)
+    yield
+
+
+def pytest_sessionfinish(session):
+    profiler = get_profiler(session.config)
+    if profiler is None:
+        return
+    path = session.config.getoption("--profile-phases")
+    if not os.path.exists(path):
+        os.makedirs(path)
+    modules = OrderedDict()
+    for item in profiler.records:
+        modules.setdefault(get_module_name(item), []).append(item)
+    for module_name, items in modules.items():
+        file_name = re.sub(r'[^\w.-]', '_', module_name) + '.folded'
+        with open(os.path.join(path, file_name), 'w') as f:
+            for item in items:
+                for line in profiler.get_folded(item):
+                    f.write(line + '\n')
@@ -0,0 +1,146 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from collections import OrderedDict
+
+import pytest
+
+__doc__ = """This module reorders tests to minimize snapshot reverts.
+
+Enabled with `--minimize-reverts` option. Each test, which is not marked as
+`undestructive`, requires snapshot revert before next test. So:
+
+* modules without destructive tests run first;
+* in each module classes (and module level tests) without destructive
+  tests run first;
+* in each class undestructive tests run first, destructive tests are
+  grouped by used fixtures;
+* classes marked as `incremental` are never splitted or reordered inside.
+
+Modules and classes are never interleaved to keep their fixtures setup
+once (until revert, which sets them up again).
+Planned reverts count for collected and scheduled order and actual reverts
+count are printed in terminal summary.
+
+Each destructive test needs clean cluster, so reverts can't be batched:
+any order needs a revert after every destructive test except the last one.
+Reordering saves at most one revert (when the last collected test is
+undestructive), undestructive tests only share revert made before them.
+Main gain is fewer setups of class and module fixtures.
+"""
+
+
+def pytest_addoption(parser):
+    parser.addoption("--minimize-reverts", action="store_true",
+                     help="Reorder tests to minimize snapshot reverts")
+
+
+def is_destructive(item):
+    return 'undestructive' not in item.keywords
+
+
+def count_reverts(items):
+    """Return reverts count, required to run items in given order
+
+    It's count of destructive items, followed by any item.
+    """
+    reverts = 0
+    dirty = False
+    for item in items:
+        if dirty:
+            reverts += 1
+            dirty = False
+        if is_destructive(item):
+            dirty = True
+    return reverts
+
+
+def _split_to_units(items):
+    """Group items, which should run together in original order"""
+    units = OrderedDict()
+    for item in items:
+        if 'incremental' in item.keywords and item.cls is not None:
+            key = item.cls
+        else:
+            key = item
+        units.setdefault(key, []).append(item)
+    return list(units.values())
+
+
+def split_to_groups(items):
+    """Return groups of units of one class in scheduled order
+
+    First group contains all undestructive units, next ones contain
+    destructive units with the same fixtures.
+    """
+    undestructive = []
+    groups = OrderedDict()
+    for unit in _split_to_units(items):
+        if not any(map(is_destructive, unit)):
+            undestructive.append(unit)
+            continue
+        key = tuple(sorted(unit[0].fixturenames))
+        groups.setdefault(key, []).append(unit)
+    return ([undestructive] if undestructive else []) + list(groups.values())
+
+
+def split_to_classes(items):
+    """Return lists of items of each class (or module level tests)"""
+    classes = OrderedDict()
+    for item in items:
+        classes.setdefault(item.cls, []).append(item)
+    return list(classes.values())
+
+
+def _schedule_class(items):
+    return [item for group in split_to_groups(items)
+            for unit in group for item in unit]
+
+
+def _schedule_module(items):
+    classes = [_schedule_class(x) for x in split_to_classes(items)]
+    classes.sort(key=lambda x: any(map(is_destructive, x)))
+    return [x for cls_items in classes for x in cls_items]
+
+
+def schedule(items):
+    """Return items in order, which requires less snapshot reverts"""
+    modules = OrderedDict()
+    for item in items:
+        modules.setdefault(item.module, []).append(item)
+    modules = [_schedule_module(x) for x in modules.values()]
+    modules.sort(key=lambda x: any(map(is_destructive, x)))
+    return [x for module in modules for x in module]
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(session, config, items):
+    if not config.getoption("--minimize-reverts"):
+        return
+    naive = count_reverts(items)
+    items[:] = schedule(items)
+    config._reverts_plan = (naive, count_reverts(items))
+
+
+def pytest_terminal_summary(terminalreporter):
+    config = terminalreporter.config
+    plan = getattr(config, '_reverts_plan', None)
+    if plan is None:
+        return
+    actual = getattr(terminalreporter._session, 'reverts_count', 0)
+    terminalreporter.write_sep('-', 'snapshot reverts')
+    terminalreporter.write_line(
+        'planned in collected order: {0}, planned after scheduling: {1} '
+        '(saved {2}), actual: {3}'.format(plan[0], plan[1],
+                                          plan[0] - plan[1], actual))
@@ -24,36 +24,38 @@ def pytest_addoption(parser):
                      help="Check that all tests has uniq testrail_id marker")
 
 
-@pytest.hookimpl(tryfirst=True)
-def pytest_collection_modifyitems(session, config, items):
-    """Add marker to test name, if test marked with `testrail_id` marker
+def get_testrail_id(item):
+    """Return testrail id of test item or None if it is not marked
 
     If optional kwargs passed - test parameters should be a
     superset of this kwargs to mark be applied.
     Also kwargs can be passed as `params` argument.
     """
+    markers = item.get_marker('testrail_id') or []
+    for marker in markers:
+        params = marker.kwargs.get('params', marker.kwargs)
+        if len(params) > 0:
+            if not hasattr(item, 'callspec'):
+                raise Exception("testrail_id decorator with filter "
+                                "parameters requires parametrizing "
+                                "of test method")
+            params_in_callspec = all(param in item.callspec.params.items()
+                                     for param in params.items())
+            if not params_in_callspec:
+                continue
+        return marker.args[0]
+    return None
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection_modifyitems(session, config, items):
+    """Add marker to test name, if test marked with `testrail_id` marker"""
     ids = defaultdict(list)
     for item in items:
-        markers = item.get_marker('testrail_id') or []
-        suffix_string = ''
-        for marker in markers:
-            test_id = marker.args[0]
-            params = marker.kwargs.get('params', marker.kwargs)
-            if len(params) > 0:
-                if not hasattr(item, 'callspec'):
-                    raise Exception("testrail_id decorator with filter "
-                                    "parameters requires parametrizing "
-                                    "of test method")
-                params_in_callspec = all(param in item.callspec.params.items()
-                                         for param in params.items())
-                if not params_in_callspec:
-                    continue
-            suffix_string = '[({})]'.format(test_id)
-            ids[test_id].append(item)
-            break
-        else:
-            ids[None].append(item)
-        item.name += suffix_string
+        test_id = get_testrail_id(item)
+        ids[test_id].append(item)
+        if test_id is not None:
+            item.name += '[({})]'.format(test_id)
         if item.cls is not None and issubclass(item.cls, unittest.TestCase):
             setattr(item.cls, item.name, item.function)
 
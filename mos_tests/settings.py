@@ -42,6 +42,28 @@ WIN_SERVER_QCOW2 = 'windows_server_2012_r2_standard_eval_kvm_20140607.qcow2'
 
 CONSOLE_LOG_LEVEL = os.environ.get('LOG_LEVEL', logging.DEBUG)
 
+# Max age (in seconds) of cached Fuel nodes list
+NODES_INVENTORY_TTL = int(os.environ.get('NODES_INVENTORY_TTL', 60))
+
+# Max age (in seconds) of cached controllers HA roles, they are changed by
+# pacemaker resources ban/clear without cluster epoch change
+CLUSTER_ROLES_TTL = int(os.environ.get('CLUSTER_ROLES_TTL', 30))
+
+# Max allowed clock skew (in seconds) between Fuel master and slaves
+TIME_SYNC_MAX_SKEW = float(os.environ.get('TIME_SYNC_MAX_SKEW', 1))
+
+# File to store successful OSTF results for snapshots and time (in seconds)
+# while result is valid
+OSTF_CACHE_FILE = os.environ.get(
+    'OSTF_CACHE_FILE',
+    os.path.join(os.path.dirname(__file__), '../temp/ostf_cache.json'))
+OSTF_CACHE_TTL = int(os.environ.get('OSTF_CACHE_TTL', 6 * 60 * 60))
+
+# Run CLI clients commands in resident helper process on controller
+# (see mos_tests.functions.cli_helper) instead of new process for each call
+OS_CLI_PERSISTENT = os.environ.get('OS_CLI_PERSISTENT',
+                                   'false').lower() == 'true'
+
 # Openstack Apache proxy config file
 PROXY_CONFIG_FILE = '/etc/apache2/sites-enabled/25-apache_api_proxy.conf'
 